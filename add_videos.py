@@ -1,84 +1,195 @@
 import os
-from exa_py import Exa
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
-from generate_transcripts import add_videos_to_playlist
+from generate_transcripts import add_videos_to_playlist, iter_playlist_pages, get_playlist_item_video_id, PLAYLIST_ID
+from clients import lazy_client
+from llm_cache import ResponseCache, cache_dir
+from state import state
+from metrics import metrics
 
 load_dotenv()
 
 # Configure Exa
 exa_api_key = os.getenv("EXA_API_KEY")
-exa = Exa(api_key=exa_api_key)
 
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def add_videos(prompt="", num_results=10, include = None, exclude = None):
+processed_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts", "processed")
+unprocessed_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts", "unprocessed")
+
+# Discovery queries run at once, and extra query templates applied to every query, e.g. "{query} podcast,{query} explained"
+DISCOVERY_CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", 4))
+DISCOVERY_QUERY_EXPANSIONS = [template.strip() for template in os.getenv("DISCOVERY_QUERY_EXPANSIONS", "").split(",") if template.strip()]
+# Exa responses are cached per query and options, for this long
+EXA_CACHE_PATH = os.getenv("EXA_CACHE_PATH", os.path.join(cache_dir, "exa_cache.sqlite"))
+EXA_CACHE_MAX_AGE_DAYS = float(os.getenv("EXA_CACHE_MAX_AGE_DAYS", 1))
+EXA_CACHE_DISABLED = os.getenv("EXA_CACHE_DISABLED", "0") == "1"
+
+exa_cache = ResponseCache(EXA_CACHE_PATH, max_age_days=EXA_CACHE_MAX_AGE_DAYS, enabled=not EXA_CACHE_DISABLED)
+
+YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com", "www.youtube-nocookie.com"}
+# Path prefixes that are followed by the video ID, e.g. /shorts/<id>
+YOUTUBE_ID_PATHS = ("shorts", "embed", "live", "v", "e")
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+def create_exa_client():
+    """Creates the Exa client, importing the SDK only when discovery runs."""
+    from exa_py import Exa
+    return Exa(api_key=exa_api_key)
+
+
+get_exa = lazy_client("Exa client", create_exa_client)
+
+
+def add_videos(prompt="", num_results=10, include = None, exclude = None, queries=None):
     """
-    Searches for videos based on a given prompt and adds them to a playlist.
-    
+    Searches for videos based on one or more prompts and adds the new ones to a playlist.
+
+    Every query (plus its DISCOVERY_QUERY_EXPANSIONS) is searched concurrently, and the results
+    are merged by rank. Videos that are already in the playlist or known to the state index
+    or the transcript directories are dropped before anything is inserted.
+
     Args:
         prompt (str): The search query for finding videos. Defaults to an empty string.
-        num_results (int): The number of video results to retrieve. Defaults to 10.
+        num_results (int): The number of videos to add, and of results requested per query. Defaults to 10.
         include (list or None): List of keywords to include in the search. Defaults to None.
         exclude (list or None): List of keywords to exclude from the search. Defaults to None.
-    
+        queries (list or None): More search queries to run alongside prompt. Defaults to None.
+
     Returns:
         None: This function doesn't return any value, it performs actions and prints results.
     """
     try:
-        print(f"\n🔎 Finding videos with prompt: {prompt}\n")
-        results = find_videos(prompt=prompt, num_results=num_results, include=include, exclude=exclude)
-        all_video_ids = []
-        for i, result in enumerate(results, 1):
-            video_id = get_youtube_video_id(result.url)
-            print(f"\n🔎 Exa result {i}/{len(results)}: \n{result.title}\nVideo ID: {video_id}\n")
-            if video_id:
-                all_video_ids.append(video_id)
-        
-        add_videos_to_playlist(all_video_ids)
+        queries = expand_queries([prompt] + list(queries or []))
+        print(f"\n🔎 Finding videos with {len(queries)} queries: {'; '.join(queries)}\n")
+        with ThreadPoolExecutor(max_workers=max(1, min(DISCOVERY_CONCURRENCY, len(queries)))) as executor:
+            result_lists = list(executor.map(
+                lambda query: find_videos(prompt=query, num_results=num_results, include=include, exclude=exclude),
+                queries
+            ))
+
+        candidates = {}
+        # Interleave by rank, so every query's best hits come before any query's weaker ones
+        for rank in range(max((len(results) for results in result_lists), default=0)):
+            for results in result_lists:
+                if rank < len(results):
+                    video_id = get_youtube_video_id(results[rank]['url'])
+                    if video_id and video_id not in candidates:
+                        candidates[video_id] = results[rank]['title']
+
+        known = get_known_video_ids(candidates)
+        new_video_ids = [video_id for video_id in candidates if video_id not in known][:num_results]
+        for i, video_id in enumerate(new_video_ids, 1):
+            print(f"\n🔎 New video {i}/{len(new_video_ids)}: \n{candidates[video_id]}\nVideo ID: {video_id}\n")
+        print(f"📋 {len(candidates)} unique videos found, {len(known)} already known, adding {len(new_video_ids)}")
+
+        if new_video_ids:
+            add_videos_to_playlist(new_video_ids)
     except Exception as e:
         print(f"\n\n❌ Error adding videos: {str(e)}")
+        metrics.error('discover', e)
+
+
+def expand_queries(queries):
+    """Applies DISCOVERY_QUERY_EXPANSIONS to each query and drops empty and duplicate queries.
+
+    Args:
+        queries (list): The search queries.
+
+    Returns:
+        list: The queries followed by their expansions, in order, without duplicates.
+    """
+    expanded = []
+    for query in queries:
+        query = query.strip()
+        if query:
+            expanded += [query] + [template.format(query=query) for template in DISCOVERY_QUERY_EXPANSIONS]
+    return list(dict.fromkeys(expanded))
+
+
+def get_known_video_ids(video_ids):
+    """Returns the videos among video_ids that the pipeline already has.
+
+    A video is known if it is in the playlist, has a row in the state index, or has a JSON
+    file in the unprocessed or processed transcript directory (from before the state index).
+
+    Args:
+        video_ids (iterable): The video IDs to check.
+
+    Returns:
+        set: The known video IDs.
+    """
+    video_ids = set(video_ids)
+    known = set(state.get_many(video_ids))
+    for directory in (unprocessed_dir, processed_dir):
+        if os.path.isdir(directory):
+            known |= {os.path.splitext(name)[0] for name in os.listdir(directory) if name.endswith('.json')} & video_ids
+    # Unchanged playlist pages are answered with 304s, so this is cheap on repeated runs
+    for page in iter_playlist_pages(PLAYLIST_ID):
+        known |= {get_playlist_item_video_id(item) for item in page['items']} & video_ids
+    return known
 
 
 def find_videos(prompt="", num_results=10, include= None, exclude= None):
-    
+
     # Modify the prompt if it doesn't contain "videos" or "youtube"
     """
-    Searches for YouTube videos based on a given prompt.
-    
+    Searches for YouTube videos based on a given prompt, using the Exa response cache.
+
     Args:
         prompt (str): The search query for finding videos. If it doesn't contain "videos" or "youtube", it will be modified.
         num_results (int): The number of video results to return. Defaults to 10.
         include (str): Optional text to include in the search results.
         exclude (str): Optional text to exclude from the search results.
-    
+
     Returns:
-        list: A list of search results containing video information.
+        list: The search results, as dictionaries with 'url' and 'title' keys.
     """
     if "videos" not in prompt.lower() and "youtube" not in prompt.lower():
         prompt = f"Find youtube videos for: {prompt}"
-    
+
     print(f"Modified prompt: {prompt}")
-    result = exa.search_and_contents(
-    prompt,
-    type="neural",
-    use_autoprompt=True,
-    num_results=num_results,
-    include_text=[include] if include else None,
-    exclude_text=[exclude] if exclude else None,
-    )
-    
-    return result.results
+
+    def search():
+        with metrics.span("exa.search", num_results=num_results):
+            result = get_exa().search_and_contents(
+            prompt,
+            type="neural",
+            use_autoprompt=True,
+            num_results=num_results,
+            include_text=[include] if include else None,
+            exclude_text=[exclude] if exclude else None,
+            )
+        return json.dumps([{'url': hit.url, 'title': hit.title} for hit in result.results], ensure_ascii=False)
+
+    options = json.dumps({'type': 'neural', 'num_results': num_results, 'include': include, 'exclude': exclude}, sort_keys=True)
+    return json.loads(exa_cache.cached("exa:search_and_contents", 0, options, prompt, search))
 
 
 def get_youtube_video_id(url):
     """Extracts the YouTube video ID from a given URL.
-    
+
+    Handles watch URLs (youtube.com, m., music. and youtube-nocookie.com), youtu.be short links,
+    and /shorts/, /embed/, /live/ and /v/ paths.
+
     Args:
         url (str): The YouTube video URL to parse.
-    
+
     Returns:
         str or None: The extracted video ID if found, or None if not found.
     """
-    parsed_url = urlparse(url)
-    video_id = parse_qs(parsed_url.query).get('v')
-    return video_id[0] if video_id else None
\ No newline at end of file
+    parsed_url = urlparse(url if '//' in url else f"https://{url}")
+    host = (parsed_url.hostname or '').lower()
+    parts = [part for part in parsed_url.path.split('/') if part]
+    video_id = None
+    if host in ("youtu.be", "www.youtu.be"):
+        video_id = parts[0] if parts else None
+    elif host in YOUTUBE_HOSTS:
+        video_id = (parse_qs(parsed_url.query).get('v') or [None])[0]
+        if not video_id and len(parts) >= 2 and parts[0] in YOUTUBE_ID_PATHS:
+            video_id = parts[1]
+    return video_id if video_id and VIDEO_ID_PATTERN.match(video_id) else None
@@ -0,0 +1,614 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+BENCHMARK_PLAYLIST_ID = "PLbenchmark"
+WORDS = """the market crypto bitcoin rally podcast guest growth startup model data python code
+interview episode listeners token price chart launch product team strategy money risk""".split()
+
+
+class Recorder:
+    """Thread-safe call counts and latencies, keyed by endpoint name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = defaultdict(int)
+            self.latencies = defaultdict(list)
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.counts[name] += 1
+            self.latencies[name].append(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+
+class FakeHttpError(Exception):
+    """Mimics the HTTP errors (429s, 304 Not Modified) raised by the Google and Groq clients."""
+
+    def __init__(self, status_code=429):
+        super().__init__(f"HTTP {status_code}: injected by benchmark")
+        self.status_code = status_code
+        self.resp = mock.Mock(status=status_code)
+
+
+class Latency:
+    """Configurable delay and error injection for one fake service.
+
+    Args:
+        mean (float): Mean delay per call, in seconds. Actual delays are spread +/-50%.
+        error_rate (float): Probability that a call fails with a 429.
+    """
+
+    def __init__(self, mean=0.0, error_rate=0.0):
+        self.mean = mean
+        self.error_rate = error_rate
+
+    def apply(self):
+        if self.mean:
+            time.sleep(random.uniform(0.5, 1.5) * self.mean)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeHttpError(429)
+
+
+class FakeRequest:
+    """A stand-in for googleapiclient's HttpRequest."""
+
+    def __init__(self, youtube, name, handler, **kwargs):
+        self.youtube = youtube
+        self.name = name
+        self.handler = handler
+        self.kwargs = kwargs
+        self.headers = {}
+
+    def execute(self, **kwargs):
+        with self.youtube.recorder.timed(f"youtube.{self.name}"):
+            self.youtube.latency.apply()
+            return self.handler(**self.kwargs)
+
+
+class FakeBatch:
+    """A stand-in for googleapiclient's BatchHttpRequest: one round trip for many calls.
+
+    Each call in the batch can still fail on its own; its error goes to the callback.
+    """
+
+    def __init__(self, youtube, callback):
+        self.youtube = youtube
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        with self.youtube.recorder.timed("youtube.batch"):
+            self.youtube.latency.apply()
+        for request_id, request in self.requests:
+            self.youtube.recorder.record(f"youtube.{request.name}", 0.0)
+            try:
+                if self.youtube.latency.error_rate and random.random() < self.youtube.latency.error_rate:
+                    raise FakeHttpError(429)
+                response, exception = request.handler(**request.kwargs), None
+            except Exception as e:
+                response, exception = None, e
+            self.callback(request_id, response, exception)
+
+
+class FakeYouTube:
+    """An in-memory stand-in for the YouTube Data API v3 client.
+
+    Serves a synthetic playlist, video details and channels, and applies playlist inserts
+    and deletes, with the page size and response shapes of the real API.
+    """
+
+    def __init__(self, recorder, latency):
+        self.recorder = recorder
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.playlist = []
+        self.video_details = {}
+        self.next_item_id = 0
+
+    def add_video(self, video_id, channel_index):
+        channel_id = f"UCbench{channel_index:06d}"
+        self.video_details[video_id] = {
+            'kind': 'youtube#video',
+            'etag': f"etag-{video_id}",
+            'id': video_id,
+            'snippet': {
+                'publishedAt': '2024-01-01T00:00:00Z',
+                'channelId': channel_id,
+                'title': f"Benchmark video {video_id}",
+                'description': ' '.join(random.choices(WORDS, k=60)),
+                'thumbnails': {'high': {'url': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}},
+            },
+            'contentDetails': {'duration': 'PT12M30S'},
+            'statistics': {'viewCount': '1000', 'likeCount': '100', 'commentCount': '10'},
+        }
+
+    def add_to_playlist(self, video_id):
+        with self.lock:
+            self.next_item_id += 1
+            item = {
+                'kind': 'youtube#playlistItem',
+                'id': f"PLI{self.next_item_id:08d}",
+                'snippet': {'playlistId': BENCHMARK_PLAYLIST_ID, 'resourceId': {'kind': 'youtube#video', 'videoId': video_id}},
+                'contentDetails': {'videoId': video_id},
+            }
+            self.playlist.append(item)
+            return item
+
+    def playlistItems(self):
+        return FakePlaylistItems(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def videos(self):
+        return FakeListResource(self, "videos.list", self._video_items)
+
+    def channels(self):
+        return FakeListResource(self, "channels.list", self._channel_items)
+
+    def _video_items(self, id, **kwargs):
+        return {"items": [self.video_details[video_id] for video_id in id.split(",") if video_id in self.video_details]}
+
+    def _channel_items(self, id, **kwargs):
+        return {'items': [{'id': channel_id, 'snippet': {'title': f"Channel {channel_id[-6:]}"}} for channel_id in id.split(',')]}
+
+
+class FakeListResource:
+    def __init__(self, youtube, name, handler):
+        self.youtube = youtube
+        self.name = name
+        self.handler = handler
+
+    def list(self, **kwargs):
+        return FakeRequest(self.youtube, self.name, self.handler, **kwargs)
+
+
+class FakePlaylistItems:
+    def __init__(self, youtube):
+        self.youtube = youtube
+
+    def list(self, playlistId=None, maxResults=5, pageToken=None, **kwargs):
+        request = FakeRequest(self.youtube, "playlistItems.list", self._list, playlistId=playlistId,
+                              maxResults=maxResults, pageToken=pageToken)
+        request.kwargs['headers'] = request.headers
+        return request
+
+    def _list(self, playlistId, maxResults, pageToken, headers):
+        with self.youtube.lock:
+            start = int(pageToken or 0)
+            items = self.youtube.playlist[start:start + maxResults]
+            more = start + maxResults < len(self.youtube.playlist)
+            etag = f"etag-page-{hash((tuple(item['id'] for item in items), more)) & 0xffffffff:08x}"
+            if headers.get('If-None-Match') == etag:
+                raise FakeHttpError(304)
+            response = {'etag': etag, 'items': items}
+            if more:
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+
+    def list_next(self, request, response):
+        if 'nextPageToken' not in response:
+            return None
+        return self.list(playlistId=request.kwargs['playlistId'], maxResults=request.kwargs['maxResults'],
+                         pageToken=response['nextPageToken'])
+
+    def insert(self, part=None, body=None):
+        video_id = body['snippet']['resourceId']['videoId']
+        return FakeRequest(self.youtube, "playlistItems.insert", lambda: self.youtube.add_to_playlist(video_id))
+
+    def delete(self, id):
+        def delete_item():
+            with self.youtube.lock:
+                self.youtube.playlist = [item for item in self.youtube.playlist if item['id'] != id]
+        return FakeRequest(self.youtube, "playlistItems.delete", delete_item)
+
+
+class FakeTranscript:
+    """A stand-in for youtube_transcript_api's Transcript: one caption track of a video."""
+
+    def __init__(self, api, video_id, language_code, is_generated):
+        self.api = api
+        self.video_id = video_id
+        self.language_code = language_code
+        self.is_generated = is_generated
+        self.is_translatable = True
+        self.translation_languages = [{'language': 'English', 'language_code': 'en'}]
+
+    def translate(self, language_code):
+        return FakeTranscript(self.api, self.video_id, language_code, self.is_generated)
+
+    def fetch(self):
+        with self.api.recorder.timed("transcript.get"):
+            self.api.latency.apply()
+            rng = random.Random(self.api.content_key(self.video_id))
+            return [
+                {'text': ' '.join(rng.choices(WORDS, k=9)), 'start': i * 3.2, 'duration': 3.2}
+                for i in range(self.api.segments_per_video)
+            ]
+
+
+class FakeTranscriptApi:
+    """A stand-in for YouTubeTranscriptApi serving synthetic timestamped segments.
+
+    A disabled_rate share of videos (chosen by video ID, so the same ones on every run) has
+    captions disabled, another share only has a generated Spanish track, and a duplicate_rate
+    share are re-uploads sharing one of a few transcripts.
+    """
+
+    def __init__(self, recorder, latency, segments_per_video, disabled_rate=0.0, duplicate_rate=0.0):
+        self.recorder = recorder
+        self.latency = latency
+        self.segments_per_video = segments_per_video
+        self.disabled_rate = disabled_rate
+        self.duplicate_rate = duplicate_rate
+
+    def content_key(self, video_id):
+        rng = random.Random(f"duplicate-{video_id}")
+        return f"shared-{rng.randrange(5)}" if rng.random() < self.duplicate_rate else video_id
+
+    def list_transcripts(self, video_id, **kwargs):
+        with self.recorder.timed("transcript.list"):
+            self.latency.apply()
+            rng = random.Random(f"captions-{video_id}")
+            if rng.random() < self.disabled_rate:
+                from youtube_transcript_api import TranscriptsDisabled
+                raise TranscriptsDisabled(video_id)
+            if rng.random() < 0.1:
+                return [FakeTranscript(self, video_id, 'es', True)]
+            return [FakeTranscript(self, video_id, 'en', False), FakeTranscript(self, video_id, 'en', True)]
+
+    def get_transcript(self, video_id, languages=('en',), **kwargs):
+        return self.list_transcripts(video_id)[0].fetch()
+
+
+class FakeExa:
+    """A stand-in for the Exa client returning YouTube results in the URL forms Exa produces."""
+
+    URL_FORMS = ("https://www.youtube.com/watch?v={}", "https://youtu.be/{}", "https://www.youtube.com/shorts/{}")
+
+    def __init__(self, recorder, latency):
+        self.recorder = recorder
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.counter = 0
+
+    def search_and_contents(self, prompt, num_results=10, **kwargs):
+        with self.recorder.timed("exa.search_and_contents"):
+            self.latency.apply()
+            results = []
+            for _ in range(num_results):
+                with self.lock:
+                    self.counter += 1
+                    video_id = f"exa{self.counter:08d}"
+                url = self.URL_FORMS[self.counter % len(self.URL_FORMS)].format(video_id)
+                results.append(mock.Mock(url=url, title=f"Result {video_id}"))
+            return mock.Mock(results=results)
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    """Serves OpenAI-compatible chat completions at Groq's path, with injected latency and 429s.
+
+    Streamed requests get server-sent events: the first delta after 30% of the latency and
+    the rest spread over the remainder.
+    """
+
+    def do_GET(self):
+        # DSPy's Groq client lists the models when it is constructed
+        self._send(200, {'object': 'list', 'data': [
+            {'id': 'mixtral-8x7b-32768', 'object': 'model', 'created': 0, 'owned_by': 'benchmark'}
+        ]})
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        start = time.perf_counter()
+        latency = random.uniform(0.5, 1.5) * server.latency.mean if server.latency.mean else 0
+        time.sleep(latency * 0.3 if request.get('stream') else latency)
+        if server.latency.error_rate and random.random() < server.latency.error_rate:
+            server.recorder.record("groq.429", time.perf_counter() - start)
+            self._send(429, {'error': {'message': 'Rate limit reached (injected)', 'type': 'rate_limit'}},
+                       {'retry-after': '0.05'})
+            return
+        prompt = ' '.join(str(message.get('content', '')) for message in request.get('messages', []))
+        packed = re.findall(r"=== VIDEO (\d+) ===", prompt)
+        if packed:
+            # One delimited summary per packed video, as process_transcript asks for
+            content = '\n\n'.join(f"=== SUMMARY {number} ===\n{' '.join(random.choices(WORDS, k=server.response_words // len(packed) + 20))}\n=== END {number} ==="
+                                   for number in packed)
+        elif 'Summarization Prompt:' in prompt:
+            # Shape the answer so DSPy's ChainOfThought can parse its output field
+            content = "write a helpful prompt.\n\nSummarization Prompt: Summarize the key takeaways of this video."
+        else:
+            content = ' '.join(random.choices(WORDS, k=server.response_words))
+        if request.get('stream'):
+            self._send_stream(request, content, latency * 0.7)
+            server.recorder.record("groq.chat.completions", time.perf_counter() - start)
+            return
+        body = {
+            'id': 'chatcmpl-benchmark',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'benchmark'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                      'total_tokens': (len(prompt) + len(content)) // 4},
+        }
+        server.recorder.record("groq.chat.completions", time.perf_counter() - start)
+        self._send(200, body)
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, request, content, duration):
+        words = content.split(' ')
+        pieces = [' '.join(words[i:i + 5]) + ' ' for i in range(0, len(words), 5)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(duration / len(pieces))
+            chunk = {
+                'id': 'chatcmpl-benchmark',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': request.get('model', 'benchmark'),
+                'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        done = {
+            'id': 'chatcmpl-benchmark',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': request.get('model', 'benchmark'),
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+            'x_groq': {'usage': {'completion_tokens': len(content) // 4}},
+        }
+        self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_groq(recorder, latency, response_words=200):
+    """Starts the fake Groq server on a free local port.
+
+    Returns:
+        ThreadingHTTPServer: The running server; its base URL is http://127.0.0.1:<server.server_port>.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGroqHandler)
+    server.daemon_threads = True
+    server.recorder = recorder
+    server.latency = latency
+    server.response_words = response_words
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def import_pipeline(youtube):
+    """Imports the pipeline modules with the YouTube client replaced by a fake.
+
+    Clients are created lazily, so swapping the getter before the first call means no real
+    token.pickle is read and no OAuth flow runs.
+
+    Args:
+        youtube (FakeYouTube): The client generate_transcripts should use.
+
+    Returns:
+        tuple: The generate_transcripts, process_transcript and add_videos modules.
+    """
+    import generate_transcripts
+    import process_transcript
+    import add_videos
+    # DSPy is imported lazily; load it now so its import time isn't billed to the process stage
+    import summarizer  # noqa: F401
+    from quota import QuotaTrackedYouTube, youtube_quota
+    tracked = QuotaTrackedYouTube(youtube, youtube_quota)
+    generate_transcripts.get_youtube = lambda: tracked
+    return generate_transcripts, process_transcript, add_videos
+
+
+def timed_wrapper(recorder, name, fn):
+    """Wraps fn so every call's duration is recorded under name."""
+    def wrapper(*args, **kwargs):
+        with recorder.timed(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def packed_timed_wrapper(recorder, name, fn):
+    """Wraps a function rendering several videos at once, recording an equal share of its
+    duration under name for each video in its first argument."""
+    def wrapper(filenames, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(filenames, *args, **kwargs)
+        finally:
+            share = (time.perf_counter() - start) / max(1, len(filenames))
+            for _ in filenames:
+                recorder.record(name, share)
+    return wrapper
+
+
+def run_stage(recorder, name, items, fn, item_metric):
+    """Runs one pipeline stage and collects its throughput, latency, call and memory figures.
+
+    Args:
+        recorder (Recorder): The shared recorder, reset before the stage.
+        name (str): The stage name.
+        items (int): The number of videos the stage handles.
+        fn (callable): Runs the stage.
+        item_metric (str): The recorder key holding per-video latencies.
+
+    Returns:
+        dict: The stage's results.
+    """
+    # Imported here, after main() has pointed METRICS_DIR at the scratch dir
+    from metrics import percentile
+    recorder.reset()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    # Report memory the stage itself allocated, not what the imported SDKs already hold
+    latencies = recorder.latencies.get(item_metric, [])
+    return {
+        'stage': name,
+        'videos': items,
+        'seconds': round(elapsed, 3),
+        'videos_per_second': round(items / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'api_calls': {key: count for key, count in sorted(recorder.counts.items()) if key != 'video'},
+        'peak_memory_mb': round((peak - baseline) / 1024 / 1024, 1),
+    }
+
+
+def print_results(results):
+    """Prints benchmark results as a table."""
+    header = f"{'size':>6} {'stage':<12} {'sec':>8} {'videos/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8}  api calls"
+    print(f"\n{header}\n{'-' * len(header)}")
+    for row in results:
+        calls = ', '.join(f"{key}={count}" for key, count in row['api_calls'].items())
+        print(f"{row['size']:>6} {row['stage']:<12} {row['seconds']:>8.2f} {row['videos_per_second']:>9.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['peak_memory_mb']:>8.1f}  {calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages offline against fake YouTube, transcript, Exa and Groq services")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10, 100, 1000], help="Playlist sizes to benchmark (default: 10 100 1000)")
+    parser.add_argument("--stages", nargs='+', default=["discover", "transcripts", "process"], choices=["discover", "transcripts", "process"])
+    parser.add_argument("--youtube-latency", type=float, default=0.05, help="Mean YouTube Data API latency, seconds")
+    parser.add_argument("--transcript-latency", type=float, default=0.2, help="Mean transcript fetch latency, seconds")
+    parser.add_argument("--exa-latency", type=float, default=0.5, help="Mean Exa search latency, seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Mean fake Groq completion latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 429 on every fake service")
+    parser.add_argument("--youtube-quota", type=int, default=10 ** 9, help="Daily YouTube API quota the run may spend; lower it to see deferral")
+    parser.add_argument("--disabled-rate", type=float, default=0.0, help="Share of videos with captions disabled")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Share of videos that are re-uploads of a few shared transcripts")
+    parser.add_argument("--segments", type=int, default=300, help="Transcript segments per video")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent transcript fetches")
+    parser.add_argument("--transcript-rate", type=float, default=0, help="Transcript requests per second, 0 for unlimited")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Concurrent transcript summaries")
+    parser.add_argument("--stream", action="store_true", help="Stream completions (LLM_STREAM=1) and report time to first token")
+    parser.add_argument("--summary-mode", choices=["fused", "channel", "video"], default="fused", help="SUMMARY_MODE: one call per summary, a prompt per channel, or a prompt per video")
+    parser.add_argument("--llm-rate", type=float, default=0, help="Groq requests per second, 0 for unlimited")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="zentube-bench-")
+    recorder = Recorder()
+    groq_server = start_fake_groq(recorder, Latency(args.llm_latency, args.error_rate))
+
+    # Everything the pipeline reads from the environment at import time points at the fakes and the scratch dir
+    os.environ.update({
+        'YOUTUBE_PLAYLIST_ID': BENCHMARK_PLAYLIST_ID,
+        'EXA_API_KEY': 'benchmark',
+        'GROQ_API_KEY': 'benchmark',
+        'GROQ_BASE_URL': f"http://127.0.0.1:{groq_server.server_port}",
+        'GROQ_RATE_LIMIT': str(args.llm_rate),
+        'LLM_BACKOFF_BASE': '0.05',
+        'LLM_STREAM': '1' if args.stream else '0',
+        'SUMMARY_MODE': args.summary_mode,
+        'SUMMARIZER_PATH': os.path.join(workdir, 'summarizer.json'),
+        'LLM_CACHE_DISABLED': '1',
+        'EXA_CACHE_DISABLED': '1',
+        'OUTPUT_DIR': os.path.join(workdir, 'notes'),
+        'STATE_DB_PATH': os.path.join(workdir, 'state.sqlite'),
+        'DEDUP_DB_PATH': os.path.join(workdir, 'dedup.sqlite'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'YOUTUBE_DAILY_QUOTA': str(args.youtube_quota),
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    youtube = FakeYouTube(recorder, Latency(args.youtube_latency, args.error_rate))
+    tracemalloc.start()
+    generate_transcripts, process_transcript, add_videos = import_pipeline(youtube)
+    generate_transcripts.YouTubeTranscriptApi = FakeTranscriptApi(recorder, Latency(args.transcript_latency, args.error_rate), args.segments, args.disabled_rate, args.duplicate_rate)
+    exa = FakeExa(recorder, Latency(args.exa_latency, args.error_rate))
+    add_videos.get_exa = lambda: exa
+    generate_transcripts.save_playlist_item = timed_wrapper(recorder, "video", generate_transcripts.save_playlist_item)
+    process_transcript.render_transcript_file = timed_wrapper(recorder, "video", process_transcript.render_transcript_file)
+    process_transcript.render_packed_files = packed_timed_wrapper(recorder, "video", process_transcript.render_packed_files)
+
+    results = []
+    for size in args.sizes:
+        size_dir = os.path.join(workdir, f"size-{size}")
+        for directory in ("unprocessed", "processed", "notes"):
+            os.makedirs(os.path.join(size_dir, directory), exist_ok=True)
+        generate_transcripts.unprocessed_dir = process_transcript.unprocessed_dir = os.path.join(size_dir, "unprocessed")
+        process_transcript.processed_dir = os.path.join(size_dir, "processed")
+        process_transcript.output_dir = os.path.join(size_dir, "notes")
+
+        youtube.playlist = []
+        start_counter = exa.counter
+        if "discover" in args.stages:
+            results.append(run_stage(recorder, "discover", size, lambda: add_videos.add_videos(prompt="benchmark videos", num_results=size), "exa.search_and_contents"))
+        else:
+            for i in range(size):
+                youtube.add_to_playlist(f"exa{start_counter + i + 1:08d}")
+            exa.counter += size
+        for i, item in enumerate(youtube.playlist):
+            youtube.add_video(item['contentDetails']['videoId'], i % max(1, size // 5))
+
+        if "transcripts" in args.stages:
+            results.append(run_stage(recorder, "transcripts", size, lambda: generate_transcripts.generate_transcripts(workers=args.workers, rate_limit=args.transcript_rate), "video"))
+        if "process" in args.stages:
+            processed = len([name for name in os.listdir(generate_transcripts.unprocessed_dir) if name.endswith(".json")])
+            results.append(run_stage(recorder, "process", processed, lambda: process_transcript.process_all_transcripts(concurrency=args.llm_concurrency), "video"))
+        for row in results:
+            row.setdefault('size', size)
+
+    groq_server.shutdown()
+    print_results(results)
+    from quota import print_quota_report, youtube_quota
+    print_quota_report(youtube_quota)
+    from metrics import metrics
+    print(metrics.summary_table())
+    print(f"\nTrace written to {metrics.trace_path}, metrics to {metrics.close()}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
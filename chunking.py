@@ -0,0 +1,168 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Rough token estimate for English text; good enough to stay well inside the context window
+CHARS_PER_TOKEN = 4
+
+# Context window of mixtral-8x7b-32768, and the share of it a single chunk may use.
+# The rest is left for the instructions and the model's answer.
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", 32768))
+MAX_CHUNK_SHARE = 0.75
+# Chunk (and reduce input) budget, clamped so a chunk always fits the context window
+CHUNK_TOKENS = min(int(os.getenv("SUMMARY_CHUNK_TOKENS", 6000)), int(MODEL_CONTEXT_TOKENS * MAX_CHUNK_SHARE))
+# Number of chunks summarized at once for a single transcript
+CHUNK_CONCURRENCY = int(os.getenv("SUMMARY_CHUNK_CONCURRENCY", 4))
+
+
+def estimate_tokens(text):
+    """Estimates the number of tokens in a piece of text.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The approximate token count.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_timestamp(seconds):
+    """Formats a number of seconds as H:MM:SS (or M:SS under an hour).
+
+    Args:
+        seconds (float): The offset into the video, in seconds.
+
+    Returns:
+        str: The formatted timestamp.
+    """
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def _split_words(text, max_tokens):
+    words = text.split()
+    pieces, current, current_tokens = [], [], 0
+    for word in words:
+        word_tokens = estimate_tokens(word + ' ')
+        if current and current_tokens + word_tokens > max_tokens:
+            pieces.append(' '.join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+
+def chunk_segments(segments, max_tokens=CHUNK_TOKENS):
+    """Groups consecutive transcript segments into chunks of at most max_tokens.
+
+    Chunks are cut on segment boundaries so each one starts at a known timestamp. A single
+    segment larger than max_tokens is split on word boundaries.
+
+    Args:
+        segments (list): Dictionaries with 'text' and 'start' keys, as returned by YouTubeTranscriptApi.
+        max_tokens (int, optional): The token budget per chunk. Defaults to CHUNK_TOKENS.
+
+    Returns:
+        list: Dictionaries with 'start' (seconds) and 'text' keys.
+    """
+    chunks = []
+    current, current_tokens, current_start = [], 0, 0.0
+    for segment in segments:
+        text = segment['text'].strip()
+        if not text:
+            continue
+        tokens = estimate_tokens(text + ' ')
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append({'start': current_start, 'text': ' '.join(current)})
+            current, current_tokens = [], 0
+        if not current:
+            current_start = float(segment.get('start', 0))
+        if tokens > max_tokens:
+            for piece in _split_words(text, max_tokens):
+                chunks.append({'start': current_start, 'text': piece})
+            continue
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append({'start': current_start, 'text': ' '.join(current)})
+    return chunks
+
+
+def chunk_transcript(transcript, segments=None, max_tokens=CHUNK_TOKENS):
+    """Splits a transcript into token-bounded chunks, using segment timestamps when available.
+
+    Args:
+        transcript (str): The full transcript text.
+        segments (list, optional): Timestamped segments. If None, the text is split on word boundaries
+            and chunks have no start time.
+        max_tokens (int, optional): The token budget per chunk. Defaults to CHUNK_TOKENS.
+
+    Returns:
+        list: Dictionaries with 'start' (seconds, or None) and 'text' keys.
+    """
+    if segments:
+        return chunk_segments(segments, max_tokens)
+    return [{'start': None, 'text': piece} for piece in _split_words(transcript, max_tokens)]
+
+
+def group_by_budget(texts, max_tokens):
+    """Groups consecutive texts so each group's combined size stays within max_tokens.
+
+    Every group holds at least two texts (when two remain), so repeated grouping always converges.
+
+    Args:
+        texts (list): The texts to group, in order.
+        max_tokens (int): The token budget per group.
+
+    Returns:
+        list: A list of lists of texts.
+    """
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
+
+
+def map_reduce(chunks, map_prompt, reduce_prompt, llm, reduce_tokens=CHUNK_TOKENS, concurrency=CHUNK_CONCURRENCY, final_llm=None):
+    """Summarizes chunks in parallel, then merges the partial results hierarchically.
+
+    Each chunk is summarized independently (map). While the partial summaries together exceed
+    reduce_tokens, they are merged in budget-sized groups, in parallel (intermediate reduce);
+    the remaining summaries are then merged in one final call.
+
+    Args:
+        chunks (list): Chunks from chunk_transcript.
+        map_prompt (callable): Builds the map prompt from (chunk, index, total), index starting at 1.
+        reduce_prompt (callable): Builds a reduce prompt from (partial_summaries, final).
+        llm (callable): Sends a prompt to the model and returns its response.
+        reduce_tokens (int, optional): Token budget for the inputs of one reduce call. Defaults to CHUNK_TOKENS.
+        concurrency (int, optional): Maximum number of calls in flight. Defaults to CHUNK_CONCURRENCY.
+        final_llm (callable, optional): Used instead of llm for the final reduce call, e.g. to
+            stream it. Defaults to llm.
+
+    Returns:
+        str: The merged result of the final reduce call.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        total = len(chunks)
+        parts = list(executor.map(llm, [map_prompt(chunk, i, total) for i, chunk in enumerate(chunks, 1)]))
+        while len(parts) > 1 and estimate_tokens('\n\n'.join(parts)) > reduce_tokens:
+            groups = group_by_budget(parts, reduce_tokens)
+            parts = list(executor.map(llm, [reduce_prompt(group, False) for group in groups]))
+    return (final_llm or llm)(reduce_prompt(parts, True))
@@ -0,0 +1,35 @@
+import threading
+import time
+
+# (label, seconds) for every client created in this process, for --startup-profile
+init_timings = []
+
+
+def lazy_client(label, factory):
+    """Wraps a client factory so the client is created on first use and then shared process-wide.
+
+    Creation is guarded by a lock, so concurrent first calls from worker threads build the
+    client once. The time it took is appended to init_timings.
+
+    Args:
+        label (str): A name for the client, used in the startup profile.
+        factory (callable): A zero-argument function that builds the client.
+
+    Returns:
+        callable: A zero-argument getter returning the shared client.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    def get_client():
+        if not instance:
+            with lock:
+                if not instance:
+                    start = time.perf_counter()
+                    instance.append(factory())
+                    init_timings.append((label, time.perf_counter() - start))
+        return instance[0]
+
+    get_client.__name__ = f"get_{label.lower().replace(' ', '_')}"
+    get_client.__doc__ = f"Returns the process-wide {label}, creating it on first use."
+    return get_client
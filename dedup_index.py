@@ -0,0 +1,306 @@
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH", os.path.join(base_dir, "experiments", "youtube", "transcripts", "dedup.sqlite"))
+# Estimated Jaccard similarity of transcript shingles above which a video counts as a near-duplicate
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.7))
+# Estimated share of a transcript's shingles found in a longer one above which it counts as a
+# clip of it. Clips score low on similarity (a 5 minute clip of an hour-long video is ~0.08), so
+# they are matched on containment instead.
+DEDUP_CLIP_THRESHOLD = float(os.getenv("DEDUP_CLIP_THRESHOLD", 0.5))
+# Transcripts shorter than this many words are never matched, they share too much boilerplate
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", 200))
+DEDUP_DISABLED = os.getenv("DEDUP_DISABLED", "0") == "1"
+
+# Words per shingle
+SHINGLE_WORDS = 5
+# A video is only matched as a clip of one with at least this many times its shingles; closer
+# sizes are near-duplicates if anything
+CLIP_MIN_RATIO = 2
+# Signature values two videos must share before a clip match is considered; with a much longer
+# video, a single shared phrase would already estimate a high containment
+CLIP_MIN_MATCHES = 2
+# MinHash signature length, split into LSH bands of BAND_ROWS values: two transcripts share a
+# band bucket with probability 1 - (1 - s^BAND_ROWS)^(NUM_HASHES / BAND_ROWS) at similarity s,
+# so pairs above ~0.5 are almost always found and pairs below ~0.3 rarely compared
+NUM_HASHES = 64
+BAND_ROWS = 4
+# Hash permutations are (a * x + b) mod a Mersenne prime, over 32-bit shingle hashes
+MERSENNE_PRIME = (1 << 31) - 1
+_rng = random.Random(1)
+HASH_PARAMS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_HASHES)]
+
+WORD_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def shingle_hashes(text, size=SHINGLE_WORDS):
+    """Hashes the overlapping word shingles of a transcript.
+
+    Args:
+        text (str): The transcript.
+        size (int, optional): Words per shingle. Defaults to SHINGLE_WORDS.
+
+    Returns:
+        set: 32-bit hashes of the distinct shingles; empty if the text is too short.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < DEDUP_MIN_WORDS:
+        return set()
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+def minhash(hashes):
+    """Computes the MinHash signature of a set of shingle hashes.
+
+    Args:
+        hashes (set): Hashes from shingle_hashes (must not be empty).
+
+    Returns:
+        tuple: NUM_HASHES ints, the minimum of each hash permutation over the set.
+    """
+    if np is not None:
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        return tuple(int(((a * values + b) % MERSENNE_PRIME).min()) for a, b in HASH_PARAMS)
+    return tuple(min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in HASH_PARAMS)
+
+
+def similarity(signature, other):
+    """Estimates the Jaccard similarity of two transcripts from their MinHash signatures."""
+    return sum(x == y for x, y in zip(signature, other)) / len(signature)
+
+
+def containment(signature, size, other, other_size):
+    """Estimates the share of a transcript's shingles that are also in another transcript.
+
+    With Jaccard similarity J, the shingle sets A and B share J * (|A| + |B|) / (1 + J)
+    shingles, which is divided by |A|. The estimate is coarse when B is many times larger
+    than A, as J, and so the number of matching signature values, is then small.
+
+    Args:
+        signature (tuple): The MinHash signature of the transcript.
+        size (int): Its number of distinct shingles.
+        other (tuple): The MinHash signature of the other transcript.
+        other_size (int): Its number of distinct shingles.
+
+    Returns:
+        float: The estimated containment, between 0 and 1.
+    """
+    jaccard = similarity(signature, other)
+    return min(1.0, jaccard * (size + other_size) / ((1 + jaccard) * size))
+
+
+def band_buckets(signature):
+    """Returns the LSH bucket of each band of a signature, as (band, bucket) tuples."""
+    return [
+        (band, zlib.crc32(struct.pack(f"<{BAND_ROWS}I", *signature[start:start + BAND_ROWS])))
+        for band, start in enumerate(range(0, len(signature), BAND_ROWS))
+    ]
+
+
+class DuplicateIndex:
+    """A persistent, thread-safe MinHash/LSH index of transcripts, for spotting re-uploads.
+
+    Every transcript added gets a MinHash signature over its word shingles, stored with its
+    LSH band buckets and its number of shingles. Videos sharing a bucket are compared by
+    signature, and ones at least threshold similar are near-duplicates. A clip shares too
+    little of a long video's shingles to land in its buckets, so every video at least
+    CLIP_MIN_RATIO times longer is also checked for containing clip_threshold of it. The notes
+    written for a video (per kind, e.g. "summary" or "roast") are stored too, so a
+    near-duplicate or clip can reuse them instead of being sent to the LLM again.
+
+    Args:
+        path (str): Path of the SQLite database file.
+        threshold (float): The estimated similarity at which videos count as near-duplicates.
+        clip_threshold (float): The estimated containment at which a video counts as a clip
+            of a longer one.
+        enabled (bool): Set to False to never report duplicates.
+    """
+
+    def __init__(self, path, threshold=DEDUP_THRESHOLD, clip_threshold=DEDUP_CLIP_THRESHOLD, enabled=not DEDUP_DISABLED):
+        self.path = path
+        self.threshold = threshold
+        self.clip_threshold = clip_threshold
+        self.enabled = enabled
+        self.reused = 0
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    video_id TEXT PRIMARY KEY,
+                    signature BLOB NOT NULL,
+                    shingles INTEGER,
+                    title TEXT,
+                    video_url TEXT,
+                    duplicate_of TEXT,
+                    similarity REAL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS buckets (
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    video_id TEXT NOT NULL,
+                    PRIMARY KEY (band, bucket, video_id)
+                );
+                CREATE TABLE IF NOT EXISTS notes (
+                    video_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, kind)
+                );
+            """)
+            # Databases created by older versions lack the shingle counts; their videos are
+            # only matched as near-duplicates
+            existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(fingerprints)")}
+            if 'shingles' not in existing:
+                self.conn.execute("ALTER TABLE fingerprints ADD COLUMN shingles INTEGER")
+            self.conn.commit()
+        return self.conn
+
+    def _signature(self, conn, video_id):
+        row = conn.execute("SELECT signature FROM fingerprints WHERE video_id = ?", (video_id,)).fetchone()
+        return struct.unpack(f"<{NUM_HASHES}I", row['signature']) if row else None
+
+    def add(self, video_id, transcript, title='', video_url=''):
+        """Fingerprints a transcript, unless it already is.
+
+        Args:
+            video_id (str): The unique identifier of the YouTube video.
+            transcript (str): The full transcript text.
+            title (str, optional): The video title, shown when a duplicate links back to it.
+            video_url (str, optional): The video URL, likewise.
+
+        Returns:
+            tuple or None: The MinHash signature, or None if the transcript is too short to match.
+        """
+        with self.lock:
+            signature = self._signature(self._connect(), video_id)
+        if signature is not None:
+            return signature
+        hashes = shingle_hashes(transcript)
+        if not hashes:
+            return None
+        signature = minhash(hashes)
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR IGNORE INTO fingerprints (video_id, signature, shingles, title, video_url, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, struct.pack(f"<{NUM_HASHES}I", *signature), len(hashes), title, video_url, time.time())
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO buckets (band, bucket, video_id) VALUES (?, ?, ?)",
+                [(band, bucket, video_id) for band, bucket in band_buckets(signature)]
+            )
+            conn.commit()
+        return signature
+
+    def find_duplicate(self, video_id, kind):
+        """Finds the most similar earlier video to an added one, or a longer video it is a clip of.
+
+        Args:
+            video_id (str): A video whose transcript was added.
+            kind (str): The kind of note wanted, e.g. "summary".
+
+        Returns:
+            dict or None: The match, with 'video_id', 'title', 'video_url', 'similarity',
+                'match' ("near-duplicate" or "clip"), 'score' (the similarity of a
+                near-duplicate, the containment of a clip) and 'body' (its note of this kind,
+                or None if it has none yet) keys. Matches with a note are preferred, then
+                near-duplicates. None if nothing is similar enough.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            conn = self._connect()
+            signature = self._signature(conn, video_id)
+            if signature is None:
+                return None
+            candidates = set()
+            for band, bucket in band_buckets(signature):
+                candidates.update(row['video_id'] for row in conn.execute(
+                    "SELECT video_id FROM buckets WHERE band = ? AND bucket = ? AND video_id != ?",
+                    (band, bucket, video_id)
+                ))
+            found = {}
+            for candidate in candidates:
+                score = similarity(signature, self._signature(conn, candidate))
+                if score >= self.threshold:
+                    found[candidate] = ('near-duplicate', score, score)
+            size = conn.execute("SELECT shingles FROM fingerprints WHERE video_id = ?", (video_id,)).fetchone()['shingles']
+            if size:
+                for row in conn.execute(
+                    "SELECT video_id, signature, shingles FROM fingerprints WHERE shingles >= ? AND video_id != ?",
+                    (size * CLIP_MIN_RATIO, video_id)
+                ):
+                    if row['video_id'] in found:
+                        continue
+                    other = struct.unpack(f"<{NUM_HASHES}I", row['signature'])
+                    if sum(x == y for x, y in zip(signature, other)) < CLIP_MIN_MATCHES:
+                        continue
+                    score = containment(signature, size, other, row['shingles'])
+                    if score >= self.clip_threshold:
+                        found[row['video_id']] = ('clip', similarity(signature, other), score)
+            matches = []
+            for candidate, (match, jaccard, score) in found.items():
+                row = conn.execute("SELECT title, video_url FROM fingerprints WHERE video_id = ?", (candidate,)).fetchone()
+                note = conn.execute("SELECT body FROM notes WHERE video_id = ? AND kind = ?", (candidate, kind)).fetchone()
+                matches.append({
+                    'video_id': candidate,
+                    'title': row['title'],
+                    'video_url': row['video_url'],
+                    'similarity': jaccard,
+                    'match': match,
+                    'score': score,
+                    'body': note['body'] if note else None,
+                })
+        return max(matches, key=lambda match: (match['body'] is not None, match['match'] == 'near-duplicate', match['score']), default=None)
+
+    def link(self, video_id, duplicate_of, score):
+        """Records that a video is a near-duplicate or clip of another, whose note it reused."""
+        with self.lock:
+            conn = self._connect()
+            conn.execute("UPDATE fingerprints SET duplicate_of = ?, similarity = ? WHERE video_id = ?", (duplicate_of, score, video_id))
+            conn.commit()
+            self.reused += 1
+
+    def record_note(self, video_id, kind, body):
+        """Stores the LLM-written part of a video's note, for near-duplicates and clips to reuse.
+
+        Args:
+            video_id (str): The unique identifier of the YouTube video.
+            kind (str): The kind of note, e.g. "summary" or "roast".
+            body (str): The generated content.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO notes (video_id, kind, body, created_at) VALUES (?, ?, ?, ?)",
+                (video_id, kind, body, time.time())
+            )
+            conn.commit()
+
+
+dedup_index = DuplicateIndex(DEDUP_DB_PATH)
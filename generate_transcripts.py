@@ -1,19 +1,27 @@
 import os
-import json
-from googleapiclient.discovery import build
 from youtube_transcript_api import YouTubeTranscriptApi
 from dotenv import load_dotenv
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 import pickle
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+from rate_limit import TokenBucket
+from transcript_store import save_video_data
+from state import state, retry_due, TRANSCRIPT_FETCHED, TRANSCRIPT_UNAVAILABLE, TRANSCRIPT_SKIPPED
+from clients import lazy_client
+from playlist_mutations import PlaylistMutationQueue, summarize_results, http_status
+from quota import QuotaTrackedYouTube, youtube_quota
+from metrics import metrics
 
 # Load environment variables from .env file
 load_dotenv()
 # You'll need to set these environment variables
 API_KEY = os.environ.get('YOUTUBE_API_KEY')
 PLAYLIST_ID = os.environ.get('YOUTUBE_PLAYLIST_ID')
+# Concurrent transcript fetching: worker threads and max transcript requests per second
+TRANSCRIPT_WORKERS = int(os.environ.get('TRANSCRIPT_WORKERS', 8))
+TRANSCRIPT_RATE_LIMIT = float(os.environ.get('TRANSCRIPT_RATE_LIMIT', 4))
+# Preferred caption languages, most preferred first; other tracks are translated to the first one
+TRANSCRIPT_LANGUAGES = [code.strip() for code in os.environ.get('TRANSCRIPT_LANGUAGES', 'en').split(',') if code.strip()] or ['en']
 
 base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -21,8 +29,31 @@ unprocessed_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts"
 
 SCOPES = ['https://www.googleapis.com/auth/youtube']
 
+# videos().list and channels().list accept at most 50 comma-separated IDs per call
+MAX_IDS_PER_REQUEST = 50
+
+# Transcript errors by exception class name: (failure class, permanent, first retry delay in seconds).
+# Permanent failures are never retried; the others back off exponentially from their delay
+# (None means the state index's RETRY_BASE). Names cover several youtube_transcript_api versions.
+TRANSCRIPT_FAILURES = {
+    'TranscriptsDisabled': ('disabled', True, None),
+    'VideoUnavailable': ('video_unavailable', True, None),
+    'InvalidVideoId': ('invalid_video_id', True, None),
+    'AgeRestricted': ('age_restricted', True, None),
+    'NoCaptionTracks': ('no_captions_yet', False, None),
+    'NoTranscriptAvailable': ('no_captions_yet', False, None),
+    'NoTranscriptFound': ('no_captions_yet', False, None),
+    'TooManyRequests': ('rate_limited', False, 300),
+    'RequestBlocked': ('rate_limited', False, 300),
+    'IpBlocked': ('rate_limited', False, 300),
+    'YouTubeRequestFailed': ('request_failed', False, 600),
+}
+
+
+class NoCaptionTracks(Exception):
+    """Raised when a video has no caption tracks (yet): captions often appear after upload."""
+
 def get_authenticated_service():
-    ```
     """Authenticates and builds a YouTube API service object.
     
     This function checks for existing credentials, refreshes them if expired,
@@ -35,7 +66,11 @@ def get_authenticated_service():
     Returns:
         googleapiclient.discovery.Resource: An authenticated YouTube API service object.
     """
-    ```
+    # The Google client libraries are only imported by the stages that talk to YouTube
+    from googleapiclient.discovery import build
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     creds = None
     if os.path.exists('token.pickle'):
         with open('token.pickle', 'rb') as token:
@@ -54,7 +89,53 @@ def get_authenticated_service():
     
     return build('youtube', 'v3', credentials=creds)
 
-youtube = get_authenticated_service()
+def create_youtube_client():
+    """Builds the authenticated YouTube client, with every call accounted against the daily quota."""
+    return QuotaTrackedYouTube(get_authenticated_service(), youtube_quota)
+
+# Authenticates on first use, so commands that never call the YouTube API don't pay for it
+get_youtube = lazy_client("YouTube client", create_youtube_client)
+
+def iter_playlist_pages(playlist_id):
+    """Yields the pages of a YouTube playlist as they are fetched.
+    
+    Every page's ETag and items are kept in the state index. When a page was seen before, it is
+    requested with If-None-Match; if it hasn't changed the API answers 304 without a body and
+    the stored items are yielded instead.
+    
+    Args:
+        playlist_id (str): The ID of the YouTube playlist to fetch items from.
+    
+    Yields:
+        dict: A page, with 'items' (list of playlist items), 'etag' (str) and 'not_modified'
+            (bool, True if the page was served from the state index) keys.
+    """
+    page_token = ''
+    while True:
+        cached = state.get_playlist_page(playlist_id, page_token)
+        request = get_youtube().playlistItems().list(
+            part="snippet,contentDetails",
+            playlistId=playlist_id,
+            maxResults=50,
+            pageToken=page_token or None
+        )
+        if cached and cached['etag']:
+            request.headers['If-None-Match'] = cached['etag']
+        try:
+            response = request.execute()
+        except Exception as e:
+            if not cached or http_status(e) != 304:
+                raise
+            page = {'items': cached['items'], 'etag': cached['etag'], 'not_modified': True}
+            next_page_token = cached['next_page_token']
+        else:
+            next_page_token = response.get('nextPageToken')
+            state.record_playlist_page(playlist_id, page_token, response.get('etag'), response['items'], next_page_token)
+            page = {'items': response['items'], 'etag': response.get('etag'), 'not_modified': False}
+        yield page
+        if not next_page_token:
+            break
+        page_token = next_page_token
 
 def get_playlist_items(playlist_id):
     """Retrieves all items from a YouTube playlist.
@@ -65,18 +146,7 @@ def get_playlist_items(playlist_id):
     Returns:
         list: A list of dictionaries, where each dictionary contains information about a playlist item, including snippet and content details.
     """
-    request = youtube.playlistItems().list(
-        part="snippet,contentDetails",
-        playlistId=playlist_id,
-        maxResults=50
-    )
-    response = request.execute()
-    playlist_items = []
-    while request is not None:
-        response = request.execute()
-        playlist_items.extend(response["items"])
-        request = youtube.playlistItems().list_next(request, response)
-    return playlist_items
+    return [item for page in iter_playlist_pages(playlist_id) for item in page['items']]
 
 def get_video_details(video_id):
     """Retrieves detailed information about a specific YouTube video.
@@ -87,29 +157,174 @@ def get_video_details(video_id):
     Returns:
         dict: A dictionary containing detailed information about the video, including snippet, content details, and statistics.
     """
-    request = youtube.videos().list(
+    request = get_youtube().videos().list(
         part="snippet,contentDetails,statistics",
         id=video_id
     )
     response = request.execute()
     return response['items'][0]
 
-def get_transcript(video_id):
-    """Retrieves and concatenates the transcript of a YouTube video.
+def chunked(items, size):
+    """Splits a list into consecutive chunks of at most `size` elements.
+    
+    Args:
+        items (list): The list to split.
+        size (int): The maximum number of elements per chunk.
+    
+    Returns:
+        list: A list of lists, each containing at most `size` elements.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def get_videos_details(video_ids):
+    """Retrieves detailed information about many YouTube videos using batched requests.
+    
+    Duplicate IDs are fetched once, and IDs are sent in chunks of MAX_IDS_PER_REQUEST,
+    so N videos cost roughly N / 50 API calls instead of N.
+    
+    Args:
+        video_ids (list): The unique identifiers of the YouTube videos.
+    
+    Returns:
+        dict: A mapping of video ID to its details (snippet, content details, and statistics).
+            Videos that are private or deleted are missing from the mapping.
+    """
+    details = {}
+    for chunk in chunked(list(dict.fromkeys(video_ids)), MAX_IDS_PER_REQUEST):
+        request = get_youtube().videos().list(
+            part="snippet,contentDetails,statistics",
+            id=','.join(chunk),
+            maxResults=MAX_IDS_PER_REQUEST
+        )
+        response = request.execute()
+        for item in response.get('items', []):
+            details[item['id']] = item
+    return details
+
+def get_channel_names(channel_ids):
+    """Retrieves the names of many YouTube channels using batched requests.
+    
+    Args:
+        channel_ids (list): The unique identifiers of the YouTube channels. Duplicates and empty IDs are ignored.
+    
+    Returns:
+        dict: A mapping of channel ID to channel title.
+    """
+    names = {}
+    unique_ids = [channel_id for channel_id in dict.fromkeys(channel_ids) if channel_id]
+    for chunk in chunked(unique_ids, MAX_IDS_PER_REQUEST):
+        request = get_youtube().channels().list(
+            part="snippet",
+            id=','.join(chunk),
+            maxResults=MAX_IDS_PER_REQUEST
+        )
+        response = request.execute()
+        for item in response.get('items', []):
+            names[item['id']] = item['snippet']['title']
+    return names
+
+def classify_transcript_error(error):
+    """Classifies a transcript fetch error for the negative cache.
+    
+    Args:
+        error (Exception): The error raised by fetch_transcript_segments.
+    
+    Returns:
+        tuple: The failure class, whether the failure is permanent, and the first retry delay
+            in seconds (None for the default). Unknown errors count as transient.
+    """
+    for cls in type(error).__mro__:
+        if cls.__name__ in TRANSCRIPT_FAILURES:
+            return TRANSCRIPT_FAILURES[cls.__name__]
+    return 'error', False, None
+
+
+def choose_transcript(transcripts, languages=None):
+    """Picks the caption track to fetch from a video's transcript list.
+    
+    Manual tracks in a preferred language come first, then generated ones, then a track
+    translated to the most preferred language, then whatever track there is.
+    
+    Args:
+        transcripts (list): Transcript objects from YouTubeTranscriptApi.list_transcripts.
+        languages (list, optional): Language codes, most preferred first. Defaults to TRANSCRIPT_LANGUAGES.
+    
+    Returns:
+        Transcript or None: The track to fetch, or None if there are none.
+    """
+    languages = languages or TRANSCRIPT_LANGUAGES
+    for generated in (False, True):
+        for code in languages:
+            for transcript in transcripts:
+                if transcript.language_code == code and transcript.is_generated == generated:
+                    return transcript
+    for transcript in transcripts:
+        if transcript.is_translatable and any(language['language_code'] == languages[0] for language in transcript.translation_languages):
+            return transcript.translate(languages[0])
+    return transcripts[0] if transcripts else None
+
+
+def fetch_transcript_segments(video_id):
+    """Fetches the timestamped transcript segments of a YouTube video, raising on failure.
+    
+    The video's caption tracks are recorded in the state index. The track is always chosen
+    from the live list with the same preference order (see choose_transcript), so a retry
+    picks the same track, and the same language, as the first attempt would have.
     
     Args:
         video_id (str): The unique identifier of the YouTube video.
     
     Returns:
-        str or None: A string containing the full transcript of the video if successful, or None if an error occurs.
+        list: Dictionaries with 'text', 'start' and 'duration' keys.
+    
+    Raises:
+        NoCaptionTracks: If the video has no caption tracks.
+        Exception: youtube_transcript_api errors, e.g. TranscriptsDisabled.
+    """
+    with metrics.span("transcript.list", video_id=video_id):
+        transcripts = list(YouTubeTranscriptApi.list_transcripts(video_id))
+    state.record_caption_languages(video_id, [
+        {'code': transcript.language_code, 'generated': transcript.is_generated, 'translatable': transcript.is_translatable}
+        for transcript in transcripts
+    ])
+    transcript = choose_transcript(transcripts)
+    if transcript is None:
+        raise NoCaptionTracks(f"Video {video_id} has no caption tracks")
+    with metrics.span("transcript.fetch", video_id=video_id, language=transcript.language_code) as span:
+        segments = transcript.fetch()
+        span['segments'] = len(segments)
+    metrics.count("transcript.segments", len(segments))
+    metrics.count("transcript.bytes", sum(len(segment['text'].encode('utf-8')) for segment in segments))
+    return segments
+
+
+def get_transcript_segments(video_id):
+    """Retrieves the timestamped transcript segments of a YouTube video.
+    
+    Args:
+        video_id (str): The unique identifier of the YouTube video.
+    
+    Returns:
+        list or None: A list of dictionaries with 'text', 'start' and 'duration' keys if successful, or None if an error occurs.
     """
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
-        return ' '.join([entry['text'] for entry in transcript])
+        return fetch_transcript_segments(video_id)
     except Exception as e:
         print(f"\nError fetching transcript for video {video_id}: {str(e)}")
         return None
 
+def get_transcript(video_id):
+    """Retrieves and concatenates the transcript of a YouTube video.
+    
+    Args:
+        video_id (str): The unique identifier of the YouTube video.
+    
+    Returns:
+        str or None: A string containing the full transcript of the video if successful, or None if an error occurs.
+    """
+    segments = get_transcript_segments(video_id)
+    return ' '.join([entry['text'] for entry in segments]) if segments else None
+
 def remove_from_playlist(playlist_item_id):
     """
     Removes a video from a YouTube playlist.
@@ -121,7 +336,7 @@ def remove_from_playlist(playlist_item_id):
         None: This function doesn't return anything, but prints a success or error message.
     """
     try:
-        youtube.playlistItems().delete(id=playlist_item_id).execute()
+        get_youtube().playlistItems().delete(id=playlist_item_id).execute()
         print(f"\n❌Removed video {playlist_item_id} from playlist\n\n")
     except Exception as e:
         print(f"\nError removing video {playlist_item_id} from playlist: {str(e)}\n")
@@ -135,7 +350,7 @@ def get_channel_name(channel_id):
     Returns:
         str: The title (name) of the YouTube channel.
     """
-    request = youtube.channels().list(
+    request = get_youtube().channels().list(
         part="snippet",
         id=channel_id
     )
@@ -151,8 +366,9 @@ def get_latest_video_from_channel(channel_id):
     
     Returns:
         dict or None: A dictionary containing information about the latest video if found, None otherwise.
-    """    try:
-        request = youtube.search().list(
+    """
+    try:
+        request = get_youtube().search().list(
             part="id,snippet",
             channelId=channel_id,
             order="date",
@@ -176,14 +392,6 @@ def add_video_to_playlist(video_id, playlist_id):
     """Adds a video to a specified YouTube playlist.
     
     Args:
-        """Retrieves the transcript from the latest video of a specified YouTube channel.
-        
-        Args:
-            channel_id (str): The unique identifier of the YouTube channel.
-        
-        Returns:
-            None: This function doesn't return a value, but it processes the latest video's transcript.
-        """
         video_id (str): The ID of the video to be added to the playlist.
         playlist_id (str): The ID of the playlist to which the video will be added.
     
@@ -191,7 +399,7 @@ def add_video_to_playlist(video_id, playlist_id):
         None: This function doesn't return anything, but prints a success message if the video is added successfully or an error message if an exception occurs.
     """
     try:
-        youtube.playlistItems().insert(
+        get_youtube().playlistItems().insert(
             part="snippet",
             body={
                 "snippet": {
@@ -208,119 +416,274 @@ def add_video_to_playlist(video_id, playlist_id):
         print(f"Error adding video {video_id} to playlist {playlist_id}: {str(e)}")
 
 def get_transcript_from_latest_video(channel_id):
+    """Retrieves the transcript from the latest video of a specified YouTube channel.
+    
+    Args:
+        channel_id (str): The unique identifier of the YouTube channel.
+    
+    Returns:
+        None: This function doesn't return a value, but it processes the latest video's transcript.
+    """
     latest_video = get_latest_video_from_channel(channel_id)
     if latest_video:
         handle_playlist_item(latest_video, remove=False)
     else:
-        """
-        Handle a playlist item by processing its video details and transcript, saving the data, and optionally removing it from the playlist.
-        
-        Args:
-            playlist_item (dict): A dictionary containing information about the playlist item.
-            remove (bool, optional): Whether to remove the processed item from the playlist. Defaults to True.
-        
-        Returns:
-            None: This function doesn't return anything, but it performs several side effects:
-                - Retrieves video details and transcript
-                - Saves processed data to a JSON file
-                - Prints progress information
-                - Optionally removes the item from the playlist
-        """
         print("Failed to add latest video to playlist")
 
 
-def generate_transcripts():
+def generate_transcripts(workers=TRANSCRIPT_WORKERS, rate_limit=TRANSCRIPT_RATE_LIMIT):
     """
     Generate transcripts for videos in a specified playlist.
     
-    This function retrieves playlist items, processes each item to generate transcripts,
-    and handles any exceptions that may occur during the process.
+    This function pages through the playlist, skips items the state index marks as done or
+    waiting for a retry, fetches metadata for the rest of each page in one batch, then fetches
+    transcripts and writes the JSON files from a pool of worker threads. Work on a page starts
+    as soon as it arrives, and unchanged pages cost a conditional request instead of a download.
+    Each item is removed from the playlist only after its file has been written; removals are
+    sent from the main thread in batch requests.
     
     Args:
-        None
+        workers (int, optional): Number of concurrent transcript fetches. Defaults to TRANSCRIPT_WORKERS.
+        rate_limit (float, optional): Maximum transcript requests per second across all workers.
+            None or 0 disables the limit. Defaults to TRANSCRIPT_RATE_LIMIT.
     
     Returns:
         None: This function doesn't return any value but prints status messages to the console.
     """
     try:
-        playlist_items = get_playlist_items(PLAYLIST_ID)
-        print(f"\nFound {len(playlist_items)} videos in playlist: {PLAYLIST_ID}\n")
-        for item in playlist_items:
-            handle_playlist_item(item)
+        # Deleting items shifts the pages after them, so removals wait until paging is done
+        removals = PlaylistMutationQueue(get_youtube())
+        rate_limiter = TokenBucket(rate_limit)
+        found, unchanged = 0, 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {}
+            for page in iter_playlist_pages(PLAYLIST_ID):
+                found += len(page['items'])
+                unchanged += page['not_modified']
+                pending = select_pending_items(page['items'], removals)
+                if not pending:
+                    continue
+                
+                # Fetch metadata for the page's pending videos at once instead of once per video
+                videos_details = get_videos_details([video_id for _, video_id in pending])
+                channel_names = get_channel_names(
+                    [details.get('snippet', {}).get('channelId', '') for details in videos_details.values()]
+                )
+                print(f"📦 Fetched details for {len(videos_details)} videos from {len(channel_names)} channels\n")
+                
+                for item, video_id in pending:
+                    if video_id not in videos_details:
+                        print(f"\nSkipping video {video_id}: no details returned (private or deleted?)\n")
+                        state.record_failure(video_id, 'metadata', 'no details returned')
+                        continue
+                    state.record_metadata(video_id, videos_details[video_id].get('etag'))
+                    future = executor.submit(
+                        save_playlist_item,
+                        item,
+                        video_details=videos_details[video_id],
+                        channel_names=channel_names,
+                        rate_limiter=rate_limiter
+                    )
+                    futures[future] = item
             
+            print(f"\nFound {found} videos in playlist: {PLAYLIST_ID} ({unchanged} unchanged pages), {len(futures)} need transcripts\n")
+            removals.auto_flush = True
+            
+            # The API client isn't thread-safe, so playlist removal stays on this thread
+            for future in as_completed(futures):
+                if future.result():
+                    removals.delete(futures[future]['id'])
+        
+        removals.flush()
+        summarize_results(removals.results)
         print(f"\n\n🏁 All done making transcript json files!\n")
     except Exception as e:
         print(f"Error in generate_transcripts: {str(e)}")
 
 
-def handle_playlist_item(playlist_item, remove=True):
+def select_pending_items(playlist_items, removals=None):
+    """Filters playlist items down to those that still need a transcript, using the state index.
+    
+    Items whose transcript was already saved are removed from the playlist instead (an earlier
+    removal must have failed), and so are items whose transcript failed permanently (e.g.
+    captions are disabled). Items whose last attempt failed transiently are skipped until
+    their retry backoff has elapsed.
+    
+    Args:
+        playlist_items (list): Items from get_playlist_items.
+        removals (PlaylistMutationQueue, optional): Queue for the removals, flushed by the caller.
+            If None, removals are sent before this function returns.
+    
+    Returns:
+        list: (playlist_item, video_id) tuples for the items that need work.
+    """
+    flush = removals is None
+    if flush:
+        removals = PlaylistMutationQueue(get_youtube())
+    video_ids = [get_playlist_item_video_id(item) for item in playlist_items]
+    known = state.get_many(video_ids)
+    pending = []
+    for item, video_id in zip(playlist_items, video_ids):
+        row = known.get(video_id)
+        if row and row['transcript_status'] == TRANSCRIPT_FETCHED:
+            print(f"⏭️ Transcript for video {video_id} already saved")
+            removals.delete(item['id'])
+        elif row and row['transcript_status'] == TRANSCRIPT_SKIPPED:
+            print(f"⏭️ Skipping video {video_id} for good ({row['failure_class']}: {row['last_error']})")
+            removals.delete(item['id'])
+        elif not retry_due(row):
+            retry_at = datetime.fromtimestamp(row['next_retry_at']).strftime('%Y-%m-%d %H:%M')
+            print(f"⏭️ Skipping video {video_id} until {retry_at} ({row['last_error']})")
+        else:
+            pending.append((item, video_id))
+    if flush:
+        summarize_results(removals.flush())
+    return pending
+
+
+def get_playlist_item_video_id(playlist_item):
+    """Extracts the video ID from a playlist item or a search result.
+    
+    Args:
+        playlist_item (dict): A playlist item (with contentDetails) or a search result (with id.videoId).
+    
+    Returns:
+        str: The unique identifier of the YouTube video.
+    """
     try:
-        video_id = playlist_item['contentDetails']['videoId']
+        return playlist_item['contentDetails']['videoId']
     except Exception as e:
         print(f"playlist_item is missing contentDetails, using playlist_item['id'] instead: {str(e)}")
-        video_id = playlist_item['id']['videoId']
+        return playlist_item['id']['videoId']
+
+
+def save_playlist_item(playlist_item, video_details=None, channel_names=None, rate_limiter=None):
+    """
+    Fetch the transcript for a playlist item and save it, together with the video details, to a JSON file.
+    
+    This function makes no YouTube Data API calls when both video_details and channel_names
+    are given, so it is safe to run from worker threads. The transcript is fetched first, so
+    when details are fetched on demand (handle_playlist_item without prefetched details),
+    videos without a transcript cost no API calls. The batch paths (generate_transcripts and
+    the streaming pipeline) prefetch details for every pending item instead, at 1 unit per
+    50 videos. Failures are recorded in the state index by class:
+    permanent ones are skipped on later runs, transient ones retried with backoff.
+    
+    Args:
+        playlist_item (dict): A dictionary containing information about the playlist item.
+        video_details (dict, optional): Prefetched details from get_videos_details. Fetched on demand if None.
+        channel_names (dict, optional): Prefetched channel ID to name mapping from get_channel_names.
+            If None, the channel name is fetched on demand.
+        rate_limiter (TokenBucket, optional): Limiter acquired before each transcript request.
+    
+    Returns:
+        bool: True if the JSON file was written, False otherwise.
+    """
+    video_id = get_playlist_item_video_id(playlist_item)
         
     try:
-        video_details = get_video_details(video_id)
-        transcript = get_transcript(video_id)
-        if transcript:
-            channel_id = video_details.get('snippet', {}).get('channelId', '')
-            channel_name = get_channel_name(channel_id) if channel_id else ''
-            title = video_details.get('snippet', {}).get('title', '')
-            print(f"\n\n🎥 Processing:\n {title}\n\nChannel: {channel_name}")   
-            data = {
-                'title': title,
-                "channel_name": channel_name,
-                'publish_date': video_details['snippet'].get('publishedAt', ''),
-                'processed_date': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
-                'view_count': video_details['statistics'].get('viewCount', '0'),
-                'like_count': video_details['statistics'].get('likeCount', '0'),
-                'comment_count': video_details['statistics'].get('commentCount', '0'),
-                'duration': video_details['contentDetails'].get('duration', ''),
-                'video_id': video_id,
-                'description': video_details['snippet'].get('description', ''),
-                "channel_id": channel_id,
-                'thumbnail': video_details['snippet'].get('thumbnails', {}).get('high', {}).get('url', ''),
-                'transcript': transcript,
-                'video_url': f"https://www.youtube.com/watch?v={video_id}"
-            }
-            with open(f"{unprocessed_dir}/{video_id}.json", 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            
-            print(f"\n✅Saved transcript and details for video {video_id}")
-            
-            if remove:
-                remove_from_playlist(playlist_item['id'])
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            segments = fetch_transcript_segments(video_id)
+            if not segments:
+                raise NoCaptionTracks(f"Video {video_id} has an empty transcript")
+        except Exception as e:
+            failure_class, permanent, retry_base = classify_transcript_error(e)
+            metrics.count(f"transcript.failures.{failure_class}")
+            print(f"\nSkipping video {video_id} due to missing transcript ({failure_class}{', permanent' if permanent else ''})\n")
+            state.record_failure(
+                video_id, 'transcript', e,
+                transcript_status=TRANSCRIPT_SKIPPED if permanent else TRANSCRIPT_UNAVAILABLE,
+                failure_class=failure_class, retry_base=retry_base
+            )
+            return False
+        if video_details is None:
+            video_details = get_video_details(video_id)
+        
+        channel_id = video_details.get('snippet', {}).get('channelId', '')
+        if channel_names is not None:
+            channel_name = channel_names.get(channel_id, '')
         else:
-            print(f"\nSkipping video {video_id} due to missing transcript\n")
+            channel_name = get_channel_name(channel_id) if channel_id else ''
+        title = video_details.get('snippet', {}).get('title', '')
+        print(f"\n\n🎥 Processing:\n {title}\n\nChannel: {channel_name}")   
+        data = {
+            'title': title,
+            "channel_name": channel_name,
+            'publish_date': video_details['snippet'].get('publishedAt', ''),
+            'processed_date': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'view_count': video_details['statistics'].get('viewCount', '0'),
+            'like_count': video_details['statistics'].get('likeCount', '0'),
+            'comment_count': video_details['statistics'].get('commentCount', '0'),
+            'duration': video_details['contentDetails'].get('duration', ''),
+            'video_id': video_id,
+            'description': video_details['snippet'].get('description', ''),
+            "channel_id": channel_id,
+            'thumbnail': video_details['snippet'].get('thumbnails', {}).get('high', {}).get('url', ''),
+            'video_url': f"https://www.youtube.com/watch?v={video_id}"
+        }
+        # Metadata goes to compact JSON and the timestamped transcript to a segment file,
+        # both written atomically so readers never see a half-written file
+        save_video_data(os.path.join(unprocessed_dir, f"{video_id}.json"), data, segments)
+        state.record_transcript(video_id)
+        
+        print(f"\n✅Saved transcript and details for video {video_id}")
+        return True
     except Exception as e:
         print(f"Error processing video {video_id}: {str(e)}")
+        metrics.error('transcript', e)
+        state.record_failure(video_id, 'transcript', e)
+        return False
+
+
+def handle_playlist_item(playlist_item, remove=True, video_details=None, channel_names=None, removals=None):
+    """
+    Handle a playlist item by processing its video details and transcript, saving the data, and optionally removing it from the playlist.
+    
+    Args:
+        playlist_item (dict): A dictionary containing information about the playlist item.
+        remove (bool, optional): Whether to remove the processed item from the playlist. Defaults to True.
+        video_details (dict, optional): Prefetched details from get_videos_details. Fetched on demand if None.
+        channel_names (dict, optional): Prefetched channel ID to name mapping from get_channel_names.
+            If None, the channel name is fetched on demand.
+        removals (PlaylistMutationQueue, optional): Queue the removal here, to be sent in a batch
+            with others. If None, the item is removed right away.
+    
+    Returns:
+        None: This function doesn't return anything, but it performs several side effects:
+            - Retrieves video details and transcript
+            - Saves processed data to a JSON file
+            - Prints progress information
+            - Optionally removes the item from the playlist once the file is saved
+    """
+    saved = save_playlist_item(playlist_item, video_details=video_details, channel_names=channel_names)
+    if saved and remove:
+        if removals is not None:
+            removals.delete(playlist_item['id'])
+        else:
+            remove_from_playlist(playlist_item['id'])
         
 
 def add_videos_to_playlist(video_ids):
-    """Adds multiple videos to a YouTube playlist.
+    """Adds multiple videos to a YouTube playlist, in batch requests.
+    
+    Videos whose insert failed transiently are retried; the rest of the batch isn't resent.
+    When a whole batch fails without a status, the playlist is listed to find the inserts
+    that were applied anyway before any are resent.
     
     Args:
         video_ids (list): A list of YouTube video IDs to be added to the playlist.
     
     Returns:
-        None: This function doesn't return any value, but prints status messages.
+        list: The per-video results from PlaylistMutationQueue.flush.
     """
+    mutations = PlaylistMutationQueue(
+        get_youtube(),
+        playlist_video_ids=lambda playlist_id: [get_playlist_item_video_id(item) for item in get_playlist_items(playlist_id)]
+    )
     for video_id in video_ids:
-        try:
-            request = youtube.playlistItems().insert(
-                part="snippet",
-                body={
-                    "snippet": {
-                        "playlistId": PLAYLIST_ID,
-                        "resourceId": {
-                            "kind": "youtube#video",
-                            "videoId": video_id
-                        }
-                    }
-                }
-            )
-            response = request.execute()
-            print(f"✅ Added video {video_id} to playlist {PLAYLIST_ID}")
-        except Exception as e:
-            print(f"❌ Error adding video {video_id} to playlist: {str(e)}")
\ No newline at end of file
+        mutations.insert(video_id, PLAYLIST_ID)
+    results = mutations.flush()
+    summarize_results(results)
+    return results
@@ -1,42 +1,577 @@
 import os
-import dspy
-from groq import Groq
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from rate_limit import TokenBucket
+from llm_cache import llm_cache
+from clients import lazy_client
+from chunking import estimate_tokens
+from metrics import metrics
 
-# Initialize the GROQ client for the standalone function
-groq_client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+GROQ_MODEL = "mixtral-8x7b-32768"
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Retry settings for rate-limited (429) and server-side (5xx) failures
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 1.0))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 60.0))
+
+# Stream completions token by token, so notes can be written while they are generated
+LLM_STREAM = os.environ.get("LLM_STREAM", "0") == "1"
+
+# Providers to route between, in order of preference; a provider without an API key is skipped
+LLM_PROVIDERS = [name.strip() for name in os.environ.get("LLM_PROVIDERS", "groq,gemini").split(",") if name.strip()]
+# Models per provider as "model:context_tokens", smallest first: each prompt goes to the first
+# model whose context fits it (plus LLM_OUTPUT_TOKENS for the answer), or else the largest
+GROQ_MODELS = os.environ.get("GROQ_MODELS", f"{GROQ_MODEL}:32768")
+GEMINI_MODELS = os.environ.get("GEMINI_MODELS", "gemini-1.5-flash:1048576")
+GEMINI_API_KEY = os.environ.get("GOOGLE_GEMINI_API_KEY")
+LLM_OUTPUT_TOKENS = int(os.environ.get("LLM_OUTPUT_TOKENS", 2048))
+
+# Router health: latency and error rates are moving averages with this weight for the newest call;
+# after LLM_OUTAGE_FAILURES failures in a row a provider is left alone for LLM_OUTAGE_COOLDOWN seconds
+ROUTER_EWMA_WEIGHT = 0.2
+ROUTER_ERROR_PENALTY = 4
+LLM_OUTAGE_FAILURES = int(os.environ.get("LLM_OUTAGE_FAILURES", 3))
+LLM_OUTAGE_COOLDOWN = float(os.environ.get("LLM_OUTAGE_COOLDOWN", 60))
+
+# Per-provider request rate limits (requests per second, 0 for unlimited)
+rate_limiters = {
+    "groq": TokenBucket(float(os.environ.get("GROQ_RATE_LIMIT", 0.5)), capacity=float(os.environ.get("GROQ_BURST", 4))),
+    "gemini": TokenBucket(float(os.environ.get("GEMINI_RATE_LIMIT", 0.25)), capacity=float(os.environ.get("GEMINI_BURST", 4))),
+}
+
+# Groq's rate-limit reset headers are durations such as "2m59.56s", "7.66s" or "120ms"
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def create_groq_client():
+    """Creates the GROQ client for the standalone function.
+
+    GROQ_BASE_URL points the client at another endpoint, e.g. a local fake server for testing.
+    Retries are handled by the router, so the SDK's own retries are disabled.
+
+    Returns:
+        groq.Groq: The client.
+    """
+    from groq import Groq
+    return Groq(
+        api_key=os.environ.get("GROQ_API_KEY"),
+        base_url=os.environ.get("GROQ_BASE_URL") or None,
+        max_retries=0,
+    )
+
+
+def create_gemini_client():
+    """Configures the Gemini SDK, importing it only when a Gemini call is made.
+
+    Returns:
+        module: The configured google.generativeai module.
+    """
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+
+# Clients are created on first use, so importing this module makes no network calls
+get_groq_client = lazy_client("Groq client", create_groq_client)
+get_gemini_client = lazy_client("Gemini client", create_gemini_client)
+
+
+def parse_models(spec):
+    """Parses a "model:context_tokens,..." list, e.g. GROQ_MODELS.
+
+    Args:
+        spec (str): Comma-separated models, each optionally followed by its context size.
+
+    Returns:
+        list: (model, context_tokens) tuples, smallest context first.
+    """
+    models = []
+    for entry in spec.split(","):
+        name, _, context = entry.strip().rpartition(":") if ":" in entry else (entry.strip(), "", "")
+        if name:
+            models.append((name, int(context) if context else 8192))
+    return sorted(models, key=lambda model: model[1])
+
+
+def parse_duration(value):
+    """Parses a Groq rate-limit reset duration such as "1m30s" into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = DURATION_PATTERN.findall(value)
+        return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts) if parts else None
+
+
+def is_retryable_error(error):
+    """Checks whether an LLM API error is worth retrying.
+
+    Args:
+        error (Exception): The exception raised by the API call.
+
+    Returns:
+        bool: True for rate limits (429), server errors (5xx) and connection failures.
+    """
+    from groq import APIConnectionError
+    if isinstance(error, (APIConnectionError, ConnectionError, TimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is None and isinstance(getattr(error, "code", None), int):
+        # google.api_core exceptions carry the HTTP status as .code
+        status_code = error.code
+    return status_code == 429 or (status_code is not None and status_code >= 500)
+
+
+def is_rate_limit_error(error):
+    """Checks whether an LLM API error is a rate limit (429)."""
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is None and isinstance(getattr(error, "code", None), int):
+        status_code = error.code
+    return status_code == 429
+
+
+def get_retry_after(error):
+    """Reads how long the server asked us to wait from an API error, if it said.
+
+    The Retry-After header is used if present, else Groq's x-ratelimit-reset-requests or
+    x-ratelimit-reset-tokens header.
+
+    Args:
+        error (Exception): The exception raised by the API call.
+
+    Returns:
+        float or None: The number of seconds the server asked us to wait, or None.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        pass
+    resets = [parse_duration(headers.get(name)) for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [reset for reset in resets if reset is not None]
+    return min(resets) if resets else None
+
+
+class StreamStats:
+    """Thread-safe timings of streamed completions: time to first token and tokens per second."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def record(self, model, first_token, seconds, tokens):
+        """Records one streamed completion.
+
+        Args:
+            model (str): The model name.
+            first_token (float or None): Seconds until the first content delta, None if there was none.
+            seconds (float): Seconds until the stream ended.
+            tokens (int): Completion tokens, as reported by the API or estimated.
+
+        Returns:
+            dict: The call's figures, with 'model', 'ttft', 'seconds', 'tokens' and
+                'tokens_per_second' keys.
+        """
+        generating = seconds - (first_token or 0)
+        call = {
+            'model': model,
+            'ttft': first_token,
+            'seconds': seconds,
+            'tokens': tokens,
+            'tokens_per_second': tokens / generating if generating > 0 else 0.0,
+        }
+        with self.lock:
+            self.calls.append(call)
+        return call
+
+    def report(self):
+        """Returns a summary of the streamed calls so far, one line per model, or None if there were none."""
+        with self.lock:
+            calls = list(self.calls)
+        if not calls:
+            return None
+        by_model = {}
+        for call in calls:
+            by_model.setdefault(call['model'], []).append(call)
+        lines = [f"⚡ Streamed {len(calls)} completions:"]
+        for model, model_calls in sorted(by_model.items()):
+            ttfts = sorted(call['ttft'] for call in model_calls if call['ttft'] is not None)
+            median_ttft = ttfts[len(ttfts) // 2] if ttfts else 0.0
+            rate = sum(call['tokens'] for call in model_calls) / max(1e-9, sum(call['seconds'] - (call['ttft'] or 0) for call in model_calls))
+            lines.append(f"  {model}: {len(model_calls)} calls, median time to first token {median_ttft:.2f}s, "
+                         f"max {max(ttfts or [0.0]):.2f}s, {rate:.0f} tokens/s")
+        return '\n'.join(lines)
+
+
+stream_stats = StreamStats()
+
+
+class Provider(ABC):
+    """An LLM provider the router can send requests to, with its models and health.
+
+    Health is tracked by the router: a moving average of call latency and of the error rate,
+    the number of calls in flight, failures in a row, and the time until which the provider
+    is cooling down after a rate limit or an outage.
+
+    Args:
+        name (str): The provider name, also the key of its rate limiter and metrics.
+        models (list): (model, context_tokens) tuples, smallest context first.
+    """
+
+    def __init__(self, name, models):
+        self.name = name
+        self.models = models
+        self.latency = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.dspy_lms = {}
+        self.lock = threading.Lock()
+
+    def choose_model(self, prompt_tokens):
+        """Returns the smallest model whose context fits the prompt and an answer, or else the largest."""
+        for model, context in self.models:
+            if prompt_tokens + LLM_OUTPUT_TOKENS <= context:
+                return model
+        return self.models[-1][0]
+
+    def fits(self, prompt_tokens):
+        return prompt_tokens + LLM_OUTPUT_TOKENS <= self.models[-1][1]
+
+    @abstractmethod
+    def complete(self, messages, model, temp, stream=False, on_delta=None):
+        """Sends one chat completion request.
+
+        Args:
+            messages (list): The system and user messages.
+            model (str): The model name.
+            temp (float): The sampling temperature.
+            stream (bool, optional): Stream the completion, calling on_delta as it arrives.
+            on_delta (callable, optional): Called with the text generated so far after every delta.
+
+        Returns:
+            tuple: (content, prompt_tokens, completion_tokens, headers); token counts are None
+                if the API didn't report them, headers is a (possibly empty) mapping.
+        """
+
+    def dspy_lm(self, model):
+        """Returns this provider's DSPy language model for model, created on first use.
+
+        DSPy is slow to import and its GROQ client lists the available models when it is
+        created, so this only happens when a DSPy program actually runs.
+        """
+        with self.lock:
+            if model not in self.dspy_lms:
+                self.dspy_lms[model] = lazy_client(f"DSPy {self.name} LM {model}", lambda: self.create_dspy_lm(model))
+        return self.dspy_lms[model]()
+
+    @abstractmethod
+    def create_dspy_lm(self, model):
+        """Creates this provider's DSPy language model for model."""
+
+
+class GroqProvider(Provider):
+    """Groq chat completions; the rate-limit headers of every response feed the router."""
+
+    def complete(self, messages, model, temp, stream=False, on_delta=None):
+        response = get_groq_client().chat.completions.with_raw_response.create(
+            messages=messages,
+            model=model,
+            temperature=temp,
+            stream=stream,
+        )
+        if not stream:
+            completion = response.parse()
+            usage = getattr(completion, 'usage', None)
+            return (completion.choices[0].message.content, getattr(usage, 'prompt_tokens', None),
+                    getattr(usage, 'completion_tokens', None), response.headers)
+        text, tokens = "", None
+        for chunk in response.parse():
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                text += delta
+                if on_delta:
+                    on_delta(text)
+            # Groq reports usage on the last chunk, under x_groq
+            usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or getattr(chunk, 'usage', None)
+            if usage is not None and getattr(usage, 'completion_tokens', None):
+                tokens = usage.completion_tokens
+        return text, None, tokens, response.headers
+
+    def create_dspy_lm(self, model):
+        import dspy
+        return dspy.GROQ(model=model, api_key=os.environ.get("GROQ_API_KEY"))
+
+
+class GeminiProvider(Provider):
+    """Gemini through google-generativeai, configured with GOOGLE_GEMINI_API_KEY."""
+
+    def complete(self, messages, model, temp, stream=False, on_delta=None):
+        genai = get_gemini_client()
+        system = "\n".join(message['content'] for message in messages if message['role'] == 'system')
+        prompt = "\n\n".join(message['content'] for message in messages if message['role'] != 'system')
+        response = genai.GenerativeModel(model, system_instruction=system or None).generate_content(
+            prompt,
+            generation_config=genai.GenerationConfig(temperature=temp),
+            stream=stream,
+        )
+        text = ""
+        if stream:
+            for chunk in response:
+                text += chunk.text
+                if on_delta:
+                    on_delta(text)
+        else:
+            text = response.text
+        usage = getattr(response, 'usage_metadata', None)
+        return text, getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None), {}
+
+    def create_dspy_lm(self, model):
+        import dspy
+        return dspy.Google(model=f"models/{model}", api_key=GEMINI_API_KEY)
+
+
+def create_providers():
+    """Creates the providers listed in LLM_PROVIDERS that are configured.
+
+    Groq is always available (its key may come from the environment or a fake server);
+    Gemini needs GOOGLE_GEMINI_API_KEY.
+
+    Returns:
+        list: The providers, in order of preference.
+    """
+    providers = []
+    for name in LLM_PROVIDERS:
+        if name == "groq":
+            providers.append(GroqProvider("groq", parse_models(GROQ_MODELS)))
+        elif name == "gemini" and GEMINI_API_KEY:
+            providers.append(GeminiProvider("gemini", parse_models(GEMINI_MODELS)))
+        elif name not in ("groq", "gemini"):
+            print(f"⚠️ Unknown LLM provider {name!r} in LLM_PROVIDERS, skipping")
+    return providers
+
+
+class LLMRouter:
+    """Sends each LLM call to the healthiest provider that fits it, failing over on errors.
+
+    Providers are scored by their average latency, scaled up by the calls they have in
+    flight and their recent error rate; the lowest score wins, ties going to the earlier
+    provider in LLM_PROVIDERS. A provider whose rate limit is exhausted (a 429, or Groq's
+    x-ratelimit-remaining-* headers reaching zero) cools down until the limit resets, and one
+    that fails LLM_OUTAGE_FAILURES times in a row cools down for LLM_OUTAGE_COOLDOWN seconds.
+    Calls that fail with a retryable error go to the next provider, or, if every provider
+    is cooling down, wait for the first to recover, up to LLM_MAX_RETRIES times.
+
+    Args:
+        providers (list): The providers, in order of preference.
+    """
+
+    def __init__(self, providers):
+        self.providers = providers
+        self.lock = threading.Lock()
+
+    @property
+    def cache_model(self):
+        """The model key for the response cache: the configured models, joined."""
+        return ",".join(model for provider in self.providers for model, _ in provider.models)
+
+    def score(self, provider):
+        return (provider.latency or 0.0) * (1 + provider.in_flight) * (1 + ROUTER_ERROR_PENALTY * provider.error_rate)
+
+    def choose(self, prompt_tokens, tried=()):
+        """Picks the provider for a call and reserves a slot on it.
+
+        Args:
+            prompt_tokens (int): The estimated prompt size.
+            tried (iterable, optional): Providers that already failed this call; used only if
+                nothing else is available.
+
+        Returns:
+            tuple: (provider, seconds to wait until it is out of its cooldown).
+        """
+        with self.lock:
+            now = time.monotonic()
+            candidates = [provider for provider in self.providers if provider.fits(prompt_tokens)] or self.providers
+            ready = [provider for provider in candidates if provider.cooldown_until <= now]
+            fresh = [provider for provider in ready if provider not in tried]
+            if fresh or ready:
+                provider = min(fresh or ready, key=self.score)
+                wait = 0.0
+            else:
+                provider = min(candidates, key=lambda provider: provider.cooldown_until)
+                wait = provider.cooldown_until - now
+            provider.in_flight += 1
+        return provider, wait
+
+    def record_success(self, provider, seconds, headers):
+        with self.lock:
+            provider.in_flight -= 1
+            provider.failures = 0
+            provider.latency = seconds if provider.latency is None else (1 - ROUTER_EWMA_WEIGHT) * provider.latency + ROUTER_EWMA_WEIGHT * seconds
+            provider.error_rate *= 1 - ROUTER_EWMA_WEIGHT
+            # Stop sending requests before the provider has to reject them
+            for kind in ("requests", "tokens"):
+                remaining = (headers or {}).get(f"x-ratelimit-remaining-{kind}")
+                reset = parse_duration((headers or {}).get(f"x-ratelimit-reset-{kind}"))
+                if remaining is not None and reset and remaining.strip() == "0":
+                    provider.cooldown_until = max(provider.cooldown_until, time.monotonic() + reset)
+
+    def record_failure(self, provider, error, attempt):
+        """Updates a provider's health after a failed call.
+
+        Returns:
+            float: The cooldown in seconds put on the provider (0 for non-retryable errors).
+        """
+        with self.lock:
+            provider.in_flight -= 1
+            if not is_retryable_error(error):
+                return 0.0
+            provider.failures += 1
+            provider.error_rate = (1 - ROUTER_EWMA_WEIGHT) * provider.error_rate + ROUTER_EWMA_WEIGHT
+            delay = get_retry_after(error) if is_rate_limit_error(error) else None
+            if delay is None:
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            if provider.failures >= LLM_OUTAGE_FAILURES:
+                delay = max(delay, LLM_OUTAGE_COOLDOWN)
+            provider.cooldown_until = max(provider.cooldown_until, time.monotonic() + delay)
+            return delay
+
+    def run(self, prompt_tokens, call, label="chat"):
+        """Runs call on the best provider, failing over to others on retryable errors.
+
+        Args:
+            prompt_tokens (int): The estimated prompt size, for choosing providers and models.
+            call (callable): Called with (provider, model, span), where span is the attributes
+                dict of the call's metrics span, which it may add to; performs one API call and
+                returns (result, headers).
+            label (str, optional): The span name suffix, e.g. "chat" for "groq.chat".
+
+        Returns:
+            Any: The result of the first successful call.
+
+        Raises:
+            Exception: The last error if it isn't retryable or retries are exhausted.
+        """
+        if not self.providers:
+            raise RuntimeError("No LLM provider is configured, set GROQ_API_KEY or GOOGLE_GEMINI_API_KEY")
+        tried = []
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            provider, wait = self.choose(prompt_tokens, tried)
+            if wait > 0:
+                print(f"⏳ Every LLM provider is cooling down, waiting {wait:.1f}s for {provider.name}")
+                time.sleep(wait)
+            limiter = rate_limiters.get(provider.name)
+            if limiter:
+                metrics.count(f"{provider.name}.rate_limit_wait_s", limiter.acquire())
+            model = provider.choose_model(prompt_tokens)
+            start = time.perf_counter()
+            try:
+                with metrics.span(f"{provider.name}.{label}", model=model) as span:
+                    result, headers = call(provider, model, span)
+            except Exception as e:
+                delay = self.record_failure(provider, e, attempt)
+                if attempt >= LLM_MAX_RETRIES or not is_retryable_error(e):
+                    raise
+                tried.append(provider)
+                metrics.count(f"{provider.name}.retries")
+                print(f"⏳ {provider.name} request failed ({e}), cooling down {delay:.1f}s and retrying "
+                      f"({attempt + 1}/{LLM_MAX_RETRIES})")
+                continue
+            self.record_success(provider, time.perf_counter() - start, headers)
+            if len(self.providers) > 1:
+                metrics.count(f"router.{provider.name}")
+            return result
+
+
+router = LLMRouter(create_providers())
+
+
+def groq_response(prompt, temp=0, stream=None, on_delta=None):
+    """Generate a chat completion response, routed between the configured providers.
+
+    With only Groq configured (the default), every call goes to Groq. Responses are served
+    from the persistent LLM cache when the same models, temperature and prompts have been
+    seen before (see llm_cache.py). Cached responses are returned whole, without calling
+    on_delta.
 
-def groq_response(prompt, temp=0):
-    """Generate a chat completion response using the Groq API.
-    
     Args:
         prompt (str): The user's input prompt for the chat completion.
         temp (float, optional): The temperature parameter for controlling randomness in the response. Defaults to 0.
-    
+        stream (bool, optional): Stream the completion. Defaults to LLM_STREAM, or True if on_delta is given.
+        on_delta (callable, optional): Called with the text generated so far as it streams in.
+            After a retry it starts again from the beginning.
+
     Returns:
         str: The content of the generated chat completion response.
     """
-    chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful assistant."
-            },
-            {
-                "role": "user",
-                "content": prompt,
-            }
-        ],
-        model="mixtral-8x7b-32768",
-        temperature=temp,
-    )
+    messages = [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt,
+        }
+    ]
+    if stream is None:
+        stream = LLM_STREAM or on_delta is not None
+    prompt_tokens = estimate_tokens(SYSTEM_PROMPT + prompt)
+
+    def call(provider, model, span):
+        start = time.perf_counter()
+        first_token = []
+
+        def timed_delta(text):
+            if not first_token:
+                first_token.append(time.perf_counter() - start)
+            if on_delta:
+                on_delta(text)
+
+        content, used_prompt_tokens, completion_tokens, headers = provider.complete(
+            messages, model, temp, stream=stream, on_delta=timed_delta if stream else None
+        )
+        completion_tokens = completion_tokens or estimate_tokens(content or '')
+        if stream:
+            timing = stream_stats.record(model, first_token[0] if first_token else None, time.perf_counter() - start, completion_tokens)
+            # Kept per call in the trace, so models can be compared after the run
+            if timing['ttft'] is not None:
+                span['ttft_ms'] = round(timing['ttft'] * 1000, 1)
+            span['tokens_per_second'] = round(timing['tokens_per_second'], 1)
+        metrics.count(f"{provider.name}.prompt_tokens", used_prompt_tokens or prompt_tokens)
+        metrics.count(f"{provider.name}.completion_tokens", completion_tokens)
+        return content, headers
+
+    return llm_cache.cached(router.cache_model, temp, SYSTEM_PROMPT, prompt,
+                            lambda: router.run(prompt_tokens, call))
 
-    return chat_completion.choices[0].message.content
 
-# Initialize the DSPy GROQ language model
-groq_lm = dspy.GROQ(
-    model='mixtral-8x7b-32768',
-    api_key=os.environ.get("GROQ_API_KEY")
-)
+def call_dspy(fn, prompt_tokens=0):
+    """Runs a DSPy program call on the router's chosen provider, failing over like groq_response.
+
+    DSPy settings are per thread, so the language model is set in a settings context around
+    each attempt instead of a global dspy.configure from the main thread.
+
+    Args:
+        fn (callable): A zero-argument function that runs the DSPy program.
+        prompt_tokens (int, optional): The estimated prompt size. Defaults to 0.
+
+    Returns:
+        Any: Whatever fn returns.
+    """
+    import dspy
+
+    def call(provider, model, span):
+        with dspy.settings.context(lm=provider.dspy_lm(model)):
+            return fn(), {}
 
-# Configure DSPy to use the GROQ language model
-dspy.configure(lm=groq_lm)
\ No newline at end of file
+    return router.run(prompt_tokens, call, label="dspy")
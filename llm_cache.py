@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+cache_dir = os.path.join(base_dir, "experiments", "youtube", "cache")
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(cache_dir, "llm_cache.sqlite"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", 30))
+# Responses sampled at temperature > 0 are not cached unless this is set
+LLM_CACHE_NONZERO_TEMP = os.getenv("LLM_CACHE_NONZERO_TEMP", "0") == "1"
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "0") == "1"
+
+# Run eviction once every this many writes
+EVICT_EVERY = 50
+
+
+def make_key(model, temperature, system_prompt, prompt):
+    """Builds a content-addressed cache key for an LLM call.
+
+    Args:
+        model (str): The model name.
+        temperature (float): The sampling temperature.
+        system_prompt (str): The system prompt (or another description of the call's fixed instructions).
+        prompt (str): The user prompt.
+
+    Returns:
+        str: A hex SHA-256 digest of the inputs.
+    """
+    payload = json.dumps([model, float(temperature), system_prompt, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """A persistent, thread-safe SQLite cache of LLM responses.
+
+    Entries expire after max_age_days, and once the cache grows past max_entries or
+    max_bytes the least recently used entries are evicted.
+
+    Args:
+        path (str): Path of the SQLite database file.
+        max_entries (int): Maximum number of cached responses.
+        max_bytes (int): Maximum total size of cached responses, in bytes.
+        max_age_days (float): Age after which an entry is considered stale.
+        cache_nonzero_temp (bool): Whether to cache calls made with temperature > 0.
+        enabled (bool): Set to False to bypass the cache entirely.
+    """
+
+    def __init__(self, path, max_entries=LLM_CACHE_MAX_ENTRIES, max_bytes=LLM_CACHE_MAX_BYTES,
+                 max_age_days=LLM_CACHE_MAX_AGE_DAYS, cache_nonzero_temp=LLM_CACHE_NONZERO_TEMP,
+                 enabled=not LLM_CACHE_DISABLED):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.cache_nonzero_temp = cache_nonzero_temp
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self.conn.commit()
+        return self.conn
+
+    def get(self, key):
+        """Looks up a cached response, counting the hit or miss.
+
+        Args:
+            key (str): A key from make_key.
+
+        Returns:
+            str or None: The cached response, or None if missing or expired.
+        """
+        with self.lock:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        """Stores a response, evicting stale and least recently used entries periodically.
+
+        Args:
+            key (str): A key from make_key.
+            response (str): The response text to cache.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode('utf-8')), now, now)
+            )
+            conn.commit()
+            self.writes += 1
+            if self.writes % EVICT_EVERY == 1:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+        count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count > self.max_entries or total_bytes > self.max_bytes:
+            # Walk entries from least to most recently used until both limits are met
+            to_delete = []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                if count <= self.max_entries and total_bytes <= self.max_bytes:
+                    break
+                to_delete.append((key,))
+                count -= 1
+                total_bytes -= size
+            conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+        conn.commit()
+
+    def cached(self, model, temperature, system_prompt, prompt, fn):
+        """Returns the cached response for an LLM call, or calls fn and caches its result.
+
+        Calls with a nonzero temperature bypass the cache unless cache_nonzero_temp is set.
+
+        Args:
+            model (str): The model name.
+            temperature (float): The sampling temperature.
+            system_prompt (str): The system prompt.
+            prompt (str): The user prompt.
+            fn (callable): A zero-argument function that makes the call and returns the response text.
+
+        Returns:
+            str: The cached or freshly generated response.
+        """
+        if not self.enabled or (temperature and not self.cache_nonzero_temp):
+            with self.lock:
+                self.bypassed += 1
+            return fn()
+        key = make_key(model, temperature, system_prompt, prompt)
+        response = self.get(key)
+        if response is None:
+            response = fn()
+            self.set(key, response)
+        return response
+
+    def stats(self):
+        """Returns the hit, miss and bypass counters for this process.
+
+        Returns:
+            dict: Counts keyed by 'hits', 'misses' and 'bypassed'.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bypassed': self.bypassed}
+
+
+llm_cache = ResponseCache(LLM_CACHE_PATH)
@@ -1,8 +1,10 @@
 import argparse
+import importlib
 import os
-from generate_transcripts import generate_transcripts   
-from add_videos import add_videos
-from process_transcript import process_all_transcripts
+import sys
+import time
+from clients import init_timings
+from metrics import metrics
 
 
 NUMBER_OF_VIDEOS_TO_ADD = 5
@@ -10,6 +12,58 @@ TEXT_TO_INCLUDE = None
 TEXT_TO_EXCLUDE = None
 ROAST_CHANNEL_ID = os.environ.get("ROAST_CHANNEL_ID")
 
+# (module, seconds) for every stage module imported by this run, for --startup-profile
+import_timings = []
+
+
+def load(module_name):
+    """Imports a stage module on first use, so each command only loads the SDKs it needs.
+
+    Args:
+        module_name (str): The module to import.
+
+    Returns:
+        module: The imported module.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_timings.append((module_name, time.perf_counter() - start))
+    return module
+
+
+def print_startup_profile(started):
+    """Prints how long module imports and client initialization took.
+
+    Args:
+        started (float): The time.perf_counter() value when main() started.
+
+    Returns:
+        None
+    """
+    print("\n⏱️ Startup profile")
+    for label, seconds in import_timings:
+        print(f"  import {label:<28} {seconds * 1000:8.1f} ms")
+    for label, seconds in init_timings:
+        print(f"  init   {label:<28} {seconds * 1000:8.1f} ms")
+    print(f"  total run time{'':<21} {(time.perf_counter() - started) * 1000:8.1f} ms\n")
+
+
+def print_metrics():
+    """Prints the run's spans and counters, if any, and writes the metrics and trace files.
+
+    Returns:
+        None
+    """
+    if not metrics.snapshot()['spans']:
+        return
+    print(metrics.summary_table())
+    metrics_path = metrics.close()
+    if metrics_path:
+        print(f"\n📈 Metrics written to {metrics_path}, trace to {metrics.trace_path}\n")
+
+
 def ensure_directories_exist():
     base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     directories = ["experiments", "youtube", "transcripts", "unprocessed"]
@@ -24,17 +78,74 @@ def ensure_directories_exist():
             print(f"Directory already exists: {current_path}")
 
 def main():
+    started = time.perf_counter()
     # Ensure necessary directories exist
     ensure_directories_exist()
 
     parser = argparse.ArgumentParser(description="YouTube video processing script")
     parser.add_argument("--roast", action="store_true", help="Enable roast mode")
     parser.add_argument("--discover", nargs='+', help="Search for videos and add them to the playlist")
+    parser.add_argument("--query", action="append", default=[], help="Another discovery query, searched concurrently with --discover (repeatable)")
     parser.add_argument("--include", nargs='+', default=TEXT_TO_INCLUDE, help="Include videos with these words in the title")
     parser.add_argument("--exclude", nargs='+', default=TEXT_TO_EXCLUDE, help="Exclude videos with these words in the title")
-    parser.add_argument("--num", type=int, default=NUMBER_OF_VIDEOS_TO_ADD, help="Number of videos to add (default: 5)")
+    parser.add_argument("--num", type=int, default=NUMBER_OF_VIDEOS_TO_ADD, help="Number of videos to add, or search hits to show (default: 5)")
+    parser.add_argument("--stream", action="store_true", help="Run all stages concurrently as a streaming pipeline")
+    parser.add_argument("--search", nargs='+', help="Search stored transcripts and exit")
+    parser.add_argument("--semantic", action="store_true", help="Use vector similarity for --search (requires numpy)")
+    parser.add_argument("--compile-summarizer", action="store_true", help="Compile the DSPy summarizer on stored videos, save it for later runs and exit")
+    parser.add_argument("--compact-archive", action="store_true", help="Convert stored transcript JSON files to the compact segment format and exit")
+    parser.add_argument("--workers", type=int, help="Number of concurrent transcript fetches (default: $TRANSCRIPT_WORKERS or 8)")
+    parser.add_argument("--llm-concurrency", type=int, help="Number of transcripts summarized concurrently (default: $LLM_CONCURRENCY or 4)")
+    parser.add_argument("--transcript-rate", type=float, help="Max transcript requests per second, 0 for unlimited (default: $TRANSCRIPT_RATE_LIMIT or 4)")
+    parser.add_argument("--watch", nargs='*', metavar="CHANNEL_ID", help="Watch channels for new uploads (default: WATCH_CHANNELS, WATCH_CHANNELS_FILE or ROAST_CHANNEL_ID)")
+    parser.add_argument("--once", action="store_true", help="With --watch, poll every channel once and exit")
+    parser.add_argument("--quota", action="store_true", help="Show today's YouTube API quota usage and headroom and exit")
+    parser.add_argument("--startup-profile", action="store_true", help="Report module import and client initialization times when the run ends")
 
     args = parser.parse_args()
+    try:
+        run(args)
+    finally:
+        if args.startup_profile:
+            print_startup_profile(started)
+        print_metrics()
+
+
+def run(args):
+    """Runs the stages selected on the command line, importing each stage's modules only when it runs.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        None
+    """
+    if args.search:
+        load("search_index").run_search(' '.join(args.search), semantic=args.semantic, limit=args.num)
+        return
+    if args.watch is not None:
+        watch = load("watch")
+        channel_ids = args.watch or watch.load_channel_ids() or [channel_id for channel_id in [ROAST_CHANNEL_ID] if channel_id]
+        if not channel_ids:
+            print("No channels to watch: pass channel IDs or set WATCH_CHANNELS")
+            return
+        watch.watch_channels(channel_ids, once=args.once)
+        return
+    if args.quota:
+        quota = load("quota")
+        quota.print_quota_report(quota.youtube_quota)
+        return
+    if args.compile_summarizer:
+        load("process_transcript").compile_summarization_prompts()
+        return
+    if args.compact_archive:
+        compact_directory = load("transcript_store").compact_directory
+        process_transcript = load("process_transcript")
+        for directory in [process_transcript.unprocessed_dir, process_transcript.processed_dir]:
+            if os.path.isdir(directory):
+                converted, saved = compact_directory(directory)
+                print(f"🗜️ Compacted {converted} files in {directory}, saved {saved / 1024 / 1024:.1f} MB")
+        return
     if args.roast:
         print("Roast mode enabled!\n")
         return
@@ -46,13 +157,24 @@ def main():
             print(f"Including text: {args.include[0]}")
         if args.exclude:
             print(f"Excluding text: {args.exclude[0]}")
-        add_videos(prompt=query, num_results=args.num, include=args.include[0] if args.include else None, exclude=args.exclude[0] if args.exclude else None)
+        load("add_videos").add_videos(prompt=query, num_results=args.num, include=args.include[0] if args.include else None, exclude=args.exclude[0] if args.exclude else None, queries=args.query)
     
-    # Generate transcripts for the videos in the playlist
-    generate_transcripts()
-    
-    process_all_transcripts()
+    generate_transcripts = load("generate_transcripts")
+    process_transcript = load("process_transcript")
+    workers = args.workers if args.workers is not None else generate_transcripts.TRANSCRIPT_WORKERS
+    transcript_rate = args.transcript_rate if args.transcript_rate is not None else generate_transcripts.TRANSCRIPT_RATE_LIMIT
+    llm_concurrency = args.llm_concurrency if args.llm_concurrency is not None else process_transcript.LLM_CONCURRENCY
+
+    if args.stream:
+        load("pipeline").run_pipeline(transcript_workers=workers, transcript_rate=transcript_rate, llm_concurrency=llm_concurrency)
+    else:
+        # Generate transcripts for the videos in the playlist
+        generate_transcripts.generate_transcripts(workers=workers, rate_limit=transcript_rate)
         
+        process_transcript.process_all_transcripts(concurrency=llm_concurrency)
+    
+    quota = load("quota")
+    quota.print_quota_report(quota.youtube_quota)
     print("\n\n🏁 Done!\n\n")
     
 if __name__ == "__main__":
@@ -0,0 +1,231 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every run writes a trace (one JSON line per span) and a metrics summary here
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(base_dir, "experiments", "youtube", "metrics"))
+METRICS_DISABLED = os.getenv("METRICS_DISABLED", "0") == "1"
+# Trace lines are buffered and written in batches of this many
+TRACE_FLUSH_EVERY = 200
+
+
+def percentile(values, p):
+    """Returns the p-th percentile (0-100) of a list of numbers, or 0.0 if it is empty."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))]
+
+
+class Metrics:
+    """Thread-safe spans and counters for one run, written to a trace file and a metrics file.
+
+    A span times one operation, usually an external call such as "youtube.videos.list",
+    "transcript.fetch", "exa.search" or "groq.chat". Each finished span is appended to
+    trace-<run>.jsonl with its start, duration, thread, attributes and error, if any.
+    Counters add up calls, retries, bytes and tokens. close() writes metrics-<run>.json
+    with per-span latency figures and the counters; summary_table() formats the same for
+    the console.
+
+    Args:
+        directory (str): Where the trace and metrics files are written.
+        enabled (bool): Set to False to record nothing.
+    """
+
+    def __init__(self, directory=METRICS_DIR, enabled=not METRICS_DISABLED):
+        self.directory = directory
+        self.enabled = enabled
+        self.run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.counters = defaultdict(float)
+        self.buffer = []
+        self.trace_file = None
+        self.closed = False
+
+    @property
+    def trace_path(self):
+        return os.path.join(self.directory, f"trace-{self.run_id}.jsonl")
+
+    @property
+    def metrics_path(self):
+        return os.path.join(self.directory, f"metrics-{self.run_id}.json")
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Times the enclosed block as one span; exceptions are recorded and re-raised.
+
+        A block that ends in an exception which isn't a failure (such as a 304 Not Modified,
+        which the Google client raises) sets attributes['not_modified'] so it isn't counted
+        as an error.
+
+        Args:
+            name (str): The span name, e.g. "youtube.videos.list".
+            **attributes: Extra details for the trace, e.g. video_id.
+
+        Yields:
+            dict: The span's attributes, which the block may add to (e.g. tokens).
+        """
+        if not self.enabled:
+            yield attributes
+            return
+        started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(name, started_at, time.perf_counter() - start, attributes, error)
+
+    def traced(self, name):
+        """Returns a decorator that runs the decorated function in a span called name."""
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+        return decorator
+
+    def _finish(self, name, started_at, seconds, attributes, error):
+        record = {
+            'name': name,
+            'start': round(started_at, 6),
+            'ms': round(seconds * 1000, 3),
+            'thread': threading.current_thread().name,
+        }
+        if attributes:
+            record['attrs'] = attributes
+        if error is not None and attributes.get('not_modified'):
+            error = None
+        if error is not None:
+            record['error'] = f"{type(error).__name__}: {error}"[:300]
+        with self.lock:
+            self.durations[name].append(seconds)
+            if error is not None:
+                self.errors[name] += 1
+            self.buffer.append(record)
+            if len(self.buffer) >= TRACE_FLUSH_EVERY:
+                self._flush()
+
+    def count(self, name, value=1):
+        """Adds value to a counter, e.g. count("groq.completion_tokens", 512)."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += value
+
+    def error(self, stage, error):
+        """Records an error that was handled (and printed) instead of raised.
+
+        Args:
+            stage (str): Where it happened, e.g. "transcript" or "summary".
+            error (Exception or str): The error.
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        self.count(f"errors.{stage}")
+        with self.lock:
+            self.buffer.append({
+                'name': f"error.{stage}",
+                'start': round(time.time(), 6),
+                'thread': threading.current_thread().name,
+                'error': f"{type(error).__name__}: {error}"[:300] if isinstance(error, BaseException) else str(error)[:300],
+            })
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        try:
+            if self.trace_file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.trace_file = open(self.trace_path, 'a', encoding='utf-8')
+            self.trace_file.write(''.join(json.dumps(record, default=str) + '\n' for record in self.buffer))
+            self.trace_file.flush()
+        except OSError as e:
+            print(f"🚨 Error writing trace {self.trace_path}: {e}")
+        self.buffer = []
+
+    def snapshot(self):
+        """Returns the per-span figures and the counters recorded so far.
+
+        Returns:
+            dict: 'spans' maps each span name to its calls, errors, total seconds and p50, p95
+                and max milliseconds; 'counters' maps each counter to its value.
+        """
+        with self.lock:
+            spans = {
+                name: {
+                    'calls': len(durations),
+                    'errors': self.errors.get(name, 0),
+                    'total_s': round(sum(durations), 3),
+                    'p50_ms': round(percentile(durations, 50) * 1000, 1),
+                    'p95_ms': round(percentile(durations, 95) * 1000, 1),
+                    'max_ms': round(max(durations) * 1000, 1),
+                }
+                for name, durations in self.durations.items()
+            }
+            counters = {name: (int(value) if float(value).is_integer() else round(value, 3)) for name, value in self.counters.items()}
+        return {'run_id': self.run_id, 'spans': spans, 'counters': counters}
+
+    def summary_table(self):
+        """Formats the spans, slowest in total first, and the counters as a table."""
+        snapshot = self.snapshot()
+        header = f"  {'span':<34} {'calls':>7} {'errors':>7} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+        lines = [f"\n📈 Run metrics ({snapshot['run_id']})", header, "  " + "-" * (len(header) - 2)]
+        for name, span in sorted(snapshot['spans'].items(), key=lambda item: -item[1]['total_s']):
+            lines.append(f"  {name:<34} {span['calls']:>7} {span['errors']:>7} {span['total_s']:>9.2f} "
+                         f"{span['p50_ms']:>9.1f} {span['p95_ms']:>9.1f} {span['max_ms']:>9.1f}")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"  {name:<34} {value:>7}")
+        return '\n'.join(lines)
+
+    def close(self):
+        """Flushes the trace and writes the metrics file. Calls after the first do nothing.
+
+        Returns:
+            str or None: The metrics file path, or None if nothing was recorded.
+        """
+        if not self.enabled or self.closed:
+            return None
+        snapshot = self.snapshot()
+        with self.lock:
+            if self.closed:
+                return None
+            # Set before writing, so the atexit hook doesn't write the file a second time
+            self.closed = True
+            self._flush()
+            if self.trace_file is not None:
+                self.trace_file.close()
+                self.trace_file = None
+            if not snapshot['spans'] and not snapshot['counters']:
+                return None
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(f"{self.metrics_path}.tmp", 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, indent=2)
+                os.replace(f"{self.metrics_path}.tmp", self.metrics_path)
+            except OSError as e:
+                print(f"🚨 Error writing metrics {self.metrics_path}: {e}")
+                return None
+        return self.metrics_path
+
+
+metrics = Metrics()
+# Runs that don't end through main.py (watch mode interrupted, scripts) still get their files
+atexit.register(metrics.close)
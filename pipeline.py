@@ -0,0 +1,271 @@
+import os
+import queue
+import threading
+import time
+from generate_transcripts import (
+    PLAYLIST_ID,
+    TRANSCRIPT_WORKERS,
+    TRANSCRIPT_RATE_LIMIT,
+    MAX_IDS_PER_REQUEST,
+    unprocessed_dir,
+    iter_playlist_pages,
+    select_pending_items,
+    get_videos_details,
+    get_channel_names,
+    save_playlist_item,
+    get_youtube,
+)
+from process_transcript import (
+    LLM_CONCURRENCY,
+    output_dir,
+    processed_dir,
+    render_transcript_file,
+    finish_transcript_file,
+    claim_file,
+    select_pending_files,
+)
+from rate_limit import TokenBucket
+from state import state
+from playlist_mutations import PlaylistMutationQueue, summarize_results
+from work_queue import WorkLeases
+
+# Maximum number of videos waiting between two stages; a full queue blocks the stage feeding it
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 16))
+# How long the metadata stage waits for more videos before sending a partial batch
+METADATA_BATCH_WAIT = 0.5
+
+# Marks the end of a stage's input
+DONE = object()
+
+# The YouTube API client isn't thread-safe, so stages take turns using it
+youtube_lock = threading.Lock()
+
+
+def run_stage(name, fn, in_queue, out_queue, workers):
+    """Starts worker threads that apply fn to every item of in_queue and pass results on.
+
+    Results that are None are dropped. When the input is exhausted, the last worker to
+    finish forwards DONE to the next stage.
+
+    Args:
+        name (str): The stage name, used in thread names and error messages.
+        fn (callable): Processes one item and returns the item for the next stage, or None.
+        in_queue (queue.Queue): The stage's input.
+        out_queue (queue.Queue or None): The next stage's input, or None for the last stage.
+        workers (int): The number of worker threads.
+
+    Returns:
+        list: The started threads.
+    """
+    remaining = [max(1, workers)]
+    remaining_lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = in_queue.get()
+            if item is DONE:
+                # Let sibling workers see the end of the input too
+                in_queue.put(DONE)
+                break
+            try:
+                result = fn(item)
+                if result is not None and out_queue is not None:
+                    out_queue.put(result)
+            except Exception as e:
+                print(f"🚨 Error in {name} stage: {e}")
+        with remaining_lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and out_queue is not None:
+            out_queue.put(DONE)
+
+    threads = [threading.Thread(target=worker, name=f"{name}-{i}", daemon=True) for i in range(remaining[0])]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def discover(out_queue, removals, leases):
+    """Feeds playlist items that still need a transcript into the pipeline.
+
+    Transcripts already saved in the unprocessed directory whose note is still missing, such
+    as ones whose summary failed and is due for a retry, go first. They are sent as plain
+    filenames, which the metadata and transcript stages pass straight on.
+
+    Args:
+        out_queue (queue.Queue): The metadata stage's input.
+        removals (PlaylistMutationQueue): Queue for removing items whose transcript is already saved.
+        leases (WorkLeases): The leases on the unprocessed directory.
+
+    Returns:
+        None
+    """
+    try:
+        filenames = sorted(filename for filename in os.listdir(unprocessed_dir) if filename.endswith(".json"))
+        for filename in select_pending_files(filenames, leases):
+            out_queue.put(filename)
+
+        pages = iter_playlist_pages(PLAYLIST_ID)
+        found = 0
+        while True:
+            with youtube_lock:
+                page = next(pages, None)
+                if page is None:
+                    break
+                pending = select_pending_items(page['items'], removals)
+            found += len(page['items'])
+            for item, video_id in pending:
+                out_queue.put((item, video_id))
+        print(f"\nFound {found} videos in playlist: {PLAYLIST_ID}\n")
+        # Paging is done, so removals no longer shift the pages still to be read
+        with youtube_lock:
+            removals.auto_flush = True
+            removals.flush()
+    except Exception as e:
+        print(f"🚨 Error in discovery stage: {e}")
+    finally:
+        out_queue.put(DONE)
+
+
+def fetch_metadata(in_queue, out_queue):
+    """Fetches video details and channel names in batches of up to MAX_IDS_PER_REQUEST.
+
+    A batch is sent as soon as it is full or no more videos arrive within METADATA_BATCH_WAIT
+    seconds, so the first videos don't wait for the whole playlist.
+
+    Args:
+        in_queue (queue.Queue): (playlist_item, video_id) tuples and saved transcript filenames
+            from discovery.
+        out_queue (queue.Queue): The transcript stage's input.
+
+    Returns:
+        None
+    """
+    finished = False
+    while not finished:
+        item = in_queue.get()
+        if item is DONE:
+            break
+        if isinstance(item, str):
+            # A saved transcript, which needs no metadata
+            out_queue.put(item)
+            continue
+        batch = [item]
+        while len(batch) < MAX_IDS_PER_REQUEST:
+            try:
+                item = in_queue.get(timeout=METADATA_BATCH_WAIT)
+            except queue.Empty:
+                break
+            if item is DONE:
+                finished = True
+                break
+            if isinstance(item, str):
+                out_queue.put(item)
+                continue
+            batch.append(item)
+        try:
+            with youtube_lock:
+                videos_details = get_videos_details([video_id for _, video_id in batch])
+                channel_names = get_channel_names(
+                    [details.get('snippet', {}).get('channelId', '') for details in videos_details.values()]
+                )
+            for item, video_id in batch:
+                if video_id not in videos_details:
+                    print(f"\nSkipping video {video_id}: no details returned (private or deleted?)\n")
+                    state.record_failure(video_id, 'metadata', 'no details returned')
+                    continue
+                state.record_metadata(video_id, videos_details[video_id].get('etag'))
+                out_queue.put((item, videos_details[video_id], channel_names))
+        except Exception as e:
+            print(f"🚨 Error in metadata stage: {e}")
+    out_queue.put(DONE)
+
+
+def run_pipeline(roast=False, transcript_workers=TRANSCRIPT_WORKERS, transcript_rate=TRANSCRIPT_RATE_LIMIT,
+                 llm_concurrency=LLM_CONCURRENCY):
+    """Runs discovery, metadata, transcript, summarize and write as concurrent streaming stages.
+
+    Videos flow through bounded queues, so the first note is written as soon as its video has
+    been through every stage rather than after the whole playlist has been downloaded, and
+    network-bound and LLM-bound work overlap. Each stage records progress in the state index
+    and writes the same files as the batch mode, so the two modes can be mixed freely.
+
+    Args:
+        roast (bool, optional): If True, roasts transcripts instead of summarizing. Defaults to False.
+        transcript_workers (int, optional): Concurrent transcript fetches. Defaults to TRANSCRIPT_WORKERS.
+        transcript_rate (float, optional): Max transcript requests per second. Defaults to TRANSCRIPT_RATE_LIMIT.
+        llm_concurrency (int, optional): Concurrent summaries. Defaults to LLM_CONCURRENCY.
+
+    Returns:
+        None: This function doesn't return a value, but writes transcripts and markdown notes.
+    """
+    print("\n\n🚰 Running streaming pipeline...\n")
+    os.makedirs(processed_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.monotonic()
+    notes_written = [0]
+    rate_limiter = TokenBucket(transcript_rate)
+    # Removals are sent in batches once discovery has finished paging, always under youtube_lock
+    removals = PlaylistMutationQueue(get_youtube())
+
+    discovered = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    with_metadata = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    with_transcript = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    rendered = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    def fetch_transcript(entry):
+        if isinstance(entry, str):
+            # Already saved by an earlier run
+            return entry
+        item, video_details, channel_names = entry
+        if not save_playlist_item(item, video_details=video_details, channel_names=channel_names, rate_limiter=rate_limiter):
+            return None
+        with youtube_lock:
+            removals.delete(item['id'])
+        return f"{video_details['id']}.json"
+
+    # Files are claimed before they are summarized, like in process_all_transcripts, so a
+    # batch run or another pipeline sharing the directory doesn't render them too
+    leases = WorkLeases(unprocessed_dir)
+
+    def summarize(filename):
+        if not claim_file(filename, leases):
+            return None
+        try:
+            md_filename, markdown_content = render_transcript_file(os.path.join(unprocessed_dir, filename), roast)
+        except Exception as e:
+            state.record_failure(os.path.splitext(filename)[0], 'summary', e)
+            leases.release(filename)
+            raise
+        return filename, md_filename, markdown_content
+
+    def write(result):
+        try:
+            if not leases.holds(result[0]):
+                print(f"⚠️ Another worker took over {result[0]}, leaving its note to them")
+                return
+            finish_transcript_file(*result)
+        finally:
+            leases.release(result[0])
+        notes_written[0] += 1
+        if notes_written[0] == 1:
+            print(f"⏱️ First note written after {time.monotonic() - start:.1f}s")
+
+    threads = [
+        threading.Thread(target=discover, args=(discovered, removals, leases), name="discover", daemon=True),
+        threading.Thread(target=fetch_metadata, args=(discovered, with_metadata), name="metadata", daemon=True),
+    ]
+    with leases:
+        for thread in threads:
+            thread.start()
+        threads += run_stage("transcript", fetch_transcript, with_metadata, with_transcript, transcript_workers)
+        threads += run_stage("summarize", summarize, with_transcript, rendered, llm_concurrency)
+        threads += run_stage("write", write, rendered, None, 1)
+
+        for thread in threads:
+            thread.join()
+    with youtube_lock:
+        removals.flush()
+    summarize_results(removals.results)
+    print(f"\n\n🏁 Pipeline wrote {notes_written[0]} notes in {time.monotonic() - start:.1f}s\n")
@@ -0,0 +1,251 @@
+import os
+import random
+import threading
+import time
+from metrics import metrics
+
+# Calls per batch request; the YouTube API accepts up to 50 in one batch
+PLAYLIST_BATCH_SIZE = int(os.getenv("PLAYLIST_BATCH_SIZE", 50))
+# How often failed items are retried, with jittered exponential backoff between rounds
+PLAYLIST_BATCH_RETRIES = int(os.getenv("PLAYLIST_BATCH_RETRIES", 3))
+PLAYLIST_BATCH_BACKOFF = float(os.getenv("PLAYLIST_BATCH_BACKOFF", 1.0))
+
+INSERT = 'insert'
+DELETE = 'delete'
+
+
+def http_status(error):
+    """Returns the HTTP status code of a Google API error, or None if it has none."""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        status = getattr(error, 'status_code', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_mutation_error(error):
+    """Checks whether a failed playlist mutation is worth retrying.
+
+    Args:
+        error (Exception): The error reported for the item.
+
+    Returns:
+        bool: True for rate limits (429), server errors (5xx) and errors without a status
+            (connection failures); False for client errors such as an invalid video ID.
+    """
+    status = http_status(error)
+    return status is None or status == 429 or status >= 500
+
+
+class PlaylistMutationQueue:
+    """Collects playlist inserts and deletes and sends them as Google API batch requests.
+
+    Each batch holds up to PLAYLIST_BATCH_SIZE calls and costs one HTTP round trip. Items
+    that fail with a retryable error are resent, on their own, in later rounds; the result of
+    every item is reported by flush(). Adding items is thread-safe, but flush() uses the
+    YouTube client, which isn't, so callers that share the client across threads must
+    serialize flushes themselves.
+
+    A whole batch is only resent when it was refused with a 429 or 5xx status. When it fails
+    without one (a timeout or connection reset), the server may have applied it anyway. Deletes
+    are resent, since a second delete just finds the item gone. Inserts are not, because a
+    playlist can hold a video twice and each insert costs 50 quota units. They are looked up
+    with playlist_video_ids instead and only resent if missing, or reported as failed if no
+    lookup was given.
+
+    Args:
+        youtube (googleapiclient.discovery.Resource): The YouTube API client.
+        batch_size (int, optional): Calls per batch. Defaults to PLAYLIST_BATCH_SIZE.
+        retries (int, optional): Retry rounds for failed items. Defaults to PLAYLIST_BATCH_RETRIES.
+        auto_flush (bool, optional): Send a batch as soon as batch_size items are queued.
+            Defaults to False.
+        playlist_video_ids (callable, optional): Returns the video IDs in a playlist, given its
+            ID. Defaults to None.
+    """
+
+    def __init__(self, youtube, batch_size=PLAYLIST_BATCH_SIZE, retries=PLAYLIST_BATCH_RETRIES, auto_flush=False,
+                 playlist_video_ids=None):
+        self.youtube = youtube
+        self.playlist_video_ids = playlist_video_ids
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.auto_flush = auto_flush
+        self.lock = threading.Lock()
+        self.pending = []
+        self.results = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def insert(self, video_id, playlist_id):
+        """Queues adding a video to a playlist.
+
+        Args:
+            video_id (str): The video to add.
+            playlist_id (str): The playlist to add it to.
+
+        Returns:
+            None
+        """
+        self._add({'action': INSERT, 'id': video_id, 'playlist_id': playlist_id})
+
+    def delete(self, playlist_item_id):
+        """Queues removing an item from its playlist.
+
+        Args:
+            playlist_item_id (str): The playlist item (not video) ID.
+
+        Returns:
+            None
+        """
+        self._add({'action': DELETE, 'id': playlist_item_id})
+
+    def _add(self, mutation):
+        with self.lock:
+            self.pending.append(mutation)
+            full = self.auto_flush and len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def _build_request(self, mutation):
+        if mutation['action'] == INSERT:
+            return self.youtube.playlistItems().insert(
+                part="snippet",
+                body={
+                    "snippet": {
+                        "playlistId": mutation['playlist_id'],
+                        "resourceId": {
+                            "kind": "youtube#video",
+                            "videoId": mutation['id']
+                        }
+                    }
+                }
+            )
+        return self.youtube.playlistItems().delete(id=mutation['id'])
+
+    def _execute_batch(self, mutations):
+        """Sends one batch request.
+
+        Returns:
+            tuple: The error (or None) of each mutation, in order, and whether their outcome is
+                known (False if the batch failed without a status and may have been applied).
+        """
+        errors = [None] * len(mutations)
+
+        def callback(request_id, response, exception):
+            errors[int(request_id)] = exception
+
+        batch = self.youtube.new_batch_http_request(callback=callback)
+        for index, mutation in enumerate(mutations):
+            batch.add(self._build_request(mutation), request_id=str(index))
+        try:
+            batch.execute()
+        except Exception as e:
+            # A 429 or 5xx means the batch was refused; without a status it may have been applied
+            return [e] * len(mutations), http_status(e) is not None
+        return errors, True
+
+    def _find_applied_inserts(self, inserts):
+        """Looks up which inserts of batches with an unknown outcome are in their playlist.
+
+        Args:
+            inserts (list): The insert mutations.
+
+        Returns:
+            dict: Playlist ID to the set of its video IDs, or None where it couldn't be listed.
+        """
+        playlists = {}
+        for playlist_id in {mutation['playlist_id'] for mutation in inserts}:
+            playlists[playlist_id] = None
+            if self.playlist_video_ids is None:
+                continue
+            try:
+                playlists[playlist_id] = set(self.playlist_video_ids(playlist_id))
+            except Exception as e:
+                print(f"🚨 Error listing playlist {playlist_id} to check unconfirmed inserts: {e}")
+        return playlists
+
+    def flush(self):
+        """Sends every queued mutation in batches, retrying the items that failed transiently.
+
+        Returns:
+            list: One dictionary per mutation sent by this call, with 'action', 'id', 'ok' and
+                'error' (None or the last exception) keys. Deleting an item that is already
+                gone counts as success.
+        """
+        with self.lock:
+            remaining, self.pending = self.pending, []
+        results = []
+        for attempt in range(self.retries + 1):
+            if not remaining:
+                break
+            if attempt:
+                delay = random.uniform(0, PLAYLIST_BATCH_BACKOFF * 2 ** (attempt - 1))
+                print(f"⏳ Retrying {len(remaining)} failed playlist changes in {delay:.1f}s ({attempt}/{self.retries})")
+                metrics.count("youtube.batch_retries", len(remaining))
+                time.sleep(delay)
+            failed, unconfirmed = [], []
+            for start in range(0, len(remaining), self.batch_size):
+                mutations = remaining[start:start + self.batch_size]
+                errors, outcome_known = self._execute_batch(mutations)
+                for mutation, error in zip(mutations, errors):
+                    if error is not None and mutation['action'] == DELETE and http_status(error) == 404:
+                        error = None
+                    if error is not None and not outcome_known and mutation['action'] == INSERT:
+                        unconfirmed.append((mutation, error))
+                    elif error is None or not is_retryable_mutation_error(error) or attempt == self.retries:
+                        results.append({'action': mutation['action'], 'id': mutation['id'], 'ok': error is None, 'error': error})
+                    else:
+                        failed.append(mutation)
+            if unconfirmed:
+                playlists = self._find_applied_inserts([mutation for mutation, _ in unconfirmed])
+                unknown = 0
+                for mutation, error in unconfirmed:
+                    video_ids = playlists[mutation['playlist_id']]
+                    if video_ids is not None and mutation['id'] in video_ids:
+                        results.append({'action': INSERT, 'id': mutation['id'], 'ok': True, 'error': None})
+                    elif video_ids is not None and attempt < self.retries:
+                        failed.append(mutation)
+                    else:
+                        unknown += video_ids is None
+                        results.append({'action': INSERT, 'id': mutation['id'], 'ok': False, 'error': error})
+                if unknown:
+                    print(f"⚠️ {unknown} playlist inserts may have been applied despite the error; check the playlist before adding them again")
+            remaining = failed
+        with self.lock:
+            self.results.extend(results)
+        return results
+
+
+def summarize_results(results):
+    """Prints the failed mutations, grouped by error, and a count of the successful ones.
+
+    Args:
+        results (list): Results returned by PlaylistMutationQueue.flush.
+
+    Returns:
+        None
+    """
+    for action in (INSERT, DELETE):
+        done = [result for result in results if result['action'] == action]
+        if not done:
+            continue
+        # Failures with the same cause, e.g. a deferred batch, are reported once
+        failures = {}
+        for result in done:
+            if not result['ok']:
+                failures.setdefault(str(result['error']), []).append(result['id'])
+        for error, ids in failures.items():
+            shown = ', '.join(ids[:3]) + (f" and {len(ids) - 3} more" if len(ids) > 3 else "")
+            print(f"❌ Error in playlist {action} of {shown}: {error}")
+        succeeded = sum(result['ok'] for result in done)
+        verb = "Added" if action == INSERT else "Removed"
+        print(f"{'✅' if succeeded == len(done) else '⚠️'} {verb} {succeeded}/{len(done)} playlist items")
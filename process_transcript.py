@@ -1,9 +1,20 @@
 import os
-import dspy
 import json
-import shutil
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from llm import groq_response
+from llm import groq_response, call_dspy, router, stream_stats, LLM_STREAM
+from llm_cache import llm_cache
+from state import state, retry_due
+from transcript_store import load_video_data, move_video_files
+from chunking import chunk_transcript, estimate_tokens, format_timestamp, map_reduce
+from dedup_index import dedup_index
+from transcript_cleaning import clean_transcript, cleaning_stats
+from metrics import metrics
+from clients import lazy_client
+from work_queue import WorkLeases
 
 base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -13,13 +24,70 @@ output_dir = os.path.expanduser(output_env)
 unprocessed_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts", "unprocessed")
 
 processed_dir = os.path.join(base_dir,  "experiments", "youtube","transcripts", "processed")
+
+# Number of transcript files processed concurrently
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+
+# Transcripts longer than this are condensed with map-reduce before being inlined into the roast prompts
+ROAST_TRANSCRIPT_TOKENS = int(os.getenv("ROAST_TRANSCRIPT_TOKENS", 20000))
+
+# With LLM_STREAM=1, a note's partial markdown is rewritten at most this often while it streams in (seconds)
+MARKDOWN_FLUSH_INTERVAL = float(os.getenv("MARKDOWN_FLUSH_INTERVAL", 0.5))
+PARTIAL_SUFFIX = ".partial.md"
+
+# How summaries are written: "fused" summarizes in one call from fixed instructions, "channel"
+# generates a DSPy prompt once per channel and reuses it, "video" generates one per video
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "fused")
+# Descriptions are cut to this many characters in prompts
+PROMPT_DESCRIPTION_CHARS = 2000
+
+SUMMARY_GUIDANCE = "Make the summary engaging and informative, easy to follow and free of technical jargon, and pack it with the key takeaways and useful insights of the video. If the video is about crypto, list the tokens it suggests buying or selling and why."
+
+FUSED_SUMMARY_PROMPT = """Summarize the YouTube video "{title}" for someone who hasn't watched it. """ + SUMMARY_GUIDANCE + """
+
+Video description:
+{description}"""
+
+# In fused mode, transcripts of at most PACK_VIDEO_TOKENS are summarized together, several per
+# request, up to PACK_TOKEN_BUDGET transcript tokens and PACK_MAX_VIDEOS videos per request
+PACKING_DISABLED = os.getenv("PACKING_DISABLED", "0") == "1"
+PACK_VIDEO_TOKENS = int(os.getenv("PACK_VIDEO_TOKENS", 1500))
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", 6000))
+PACK_MAX_VIDEOS = int(os.getenv("PACK_MAX_VIDEOS", 8))
+# Packed descriptions are cut shorter than single-video ones
+PACK_DESCRIPTION_CHARS = 500
+
+PACKED_SUMMARY_PROMPT = """Summarize each of the {count} YouTube videos below separately, for someone who hasn't watched them. """ + SUMMARY_GUIDANCE + """
+
+Write the summary of video N between a line "=== SUMMARY N ===" and a line "=== END N ===", for every video in order, and write nothing outside these markers.
+
+{videos}"""
+PACKED_SUMMARY_PATTERN = re.compile(r"^=== SUMMARY (\d+) ===[ \t]*\n(.*?)\n=== END \1 ===[ \t]*$", re.MULTILINE | re.DOTALL)
+
+# Prompts generated per channel in this process, and locks so each is generated once
+channel_prompts = {}
+channel_prompt_locks = {}
+channel_prompts_lock = threading.Lock()
         
 
-def process_all_transcripts(roast=False):
+def process_all_transcripts(roast=False, concurrency=LLM_CONCURRENCY):
     """Processes all transcript files in a specified directory, optionally roasting them.
     
+    Files are rendered concurrently by up to `concurrency` worker threads (LLM calls are
+    rate limited and retried per provider in llm.py). Results are written in filename order,
+    each markdown file atomically, and a JSON file is moved to the processed directory only
+    after its markdown has been written. Progress is recorded in the state index, so finished
+    files are never re-summarized and failed ones are retried with backoff. Each file is
+    claimed with a lease before it is rendered (see work_queue.py), so several processes, on
+    one machine or several sharing the directory, can run this at once without rendering a
+    file twice, and files claimed by a crashed worker are picked up once its lease expires.
+    Transcripts are fingerprinted first; near-duplicates and clips of another file in the same run are
+    rendered after the first wave, so they can reuse its note instead of being summarized
+    again. Short transcripts are summarized several to a request (see plan_packs).
+    
     Args:
         roast (bool, optional): If True, roasts the transcript instead of summarizing. Defaults to False.
+        concurrency (int, optional): Maximum number of files processed at once. Defaults to LLM_CONCURRENCY.
     
     Returns:
         None: This function doesn't return a value, but it produces side effects:
@@ -33,116 +101,807 @@ def process_all_transcripts(roast=False):
     try:
         print("\n\n📝 Processing transcripts...\n")
         
-        # DSPy is already configured in llm.py, so we don't need to do it here
+        # DSPy language models are chosen per call by the router in llm.py
         
         os.makedirs(processed_dir, exist_ok=True)
         os.makedirs(output_dir, exist_ok=True)
         
-        for filename in os.listdir(unprocessed_dir):
-            print(f"📄 Processing {filename}")
-            if filename.endswith(".json"):
-                file_path = os.path.join(unprocessed_dir, filename)
-                
-                with open(file_path, 'r') as file:
-                    video_data = json.load(file)
-                
-                if roast:
-                    markdown_content = roast_transcript(video_data)
+        filenames = sorted(filename for filename in os.listdir(unprocessed_dir) if filename.endswith(".json"))
+        
+        with WorkLeases(unprocessed_dir) as leases:
+            pending = select_pending_files(filenames, leases)
+            
+            waves = plan_waves(pending, 'roast' if roast else 'summary')
+            
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                for wave in waves:
+                    packs = [] if roast else plan_packs(wave)
+                    futures = {}
+                    for pack in packs:
+                        futures.update(submit_pack(executor, pack, leases))
+                    for filename in wave:
+                        if filename not in futures:
+                            futures[filename] = executor.submit(render_claimed_file, filename, leases, roast)
+                    
+                    for filename, future in [(filename, futures[filename]) for filename in wave]:
+                        video_id = os.path.splitext(filename)[0]
+                        try:
+                            rendered = future.result()
+                            if rendered is None:
+                                continue
+                            if not leases.holds(filename):
+                                print(f"⚠️ Another worker took over {filename}, leaving its note to them")
+                                continue
+                            finish_transcript_file(filename, *rendered)
+                        except Exception as e:
+                            print(f"🚨 Error processing {filename}: {e}")
+                            metrics.error('summary', e)
+                            state.record_failure(video_id, 'summary', e)
+                        finally:
+                            leases.release(filename)
+        
+        cache_stats = llm_cache.stats()
+        print(f"🗄️ LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['bypassed']} bypassed")
+        print(f"♻️ Near-duplicates and clips: {dedup_index.reused} notes reused")
+        print(cleaning_stats.report())
+        if stream_stats.report():
+            print(stream_stats.report())
+    except Exception as e:
+        print(f"🚨 Error processing files: {e}")
+        metrics.error('process', e)
+
+
+def fingerprint_video(video_id, video_data):
+    """Adds a video's transcript to the near-duplicate index.
+    
+    Args:
+        video_id (str): The unique identifier of the YouTube video.
+        video_data (dict): Video data from load_video_data.
+    
+    Returns:
+        tuple or None: The transcript's MinHash signature, or None if it is too short to match.
+    """
+    return dedup_index.add(video_id, video_data['transcript'], video_data.get('title', ''), video_data.get('video_url', ''))
 
+
+def plan_waves(filenames, kind):
+    """Splits transcript files into a first wave and near-duplicates of files in the first wave.
+    
+    Args:
+        filenames (list): JSON filenames in the unprocessed directory, in order.
+        kind (str): The kind of note being written, "summary" or "roast".
+    
+    Returns:
+        list: One or two lists of filenames, to be rendered one after the other.
+    """
+    first, second = [], []
+    for filename in filenames:
+        video_id = os.path.splitext(filename)[0]
+        try:
+            video_data = load_video_data(os.path.join(unprocessed_dir, filename))
+            try:
+                fingerprint_video(video_id, video_data)
+            finally:
+                if hasattr(video_data.get('segments'), 'close'):
+                    video_data['segments'].close()
+            duplicate = dedup_index.find_duplicate(video_id, kind)
+        except Exception as e:
+            print(f"🚨 Error fingerprinting {filename}: {e}")
+            duplicate = None
+        # A match without a note yet is (most likely) in this run, so wait for its note
+        if duplicate and duplicate['body'] is None:
+            print(f"🔁 {filename} looks like a {duplicate['match']} of {duplicate['video_id']} ({duplicate['score']:.0%}), rendering it after the first wave")
+            second.append(filename)
+        else:
+            first.append(filename)
+    return [wave for wave in (first, second) if wave]
+
+
+def plan_packs(filenames):
+    """Groups short transcripts so they can be summarized several to a request.
+    
+    Only fused summaries are packed (SUMMARY_MODE "fused"), as they share their instructions.
+    Transcripts of at most PACK_VIDEO_TOKENS tokens are packed in filename order until a pack
+    reaches PACK_TOKEN_BUDGET tokens or PACK_MAX_VIDEOS videos. Near-duplicates that will
+    reuse an existing note are left out, they need no LLM call.
+    
+    Args:
+        filenames (list): JSON filenames in the unprocessed directory, in order.
+    
+    Returns:
+        list: Packs of at least two filenames each; files not in a pack are rendered alone.
+    """
+    if PACKING_DISABLED or SUMMARY_MODE != "fused" or PACK_MAX_VIDEOS < 2:
+        return []
+    packs, pack, pack_tokens = [], [], 0
+    for filename in filenames:
+        video_id = os.path.splitext(filename)[0]
+        try:
+            video_data = load_video_data(os.path.join(unprocessed_dir, filename))
+            try:
+                tokens = estimate_tokens(video_data['transcript'])
+            finally:
+                if hasattr(video_data.get('segments'), 'close'):
+                    video_data['segments'].close()
+            duplicate = dedup_index.find_duplicate(video_id, 'summary')
+        except Exception as e:
+            print(f"🚨 Error sizing {filename}: {e}")
+            continue
+        if tokens > PACK_VIDEO_TOKENS or (duplicate and duplicate['body'] is not None):
+            continue
+        if pack and (pack_tokens + tokens > PACK_TOKEN_BUDGET or len(pack) >= PACK_MAX_VIDEOS):
+            packs.append(pack)
+            pack, pack_tokens = [], 0
+        pack.append(filename)
+        pack_tokens += tokens
+    packs.append(pack)
+    return [pack for pack in packs if len(pack) > 1]
+
+
+def submit_pack(executor, pack, leases):
+    """Renders a pack of transcript files in one request, falling back to one request each.
+    
+    Only the files this worker can claim are rendered; the others resolve to None. Files
+    whose summary can't be parsed from the packed response, or all of them if the request
+    fails, are resubmitted to render_transcript_file.
+    
+    Args:
+        executor (ThreadPoolExecutor): The pool the requests run on.
+        pack (list): JSON filenames from plan_packs.
+        leases (WorkLeases): The leases files are claimed with.
+    
+    Returns:
+        dict: A future per filename, resolving to its markdown filename and content, or None
+            if another worker has the file.
+    """
+    futures = {filename: Future() for filename in pack}
+    
+    def forward(source, target):
+        if source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+    
+    def render_pack():
+        claimed = [filename for filename in pack if claim_file(filename, leases)]
+        try:
+            return claimed, render_packed_files(claimed) if len(claimed) > 1 else {}
+        except Exception as e:
+            print(f"🚨 Error summarizing {len(claimed)} packed transcripts, summarizing them one by one: {e}")
+            return claimed, {}
+    
+    def resolve(pack_future):
+        try:
+            claimed, rendered = pack_future.result()
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+        for filename, future in futures.items():
+            if filename not in claimed:
+                future.set_result(None)
+            elif filename in rendered:
+                future.set_result(rendered[filename])
+            else:
+                if len(claimed) > 1:
+                    metrics.count("pack.fallbacks")
+                executor.submit(render_transcript_file, os.path.join(unprocessed_dir, filename)).add_done_callback(
+                    lambda source, target=future: forward(source, target)
+                )
+    
+    executor.submit(render_pack).add_done_callback(resolve)
+    return futures
+
+
+def select_pending_files(filenames, leases):
+    """Picks the transcript files that still need a note.
+    
+    Files the state index says are finished (e.g. a crash after the markdown was written but
+    before the move) are moved to the processed directory, and files that failed recently and
+    are still backing off are skipped.
+    
+    Args:
+        filenames (list): JSON filenames in the unprocessed directory.
+        leases (WorkLeases): The leases to claim finished files with before moving them.
+    
+    Returns:
+        list: The filenames to render.
+    """
+    known = state.get_many([os.path.splitext(filename)[0] for filename in filenames])
+    pending = []
+    for filename in filenames:
+        row = known.get(os.path.splitext(filename)[0])
+        if row and row['markdown_at']:
+            print(f"⏭️ Markdown for {filename} already written to {row['markdown_path']}")
+            if leases.claim(filename):
+                if os.path.exists(os.path.join(unprocessed_dir, filename)):
+                    move_video_files(filename, unprocessed_dir, processed_dir)
+                leases.release(filename)
+        elif not retry_due(row, stage='summary'):
+            print(f"⏭️ Skipping {filename} until its retry is due ({row['last_error']})")
+        else:
+            pending.append(filename)
+    return pending
+
+
+def claim_file(filename, leases):
+    """Claims a transcript file for this worker, if no other worker has it and it is still there.
+    
+    Args:
+        filename (str): The JSON filename in the unprocessed directory.
+        leases (WorkLeases): The leases to claim it with.
+    
+    Returns:
+        bool: True if this worker should render the file.
+    """
+    if not leases.claim(filename):
+        print(f"⏭️ {filename} is being processed by another worker")
+        return False
+    if not os.path.exists(os.path.join(unprocessed_dir, filename)):
+        # Finished and moved by another worker since the directory was listed
+        leases.release(filename)
+        return False
+    return True
+
+
+def render_claimed_file(filename, leases, roast=False):
+    """Claims a transcript file and renders its note, see render_transcript_file.
+    
+    Args:
+        filename (str): The JSON filename in the unprocessed directory.
+        leases (WorkLeases): The leases to claim it with.
+        roast (bool, optional): If True, roasts the transcript instead of summarizing. Defaults to False.
+    
+    Returns:
+        tuple or None: The markdown filename and content, or None if another worker has the file.
+    """
+    if not claim_file(filename, leases):
+        return None
+    return render_transcript_file(os.path.join(unprocessed_dir, filename), roast)
+
+
+def render_packed_files(filenames):
+    """Summarizes several short transcripts in one request and renders their notes.
+    
+    The videos are numbered in the prompt and the model is asked to answer with one
+    delimited section per video (see PACKED_SUMMARY_PROMPT). Only the videos whose section
+    is found and non-empty are rendered.
+    
+    Args:
+        filenames (list): JSON filenames in the unprocessed directory.
+    
+    Returns:
+        dict: The markdown filename and content of each rendered file, by filename.
+    """
+    videos = []
+    try:
+        for filename in filenames:
+            print(f"📄 Processing {filename} (packed)")
+            video_data = load_video_data(os.path.join(unprocessed_dir, filename))
+            videos.append((filename, video_data, clean_transcript(video_data)))
+        blocks = [
+            f"=== VIDEO {number} ===\nTitle: {llm_data['title']}\n"
+            f"Description: {(llm_data['description'] or '')[:PACK_DESCRIPTION_CHARS]}\n"
+            f"Transcript:\n{llm_data['transcript']}\n=== END VIDEO {number} ==="
+            for number, (_, _, llm_data) in enumerate(videos, 1)
+        ]
+        response = groq_response(PACKED_SUMMARY_PROMPT.format(count=len(videos), videos="\n\n".join(blocks)), temp=0)
+        metrics.count("pack.requests")
+        metrics.count("pack.videos", len(videos))
+        
+        summaries = {int(number): body.strip() for number, body in PACKED_SUMMARY_PATTERN.findall(response)}
+        rendered = {}
+        for number, (filename, video_data, _) in enumerate(videos, 1):
+            summary = summaries.get(number)
+            if not summary:
+                print(f"⚠️ No summary for {filename} in the packed response")
+                continue
+            video_id = os.path.splitext(filename)[0]
+            dedup_index.record_note(video_id, 'summary', summary)
+            state.record_summary(video_id)
+            rendered[filename] = (
+                markdown_filename(video_data['title']),
+                create_markdown_with_frontmatter(format_summary(summary, video_data['transcript']), video_data)
+            )
+        print(f"📦 Summarized {len(rendered)}/{len(videos)} transcripts in one request")
+        return rendered
+    finally:
+        for _, video_data, _ in videos:
+            if hasattr(video_data.get('segments'), 'close'):
+                video_data['segments'].close()
+
+
+def finish_transcript_file(filename, md_filename, markdown_content):
+    """Writes a rendered markdown note and moves its JSON file to the processed directory.
+    
+    Args:
+        filename (str): The JSON filename in the unprocessed directory.
+        md_filename (str): The markdown filename in the output directory.
+        markdown_content (str): The rendered markdown.
+    
+    Returns:
+        str: The path of the written markdown file.
+    """
+    md_file_path = os.path.join(output_dir, md_filename)
+    
+    print(f"\n📝 Writing md to {md_file_path}")
+    write_file_atomic(md_file_path, markdown_content)
+    # The note is in place, so the partial one written while it streamed can go
+    if os.path.exists(partial_path(md_file_path)):
+        os.remove(partial_path(md_file_path))
+    state.record_markdown(os.path.splitext(filename)[0], md_file_path)
+    
+    # Move processed JSON file and its transcript
+    move_video_files(filename, unprocessed_dir, processed_dir)
+    
+    print(f"✅Processed: {filename}\n")
+    return md_file_path
+
+
+def partial_path(md_file_path):
+    """Returns where a note is written while it streams in, next to its final path."""
+    return os.path.splitext(md_file_path)[0] + PARTIAL_SUFFIX
+
+
+class PartialMarkdown:
+    """Keeps a note's partial markdown on disk while its sections stream in from the LLM.
+    
+    Each section (e.g. "summary", or "constructive" and "roast") gets its own updater, to be
+    passed as groq_response's on_delta. The whole note is re-rendered and written atomically
+    at most every interval seconds, so a viewer never sees a torn file.
+    
+    Args:
+        md_file_path (str): The note's final path; the partial note goes next to it.
+        render (callable): Builds the markdown from a {section: text so far} dictionary.
+        interval (float, optional): Minimum seconds between writes. Defaults to MARKDOWN_FLUSH_INTERVAL.
+    """
+    
+    def __init__(self, md_file_path, render, interval=MARKDOWN_FLUSH_INTERVAL):
+        self.path = partial_path(md_file_path)
+        self.render = render
+        self.interval = interval
+        self.sections = {}
+        self.lock = threading.Lock()
+        self.last_write = 0.0
+    
+    def updater(self, section):
+        """Returns an on_delta callback that updates one section."""
+        return lambda text: self.update(section, text)
+    
+    def update(self, section, text):
+        with self.lock:
+            self.sections[section] = text
+            now = time.monotonic()
+            if now - self.last_write < self.interval:
+                return
+            self.last_write = now
+            try:
+                write_file_atomic(self.path, self.render(dict(self.sections)))
+            except Exception as e:
+                # A failed preview write must not fail the LLM call
+                print(f"🚨 Error writing partial note {self.path}: {e}")
+    
+    def discard(self):
+        """Removes the partial note, e.g. after the LLM call failed."""
+        with self.lock:
+            self.last_write = float('inf')
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def render_transcript_file(file_path, roast=False):
+    """Generates the markdown note for one unprocessed transcript file.
+    
+    Args:
+        file_path (str): Path to the video JSON file written by generate_transcripts.
+        roast (bool, optional): If True, roasts the transcript instead of summarizing. Defaults to False.
+    
+    With LLM_STREAM=1 the completions are streamed and the note is kept up to date in a
+    partial file next to its final path, which finish_transcript_file removes once the
+    note has been written.
+    
+    Returns:
+        tuple: The markdown filename and the markdown content.
+    """
+    print(f"📄 Processing {os.path.basename(file_path)}")
+    video_data = load_video_data(file_path)
+    video_id = os.path.splitext(os.path.basename(file_path))[0]
+    kind = 'roast' if roast else 'summary'
+    md_filename = markdown_filename(video_data['title'])
+    partial = None
+    
+    try:
+        fingerprint_video(video_id, video_data)
+        duplicate = dedup_index.find_duplicate(video_id, kind)
+        if duplicate and duplicate['body'] is not None:
+            # A re-upload, clip or cross-post of a video with a note: reuse it, no LLM calls
+            print(f"♻️ Reusing the {kind} of {duplicate['video_id']} for {video_id}, a {duplicate['match']} of it ({duplicate['score']:.0%})")
+            dedup_index.link(video_id, duplicate['video_id'], duplicate['score'])
+            body = duplicate['body']
+            if duplicate['match'] == 'clip':
+                notice = f"> Clip of [{duplicate['title']}]({duplicate['video_url']}) ({duplicate['score']:.0%} of this transcript is in it), its {kind} is reused.\n\n"
+            else:
+                notice = f"> Near-duplicate of [{duplicate['title']}]({duplicate['video_url']}) ({duplicate['score']:.0%} similar transcript), its {kind} is reused.\n\n"
+        else:
+            # The prompts get a cleaned transcript; the note keeps the original
+            llm_data = clean_transcript(video_data)
+            if LLM_STREAM:
+                if roast:
+                    render = lambda sections: roast_transcript(video_data, feedback=format_feedback(sections.get('constructive', ''), sections.get('roast', '')))
                 else:
-                    summary = process_transcript(
-                        video_data['transcript'],
-                        video_data['title'],
-                        video_data['description']
-                    )
+                    render = lambda sections: create_markdown_with_frontmatter(format_summary(sections.get('summary', ''), video_data['transcript']), video_data)
+                partial = PartialMarkdown(os.path.join(output_dir, md_filename), render)
+            if roast:
+                body = roast_feedback(llm_data, partial=partial)
+            else:
+                body = summarize_video(
+                    llm_data['transcript'],
+                    llm_data['title'],
+                    llm_data['description'],
+                    segments=llm_data.get('segments'),
+                    on_delta=partial.updater('summary') if partial else None,
+                    channel=llm_data.get('channel_name')
+                )
+            dedup_index.record_note(video_id, kind, body)
+            notice = ""
+        if roast:
+            markdown_content = roast_transcript(video_data, feedback=notice + body)
+        else:
+            markdown_content = create_markdown_with_frontmatter(format_summary(notice + body, video_data['transcript']), video_data)
+    except Exception:
+        if partial:
+            partial.discard()
+        raise
+    finally:
+        if hasattr(video_data.get('segments'), 'close'):
+            video_data['segments'].close()
+    state.record_summary(os.path.splitext(os.path.basename(file_path))[0])
+    
+    return md_filename, markdown_content
 
-                    markdown_content = create_markdown_with_frontmatter(summary, video_data)
-                    
 
-                # Create markdown filename
-                md_filename = video_data['title'][:100]  # Limit length to first 100 characters
-                md_filename = ''.join(c if c.isalnum() or c in [' ', '-', '_'] else '_' for c in md_filename)
-                md_filename = md_filename.strip() + ".md"
-                md_file_path = os.path.join(output_dir, md_filename)
-                
-                print(f"\n📝 Writing md to {md_file_path}")
-                with open(md_file_path, 'w') as md_file:
-                    md_file.write(markdown_content)
-                    
-                    
-                # Move processed JSON file
-                shutil.move(file_path, os.path.join(processed_dir, filename))
+def markdown_filename(title):
+    """Builds a filesystem-safe markdown filename from a video title.
+    
+    Args:
+        title (str): The title of the video.
+    
+    Returns:
+        str: The title limited to 100 characters, with unsafe characters replaced, plus ".md".
+    """
+    md_filename = title[:100]  # Limit length to first 100 characters
+    md_filename = ''.join(c if c.isalnum() or c in [' ', '-', '_'] else '_' for c in md_filename)
+    return md_filename.strip() + ".md"
+
+
+def write_file_atomic(path, content):
+    """Writes a text file atomically by writing a temp file and renaming it into place.
+    
+    Args:
+        path (str): The destination path.
+        content (str): The text to write.
+    
+    Returns:
+        None
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
 
-                print(f"✅Processed: {filename}\n")
-    except Exception as e:
-        print(f"🚨 Error processing files: {e}")
             
-def process_transcript(transcript, title, description):
+def process_transcript(transcript, title, description, segments=None):
     """Processes a YouTube video transcript and generates a summary.
     
     Args:
         transcript (str): The full transcript of the YouTube video.
         title (str): The title of the YouTube video.
         description (str): The description of the YouTube video.
+        segments (list, optional): Timestamped transcript segments, used to chunk long transcripts.
     
     Returns:
         str: A formatted markdown string containing the generated summary and the full transcript.
     """
-    print(f"\nProcessing transcript for {title}\n")
-    summarizer = YouTubeSummarizer()
+    return format_summary(summarize_video(transcript, title, description, segments), transcript)
+
+
+def summarize_video(transcript, title, description, segments=None, on_delta=None, channel=None):
+    """Picks a summarization prompt for a video and summarizes its transcript with it.
     
-    result = summarizer(title=title, description=description)
-    print(f"🤖 Generated summary prompt: {result.summarization_prompt}")
+    See summarization_prompt_for for how the prompt is chosen (SUMMARY_MODE).
     
-    # Generate a summary from the summarization prompt
-    summary = groq_response(result.summarization_prompt, temp=0)
+    Args:
+        transcript (str): The full transcript of the YouTube video.
+        title (str): The title of the YouTube video.
+        description (str): The description of the YouTube video.
+        segments (list, optional): Timestamped transcript segments, used to chunk long transcripts.
+        on_delta (callable, optional): Streams the summary, see summarize_transcript.
+        channel (str, optional): The channel name, for reusing prompts per channel.
+    
+    Returns:
+        str: The summary.
+    """
+    print(f"\nProcessing transcript for {title}\n")
+    summarization_prompt = summarization_prompt_for(title, description, channel)
+    print(f"🤖 Summary prompt: {summarization_prompt}")
+    
+    # Generate a summary of the transcript from the summarization prompt
+    summary = summarize_transcript(summarization_prompt, transcript, segments, on_delta=on_delta)
     print(f"\nSummary: {summary}...")
+    return summary
+
+
+def format_summary(summary, transcript):
+    """Formats a summary and the full transcript as the markdown body of a note.
     
+    Args:
+        summary (str): The summary.
+        transcript (str): The full transcript.
     
+    Returns:
+        str: The "Summary" and "Transcript" sections.
+    """
     md_data = f"""
 
 ## Summary
-"""Creates a Markdown string with frontmatter containing video metadata and summary.
-
-Args:
-    summary (str): A summary of the video content.
-    video_data (dict): A dictionary containing video metadata with keys:
-        'title', 'channel_name', 'view_count', 'publish_date', 'description',
-        'thumbnail', and 'video_url'.
-
-Returns:
-    str: A formatted Markdown string with frontmatter and video information.
-"""
 {summary}
         
 ## Transcript
 {transcript}
     """
-    Initialize a new instance of the class.
     
-    This method initializes the object by calling the superclass's __init__ method and setting up a summarization prompt generator using dspy.ChainOfThought.
+    return md_data
+
+
+def chunk_label(chunk, index, total):
+    """Describes a transcript chunk's position for use in a prompt.
     
     Args:
-        None
+        chunk (dict): A chunk from chunk_transcript.
+        index (int): The chunk's position, starting at 1.
+        total (int): The number of chunks.
     
     Returns:
-        None
+        str: For example "part 2/5 of the transcript, starting at 12:30".
     """
+    label = f"part {index}/{total} of the transcript"
+    if chunk['start'] is not None:
+        label += f", starting at {format_timestamp(chunk['start'])}"
+    return label
+
+
+def summarize_transcript(summarization_prompt, transcript, segments=None, on_delta=None):
+    """Summarizes a transcript with the given prompt, using map-reduce for long transcripts.
+    
+    Transcripts that fit in one chunk are summarized in a single call. Longer ones are split
+    on segment boundaries, each chunk is summarized in parallel, and the partial summaries are
+    merged hierarchically into the final summary.
+    
+    Args:
+        summarization_prompt (str): The instructions for the summary.
+        transcript (str): The full transcript text.
+        segments (list, optional): Timestamped transcript segments.
+        on_delta (callable, optional): If given, the call that produces the summary (the single
+            call, or the final reduce) is streamed and on_delta gets the summary so far.
+    
+    Returns:
+        str: The summary.
     """
+    chunks = chunk_transcript(transcript, segments)
+    if len(chunks) <= 1:
+        return groq_response(f"{summarization_prompt}\n\nTranscript:\n{transcript}", temp=0, on_delta=on_delta)
     
-    return md_data
+    print(f"✂️ Transcript is ~{estimate_tokens(transcript)} tokens, summarizing {len(chunks)} chunks")
+    
+    def map_prompt(chunk, index, total):
+        return f"""{summarization_prompt}
 
+Below is {chunk_label(chunk, index, total)}. Summarize the key points, takeaways and insights of this part only, noting the timestamps of important moments.
 
-"""Generates a summarization prompt based on the given title and description.
+Transcript:
+{chunk['text']}"""
+    
+    def reduce_prompt(partial_summaries, final):
+        joined = "\n\n---\n\n".join(partial_summaries)
+        if final:
+            return f"""{summarization_prompt}
+
+Below are summaries of consecutive parts of the video, in order. Combine them into a single summary that follows the instructions above.
+
+Partial summaries:
+{joined}"""
+        return f"""Below are summaries of consecutive parts of a video, in order. Merge them into one summary of that stretch of the video, keeping every key point, takeaway and timestamp.
+
+Partial summaries:
+{joined}"""
+    
+    return map_reduce(chunks, map_prompt, reduce_prompt, lambda prompt: groq_response(prompt, temp=0),
+                      final_llm=lambda prompt: groq_response(prompt, temp=0, on_delta=on_delta))
+
+
+def condense_transcript(video_data, max_tokens=ROAST_TRANSCRIPT_TOKENS):
+    """Returns the transcript, condensed into timestamped notes with map-reduce if it is too long to inline.
+    
+    Args:
+        video_data (dict): A dictionary containing video information and transcript data.
+        max_tokens (int, optional): The largest transcript inlined as-is. Defaults to ROAST_TRANSCRIPT_TOKENS.
+    
+    Returns:
+        str: The transcript, or detailed notes covering it within max_tokens.
+    """
+    transcript = video_data['transcript']
+    if estimate_tokens(transcript) <= max_tokens:
+        return transcript
+    
+    chunks = chunk_transcript(transcript, video_data.get('segments'))
+    print(f"✂️ Transcript is ~{estimate_tokens(transcript)} tokens, condensing {len(chunks)} chunks")
+    
+    def map_prompt(chunk, index, total):
+        return f"""Below is {chunk_label(chunk, index, total)} of the podcast "{video_data['title']}". Write detailed notes on it: topics covered, how the hosts deliver them, and notable quotes verbatim with their timestamps.
+
+Transcript:
+{chunk['text']}"""
+    
+    def reduce_prompt(partial_notes, final):
+        joined = "\n\n---\n\n".join(partial_notes)
+        return f"""Below are notes on consecutive parts of the podcast "{video_data['title']}", in order. Merge them into one set of notes, keeping the topics, delivery observations, and notable quotes with their timestamps.
+
+Notes:
+{joined}"""
+    
+    return map_reduce(chunks, map_prompt, reduce_prompt, lambda prompt: groq_response(prompt, temp=0), reduce_tokens=max_tokens)
+
+
+def summarization_prompt_for(title, description, channel=None, mode=None):
+    """Returns the instructions a video's summary is written from.
+    
+    In "fused" mode they are FUSED_SUMMARY_PROMPT filled in with the title and description, so
+    the summary takes a single LLM call. In "channel" mode the DSPy program writes a prompt
+    for the channel from its first video, which later videos of the channel reuse; in "video"
+    mode it writes one for every video, at the cost of an extra call each.
+    
+    Args:
+        title (str): The title of the YouTube video.
+        description (str): The description of the YouTube video.
+        channel (str, optional): The channel name. Without one, "channel" mode falls back to "video".
+        mode (str, optional): "fused", "channel" or "video". Defaults to SUMMARY_MODE.
+    
+    Returns:
+        str: The summarization prompt.
+    """
+    mode = mode or SUMMARY_MODE
+    description = (description or '')[:PROMPT_DESCRIPTION_CHARS]
+    if mode == "channel" and channel:
+        return generate_channel_prompt(channel, title, description)
+    if mode in ("channel", "video"):
+        return generate_summarization_prompt(title, description)
+    return FUSED_SUMMARY_PROMPT.format(title=title, description=description)
+
+
+def create_summarizer():
+    """Loads the DSPy summarizer once, compiled if compile_summarization_prompts saved it."""
+    # DSPy takes seconds to import, so it is only loaded once a prompt is needed
+    from summarizer import load_summarizer
+    return load_summarizer()
+
+
+# One summarizer is shared by every file and thread
+get_summarizer = lazy_client("DSPy summarizer", create_summarizer)
+
+
+def summarizer_cache_prompt():
+    """Describes the summarizer for the LLM cache key: its instructions and compiled state."""
+    from summarizer import SummarizationPromptGenerator
+    version = get_summarizer().version
+    return f"dspy.ChainOfThought:{SummarizationPromptGenerator.__doc__}" + (f":{version}" if version else "")
+
+
+def generate_summarization_prompt(title, description):
+    """Generates a summarization prompt with YouTubeSummarizer, using the LLM cache.
+    
+    The cache key covers the model, the signature's instructions, the compiled state and the
+    inputs, so editing SummarizationPromptGenerator or recompiling invalidates previously
+    cached prompts.
+    
+    Args:
+        title (str): The title of the YouTube video.
+        description (str): The description of the YouTube video.
+    
+    Returns:
+        str: The generated summarization prompt.
+    """
+    summarizer = get_summarizer()
+    
+    def generate():
+        with metrics.span("dspy.summarization_prompt"):
+            return call_dspy(lambda: summarizer(title=title, description=description),
+                             prompt_tokens=estimate_tokens(title + description)).summarization_prompt
+    
+    return llm_cache.cached(
+        router.cache_model,
+        0,
+        summarizer_cache_prompt(),
+        json.dumps({'title': title, 'description': description}, ensure_ascii=False),
+        generate
+    )
+
+
+def generate_channel_prompt(channel, title, description):
+    """Returns the summarization prompt shared by a channel's videos, generating it once.
+    
+    The prompt is written by the DSPy program from the first video seen of the channel, with
+    the channel named as the subject, and kept in the LLM cache under the channel name, so
+    later runs reuse it too. Calls for the same channel are serialized, so concurrent first
+    calls wait for one generation.
+    
+    Args:
+        channel (str): The channel name.
+        title (str): The title of the video that needs the prompt.
+        description (str): Its description.
+    
+    Returns:
+        str: The channel's summarization prompt.
+    """
+    with channel_prompts_lock:
+        lock = channel_prompt_locks.setdefault(channel, threading.Lock())
+    with lock:
+        if channel not in channel_prompts:
+            summarizer = get_summarizer()
+            channel_title = f"Videos of the YouTube channel {channel}, such as: {title}"
+            
+            def generate():
+                with metrics.span("dspy.channel_prompt", channel=channel):
+                    return call_dspy(lambda: summarizer(title=channel_title, description=description),
+                                     prompt_tokens=estimate_tokens(channel_title + description)).summarization_prompt
+            
+            channel_prompts[channel] = llm_cache.cached(router.cache_model, 0, f"channel:{summarizer_cache_prompt()}", channel, generate)
+        else:
+            metrics.count("dspy.channel_prompt_reused")
+    return channel_prompts[channel]
+
+
+def compile_summarization_prompts(limit=50):
+    """Compiles the DSPy summarizer on the stored videos and saves it for later runs.
+    
+    Args:
+        limit (int, optional): The maximum number of training videos, newest first. Defaults to 50.
+    
+    Returns:
+        None
+    """
+    from summarizer import compile_summarizer
+    paths = [
+        os.path.join(directory, filename)
+        for directory in (processed_dir, unprocessed_dir) if os.path.isdir(directory)
+        for filename in os.listdir(directory) if filename.endswith(".json")
+    ]
+    videos = []
+    for path in sorted(paths, key=os.path.getmtime, reverse=True)[:limit]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                video_data = json.load(f)
+            videos.append({'title': video_data['title'], 'description': (video_data.get('description') or '')[:PROMPT_DESCRIPTION_CHARS]})
+        except (OSError, ValueError, KeyError) as e:
+            print(f"🚨 Skipping {path}: {e}")
+    if not videos:
+        print("No stored videos to compile the summarizer with")
+        return
+    with metrics.span("dspy.compile", videos=len(videos)):
+        call_dspy(lambda: compile_summarizer(videos))
 
-Args:
-    title (str): The title of the content to be summarized.
-    description (str): The description or content to be summarized.
 
-Returns:
-    dspy.Prediction: A prediction object containing the generated summarization prompt.
-"""
 def create_markdown_with_frontmatter(summary, video_data):
+    """Creates a Markdown string with frontmatter containing video metadata and summary.
+    
+    Args:
+        summary (str): A summary of the video content.
+        video_data (dict): A dictionary containing video metadata with keys:
+            'title', 'channel_name', 'view_count', 'publish_date', 'description',
+            'thumbnail', and 'video_url'.
+    
+    Returns:
+        str: A formatted Markdown string with frontmatter and video information.
+    """
     frontmatter = f"""---
 title: "{video_data['title']}"
 channel_name: "{video_data['channel_name']}"
@@ -162,56 +921,61 @@ Published: {datetime.fromisoformat(video_data['publish_date']).strftime('%B %d,
     return frontmatter
 
 
-class SummarizationPromptGenerator(dspy.Signature):
-    """Given the title and description of a YouTube video, generate a summarization prompt to be used with an AI assistant. The prompt should be specific to the video title and description, and aim to provide an engaging and informative summary of the video's content. Make the prompt in a way that is easy to understand and follow, and avoid using technical jargon or complex language, and remember that the general idea here is to make a prompt so that the AI can create the best possible summary of the video, packed with key takeaways and useful insights. If the video is about crypto, make sure to include actions to extract the tokens to buy or sell and why in the prompt"""
-    title = dspy.InputField()
-    description = dspy.InputField()
-    summarization_prompt = dspy.OutputField()
-
+def roast_transcript(video_data, feedback=None):
+    """Generates a markdown-formatted analysis of a video transcript, including constructive feedback and a comedic roast.
+    
+    Args:
+        video_data (dict): A dictionary containing video information and transcript data.
+        feedback (str, optional): The feedback and roast sections, e.g. reused from a
+            near-duplicate. Generated with roast_feedback if None.
     
+    Returns:
+        str: A markdown-formatted string containing video details, constructive feedback, and a comedic roast.
+    """
+    if feedback is None:
+        feedback = roast_feedback(video_data)
     
-class YouTubeSummarizer(dspy.Module):
-    def __init__(self):
-        super().__init__()
-        self.summarization_prompt_generator = dspy.ChainOfThought(SummarizationPromptGenerator)
+    md_data = f"""
+## {video_data['channel_name']}
+### Views: {video_data["view_count"]}
+### Likes: {video_data["like_count"]}
+### Comments: {video_data["comment_count"]}
+### Duration: {video_data["duration"]}
+Published: {datetime.fromisoformat(video_data['publish_date']).strftime('%B %d, %Y')}, Processed: {datetime.now().strftime('%B %d, %Y')}
 
-    def forward(self, title, description):
-        # Create a summarization prompt
-        """Generates a markdown-formatted analysis of a video transcript, including constructive feedback and a comedic roast.
-        
-        Args:
-            video_data (dict): A dictionary containing video information and transcript data.
-        
-        Returns:
-            str: A markdown-formatted string containing video details, constructive feedback, and a comedic roast.
-        """
-        summarization_prompt = self.summarization_prompt_generator(title=title, description=description)
+[![Thumbnail]({video_data['thumbnail']})]({video_data['video_url']})
         
-        return dspy.Prediction(summarization_prompt=summarization_prompt.summarization_prompt)
-    
-    
-    
-    
+{feedback}"""
+    return md_data
+
 
-def roast_transcript(video_data):
+def roast_feedback(video_data, partial=None):
+    """Generates constructive feedback and a comedic roast of a video transcript.
+    
+    Args:
+        video_data (dict): A dictionary containing video information and transcript data.
+        partial (PartialMarkdown, optional): Streams both calls into its "constructive" and
+            "roast" sections.
     
+    Returns:
+        str: The "Constructive Feedback" and "ROAST" markdown sections.
+    """
     useful_video_data = f"""
     Video views: {video_data["view_count"]}
     Likes: {video_data["like_count"]}
     Comments: {video_data["comment_count"]}
     Duration: {video_data["duration"]}
     Transcript:
-    {video_data["transcript"]} """
+    {condense_transcript(video_data)} """
     
-    constructive = groq_response(f"""You are a professional YouTuber and esteemed podcast host. Two aspiring podcasters have given you a podcast transcript from their latest episode: {video_data["title"]}, you have been tasked with giving constructive feedback. They are seeking actionable advice on how to improve the podcast. From growth tips like YouTube SEO, to delivery and content, nothing is off the table. What went well, what could improve, they want any and all feedback to improve their skills and final product. Format all responses as markdown, and remember to to be constructive and positive!
+    constructive_prompt = f"""You are a professional YouTuber and esteemed podcast host. Two aspiring podcasters have given you a podcast transcript from their latest episode: {video_data["title"]}, you have been tasked with giving constructive feedback. They are seeking actionable advice on how to improve the podcast. From growth tips like YouTube SEO, to delivery and content, nothing is off the table. What went well, what could improve, they want any and all feedback to improve their skills and final product. Format all responses as markdown, and remember to to be constructive and positive!
 
     {useful_video_data}
-   """, temp=0.5)
-    print(f"\nConstructive feedback: {constructive[:50]}...")
+   """
 
 
     # ROAST 'EM!!!
-    roast = groq_response(f"""You're a witty comedian at a roast battle. Two aspiring podcasters have given you a podcast transcript from their latest episode: {video_data["title"]}, your job is to roast them. Comedy central style. Don't be afraid to give 'em a good ROAST!
+    roast_prompt = f"""You're a witty comedian at a roast battle. Two aspiring podcasters have given you a podcast transcript from their latest episode: {video_data["title"]}, your job is to roast them. Comedy central style. Don't be afraid to give 'em a good ROAST!
     
     Remember to:
     1. Keep it clever and creative - puns and wordplay are your friends.
@@ -221,23 +985,32 @@ def roast_transcript(video_data):
     5. End with a light-hearted encouragement to keep improving.
 
     Use this info to fuel your roast:
-    {useful_video_data}""", temp=1)
-    print(f"\nRoast: {roast[:50]}...")
-    
+    {useful_video_data}"""
     
+    # The two calls are independent, so run them side by side
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        constructive_future = executor.submit(groq_response, constructive_prompt, temp=0.5,
+                                              on_delta=partial.updater('constructive') if partial else None)
+        roast_future = executor.submit(groq_response, roast_prompt, temp=1,
+                                       on_delta=partial.updater('roast') if partial else None)
+        constructive = constructive_future.result()
+        roast = roast_future.result()
+    print(f"\nConstructive feedback: {constructive[:50]}...")
+    print(f"\nRoast: {roast[:50]}...")
+    return format_feedback(constructive, roast)
+
+
+def format_feedback(constructive, roast):
+    """Formats constructive feedback and a roast as markdown sections.
     
+    Args:
+        constructive (str): The constructive feedback.
+        roast (str): The roast.
     
-    md_data = f"""
-## {video_data['channel_name']}
-### Views: {video_data["view_count"]}
-### Likes: {video_data["like_count"]}
-### Comments: {video_data["comment_count"]}
-### Duration: {video_data["duration"]}
-Published: {datetime.fromisoformat(video_data['publish_date']).strftime('%B %d, %Y')}, Processed: {datetime.now().strftime('%B %d, %Y')}
-
-[![Thumbnail]({video_data['thumbnail']})]({video_data['video_url']})
-        
-## Constructive Feedback
+    Returns:
+        str: The "Constructive Feedback" and "ROAST" sections.
+    """
+    md_data = f"""## Constructive Feedback
 {constructive}
         
 ## ROAST 🔥
@@ -0,0 +1,265 @@
+import os
+import threading
+from datetime import datetime, timezone
+from metrics import metrics
+from playlist_mutations import http_status
+from state import state
+
+try:
+    from zoneinfo import ZoneInfo
+    # The YouTube Data API quota resets at midnight Pacific Time
+    QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+except Exception:
+    QUOTA_TIMEZONE = timezone.utc
+
+# Units the project may spend per day (the default allocation is 10,000)
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", 10000))
+# Share of the daily quota that normal and low priority calls leave for higher priority ones
+QUOTA_RESERVE_NORMAL = float(os.getenv("QUOTA_RESERVE_NORMAL", 0.05))
+QUOTA_RESERVE_LOW = float(os.getenv("QUOTA_RESERVE_LOW", 0.25))
+
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+# Unit cost of each method, from the YouTube Data API quota calculator; anything else costs 1
+QUOTA_COSTS = {
+    'search.list': 100,
+    'playlistItems.insert': 50,
+    'playlistItems.update': 50,
+    'playlistItems.delete': 50,
+    'playlists.insert': 50,
+    'playlists.update': 50,
+    'playlists.delete': 50,
+    'videos.update': 50,
+    'videos.insert': 1600,
+}
+
+# Metadata and playlist reads for queued videos come first. Discovery inserts can wait for
+# tomorrow's quota, and so can search and playlist cleanup: a video whose transcript is saved
+# is removed on a later run.
+METHOD_PRIORITIES = {
+    'playlistItems.insert': PRIORITY_NORMAL,
+    'playlistItems.delete': PRIORITY_LOW,
+    'search.list': PRIORITY_LOW,
+}
+
+
+class QuotaDeferred(Exception):
+    """Raised instead of making a YouTube API call that the remaining quota can't cover.
+
+    It carries a 403 status, like the API's own quotaExceeded error, so callers treat it as a
+    failure that retrying today won't fix.
+    """
+
+    status_code = 403
+
+
+def is_quota_exceeded(error):
+    """Checks whether a YouTube API error means the daily quota is used up."""
+    return http_status(error) == 403 and ('quotaExceeded' in str(error) or 'dailyLimitExceeded' in str(error))
+
+
+class QuotaTracker:
+    """Accounts YouTube API calls against the daily quota, persisted in the state index.
+
+    A call is allowed if, after it, the quota left is at least the reserve of its priority:
+    high priority calls may spend everything, normal ones leave QUOTA_RESERVE_NORMAL of the
+    quota and low ones QUOTA_RESERVE_LOW.
+
+    Args:
+        store (StateIndex): Where usage is persisted.
+        daily_quota (int): Units available per day.
+    """
+
+    def __init__(self, store, daily_quota=YOUTUBE_DAILY_QUOTA):
+        self.store = store
+        self.daily_quota = daily_quota
+        self.lock = threading.Lock()
+        self.reserves = {
+            PRIORITY_HIGH: 0,
+            PRIORITY_NORMAL: int(daily_quota * QUOTA_RESERVE_NORMAL),
+            PRIORITY_LOW: int(daily_quota * QUOTA_RESERVE_LOW),
+        }
+
+    def today(self):
+        """Returns the current quota day, in Pacific Time."""
+        return datetime.now(QUOTA_TIMEZONE).strftime('%Y-%m-%d')
+
+    def usage(self, day=None):
+        """Returns a day's usage per method, as {'calls', 'units'} dictionaries. Defaults to today."""
+        return self.store.get_quota_usage(day or self.today())
+
+    def used(self, day=None):
+        """Returns the units spent on a day. Defaults to today."""
+        return sum(entry['units'] for entry in self.usage(day).values())
+
+    def remaining(self):
+        """Returns the units left today."""
+        return max(0, self.daily_quota - self.used())
+
+    def charge(self, methods):
+        """Records calls about to be made, or refuses them if the quota can't cover them.
+
+        Args:
+            methods (list): Method names such as "videos.list", one per call. They are charged
+                together, at the priority of the most important one.
+
+        Returns:
+            int: The units charged.
+
+        Raises:
+            QuotaDeferred: If the calls would dip into the reserve of their priority.
+        """
+        usage = {}
+        for method in methods:
+            calls, units = usage.get(method, (0, 0))
+            usage[method] = (calls + 1, units + QUOTA_COSTS.get(method, 1))
+        cost = sum(units for _, units in usage.values())
+        priorities = [METHOD_PRIORITIES.get(method, PRIORITY_HIGH) for method in usage]
+        reserve = min(self.reserves[priority] for priority in priorities)
+        with self.lock:
+            day = self.today()
+            remaining = self.daily_quota - self.used(day)
+            if remaining - cost < reserve:
+                raise QuotaDeferred(
+                    f"YouTube quota: {', '.join(sorted(usage))} needs {cost} units, "
+                    f"{remaining} left today and {reserve} reserved for higher priority calls"
+                )
+            self.store.add_quota_usage(day, usage)
+        return cost
+
+    def mark_exhausted(self):
+        """Records that the API reported the quota as used up, so no more calls are made today."""
+        with self.lock:
+            day = self.today()
+            left = self.daily_quota - self.used(day)
+            if left > 0:
+                self.store.add_quota_usage(day, {'quotaExceeded': (0, left)})
+
+
+class QuotaTrackedRequest:
+    """Wraps an API request so executing it is charged to the quota tracker."""
+
+    def __init__(self, method, request, tracker):
+        self.method = method
+        self.request = request
+        self.tracker = tracker
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+    def execute(self, *args, **kwargs):
+        try:
+            self.tracker.charge([self.method])
+        except QuotaDeferred:
+            metrics.count("youtube.deferred")
+            raise
+        try:
+            with metrics.span(f"youtube.{self.method}") as span:
+                try:
+                    return self.request.execute(*args, **kwargs)
+                except Exception as e:
+                    span['not_modified'] = http_status(e) == 304
+                    raise
+        except Exception as e:
+            if is_quota_exceeded(e):
+                self.tracker.mark_exhausted()
+            raise
+
+
+class QuotaTrackedResource:
+    """Wraps an API collection such as playlistItems() so the requests it builds are tracked."""
+
+    def __init__(self, name, resource, tracker):
+        self.name = name
+        self.resource = resource
+        self.tracker = tracker
+
+    def __getattr__(self, method):
+        build = getattr(self.resource, method)
+        if method.endswith('_next'):
+            # list_next(previous_request, previous_response) pages on from a tracked request
+            def next_page(previous_request, previous_response):
+                request = build(getattr(previous_request, 'request', previous_request), previous_response)
+                return request and QuotaTrackedRequest(f"{self.name}.{method[:-len('_next')]}", request, self.tracker)
+            return next_page
+
+        def tracked(*args, **kwargs):
+            return QuotaTrackedRequest(f"{self.name}.{method}", build(*args, **kwargs), self.tracker)
+        return tracked
+
+
+class QuotaTrackedBatch:
+    """Wraps a batch request; all of its calls are charged together when it is executed."""
+
+    def __init__(self, batch, tracker):
+        self.batch = batch
+        self.tracker = tracker
+        self.methods = []
+
+    def add(self, request, request_id=None, **kwargs):
+        self.methods.append(request.method)
+        self.batch.add(request.request, request_id=request_id, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        try:
+            self.tracker.charge(self.methods)
+        except QuotaDeferred:
+            metrics.count("youtube.deferred", len(self.methods))
+            raise
+        try:
+            with metrics.span("youtube.batch", calls=len(self.methods)):
+                return self.batch.execute(*args, **kwargs)
+        except Exception as e:
+            if is_quota_exceeded(e):
+                self.tracker.mark_exhausted()
+            raise
+
+
+class QuotaTrackedYouTube:
+    """Wraps a YouTube API client so every call it makes is accounted against the daily quota.
+
+    Collections (playlistItems(), videos(), ...) and batch requests behave like the wrapped
+    client's; executing a request first charges its unit cost and raises QuotaDeferred if the
+    remaining quota is reserved for more important calls.
+
+    Args:
+        youtube (googleapiclient.discovery.Resource): The client to wrap.
+        tracker (QuotaTracker): The quota tracker to charge.
+    """
+
+    def __init__(self, youtube, tracker):
+        self.youtube = youtube
+        self.tracker = tracker
+
+    def new_batch_http_request(self, **kwargs):
+        return QuotaTrackedBatch(self.youtube.new_batch_http_request(**kwargs), self.tracker)
+
+    def __getattr__(self, name):
+        collection = getattr(self.youtube, name)
+
+        def tracked(*args, **kwargs):
+            return QuotaTrackedResource(name, collection(*args, **kwargs), self.tracker)
+        return tracked
+
+
+def print_quota_report(tracker):
+    """Prints today's YouTube API quota usage per method and the headroom left.
+
+    Args:
+        tracker (QuotaTracker): The quota tracker to report on.
+
+    Returns:
+        None
+    """
+    usage = tracker.usage()
+    print(f"\n📊 YouTube API quota for {tracker.today()} (Pacific Time)")
+    for method, entry in sorted(usage.items(), key=lambda item: -item[1]['units']):
+        print(f"  {method:<24} {entry['calls']:>6} calls {entry['units']:>7} units")
+    remaining = tracker.remaining()
+    print(f"  {'remaining':<24} {remaining:>20} of {tracker.daily_quota} units"
+          f" ({remaining // QUOTA_COSTS['playlistItems.insert']} playlist inserts or deletes)\n")
+
+
+youtube_quota = QuotaTracker(state)
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """A thread-safe token-bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Each call to
+    acquire() takes one token, blocking until one is available, so bursts of up to
+    `capacity` calls go through immediately and the sustained rate never exceeds `rate`.
+
+    Args:
+        rate (float or None): Tokens added per second. None or <= 0 disables limiting.
+        capacity (float, optional): Maximum burst size. Defaults to max(1, rate).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate if rate and rate > 0 else None
+        self.capacity = capacity if capacity else max(1.0, self.rate or 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` tokens are available, then consumes them.
+
+        Args:
+            tokens (float, optional): The number of tokens to consume. Defaults to 1.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        if self.rate is None:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
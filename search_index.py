@@ -0,0 +1,357 @@
+import os
+import re
+import sqlite3
+import time
+import zlib
+from chunking import format_timestamp
+from transcript_store import load_video_data
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+transcripts_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts")
+
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", os.path.join(base_dir, "experiments", "youtube", "search.sqlite"))
+# Transcript segments are indexed in windows of about this many seconds
+WINDOW_SECONDS = 30
+# Dimensions of the hashed bag-of-words vectors used for similarity search
+VECTOR_DIMS = 512
+
+TOKEN_PATTERN = re.compile(r"[^\W_]{2,}", re.UNICODE)
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or our
+she so that the their them then there these they this to was we were what when which who will with you your
+""".split())
+
+
+def connect(path=SEARCH_DB_PATH):
+    """Opens the search database, creating its tables if needed.
+
+    Args:
+        path (str, optional): Path of the SQLite database. Defaults to SEARCH_DB_PATH.
+
+    Returns:
+        sqlite3.Connection: The open connection.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS indexed_files (
+            video_id TEXT PRIMARY KEY,
+            mtime REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            title TEXT,
+            channel_name TEXT,
+            publish_date TEXT,
+            video_url TEXT,
+            fts_rowid INTEGER,
+            first_segment_rowid INTEGER,
+            last_segment_rowid INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS video_vectors (
+            video_id TEXT PRIMARY KEY,
+            vector BLOB NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS video_fts USING fts5(
+            video_id UNINDEXED, title, description, channel_name
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS segment_fts USING fts5(
+            video_id UNINDEXED, start UNINDEXED, text
+        );
+    """)
+    return conn
+
+
+def segment_windows(segments, window_seconds=WINDOW_SECONDS):
+    """Merges consecutive transcript segments into windows of about window_seconds.
+
+    Args:
+        segments (iterable): Dictionaries with 'text' and 'start' keys.
+        window_seconds (float, optional): The target window length. Defaults to WINDOW_SECONDS.
+
+    Returns:
+        list: (start, text) tuples.
+    """
+    windows, texts, window_start = [], [], None
+    for segment in segments:
+        if window_start is None:
+            window_start = segment['start']
+        elif segment['start'] - window_start >= window_seconds:
+            windows.append((window_start, ' '.join(texts)))
+            texts, window_start = [], segment['start']
+        texts.append(segment['text'])
+    if texts:
+        windows.append((window_start, ' '.join(texts)))
+    return windows
+
+
+def tokenize(text):
+    """Splits text into lowercase word tokens, dropping stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def embed(text, dims=VECTOR_DIMS):
+    """Builds an L2-normalized hashed bag-of-words vector (unigrams and bigrams) for a text.
+
+    This is a lexical similarity embedding: it needs no model, and texts that share many
+    words and phrases end up close together.
+
+    Args:
+        text (str): The text to embed.
+        dims (int, optional): The vector size. Defaults to VECTOR_DIMS.
+
+    Returns:
+        numpy.ndarray: A float32 vector of length dims.
+    """
+    tokens = tokenize(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features), dtype=np.uint32, count=len(features))
+    vector = np.zeros(dims, dtype=np.float32)
+    # The top hash bit picks the sign, which keeps collisions from always adding up
+    signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % dims, signs)
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def delete_video(conn, video_id):
+    """Removes a video from every index table.
+
+    The FTS tables are addressed by the rowids recorded in `videos`, since their
+    video_id column isn't indexed.
+
+    Args:
+        conn (sqlite3.Connection): The search database.
+        video_id (str): The unique identifier of the YouTube video.
+
+    Returns:
+        None
+    """
+    row = conn.execute(
+        "SELECT fts_rowid, first_segment_rowid, last_segment_rowid FROM videos WHERE video_id = ?", (video_id,)
+    ).fetchone()
+    if row:
+        conn.execute("DELETE FROM video_fts WHERE rowid = ?", (row[0],))
+        conn.execute("DELETE FROM segment_fts WHERE rowid BETWEEN ? AND ?", (row[1], row[2]))
+    for table in ("videos", "video_vectors", "indexed_files"):
+        conn.execute(f"DELETE FROM {table} WHERE video_id = ?", (video_id,))
+
+
+def index_video(conn, video_id, video_data):
+    """Replaces a video's rows in the full-text and vector indexes.
+
+    Args:
+        conn (sqlite3.Connection): The search database.
+        video_id (str): The unique identifier of the YouTube video.
+        video_data (dict): The video record from load_video_data.
+
+    Returns:
+        None
+    """
+    delete_video(conn, video_id)
+    fts_rowid = conn.execute(
+        "INSERT INTO video_fts (video_id, title, description, channel_name) VALUES (?, ?, ?, ?)",
+        (video_id, video_data.get('title', ''), video_data.get('description', ''), video_data.get('channel_name', ''))
+    ).lastrowid
+    segments = video_data.get('segments') or [{'text': video_data.get('transcript', ''), 'start': 0.0}]
+    # Windows get consecutive rowids, so a video's windows can be read back by rowid range
+    first_segment_rowid = (conn.execute("SELECT MAX(rowid) FROM segment_fts").fetchone()[0] or 0) + 1
+    conn.executemany(
+        "INSERT INTO segment_fts (rowid, video_id, start, text) VALUES (?, ?, ?, ?)",
+        [(first_segment_rowid + i, video_id, start, text) for i, (start, text) in enumerate(segment_windows(segments))]
+    )
+    last_segment_rowid = conn.execute("SELECT MAX(rowid) FROM segment_fts").fetchone()[0] or 0
+    conn.execute(
+        """INSERT INTO videos (video_id, title, channel_name, publish_date, video_url, fts_rowid, first_segment_rowid, last_segment_rowid)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (video_id, video_data.get('title', ''), video_data.get('channel_name', ''), video_data.get('publish_date', ''),
+         video_data.get('video_url', f"https://www.youtube.com/watch?v={video_id}"),
+         fts_rowid, first_segment_rowid, last_segment_rowid)
+    )
+    if np is not None:
+        text = ' '.join([video_data.get('title', ''), video_data.get('description', ''), video_data.get('transcript', '')])
+        conn.execute("INSERT INTO video_vectors (video_id, vector) VALUES (?, ?)", (video_id, embed(text).tobytes()))
+
+
+def update_index(conn, directories=None):
+    """Indexes new and changed video files, and drops videos whose files are gone.
+
+    Files are compared by modification time, so only changed videos are re-read.
+
+    Args:
+        conn (sqlite3.Connection): The search database.
+        directories (list, optional): Directories of video JSON files. Defaults to the
+            processed and unprocessed transcript directories.
+
+    Returns:
+        int: The number of videos (re)indexed.
+    """
+    if directories is None:
+        directories = [os.path.join(transcripts_dir, "processed"), os.path.join(transcripts_dir, "unprocessed")]
+    indexed = dict(conn.execute("SELECT video_id, mtime FROM indexed_files"))
+    seen, updated = set(), 0
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            video_id = os.path.splitext(filename)[0]
+            file_path = os.path.join(directory, filename)
+            mtime = os.path.getmtime(file_path)
+            seen.add(video_id)
+            if indexed.get(video_id) == mtime:
+                continue
+            try:
+                video_data = load_video_data(file_path)
+            except Exception as e:
+                print(f"🚨 Error indexing {file_path}: {e}")
+                continue
+            index_video(conn, video_id, video_data)
+            if hasattr(video_data.get('segments'), 'close'):
+                video_data['segments'].close()
+            conn.execute("INSERT OR REPLACE INTO indexed_files (video_id, mtime) VALUES (?, ?)", (video_id, mtime))
+            updated += 1
+    for video_id in set(indexed) - seen:
+        delete_video(conn, video_id)
+    conn.commit()
+    return updated
+
+
+def fts_query(query):
+    """Turns free text into an FTS5 query that matches all of its words, in any order."""
+    return ' '.join(f'"{token}"' for token in tokenize(query))
+
+
+def timestamp_url(video_url, start):
+    """Returns a video URL that starts playback at the given second."""
+    return f"{video_url}&t={int(start)}s" if start else video_url
+
+
+def search(conn, query, limit=10):
+    """Full-text search over video titles, descriptions, channels and transcript windows.
+
+    Transcript hits carry the start time of the matching window; metadata hits start at 0.
+
+    Args:
+        conn (sqlite3.Connection): The search database.
+        query (str): The search terms.
+        limit (int, optional): The maximum number of hits. Defaults to 10.
+
+    Returns:
+        list: Hit dictionaries with 'video_id', 'title', 'channel_name', 'start', 'snippet', 'url' and 'score'.
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    rows = conn.execute("""
+        SELECT video_id, start, snippet(segment_fts, 2, '[', ']', '…', 16), bm25(segment_fts)
+        FROM segment_fts WHERE segment_fts MATCH ? ORDER BY bm25(segment_fts) LIMIT ?
+    """, (match, limit)).fetchall()
+    # Metadata matches are weighted like a strong transcript hit
+    rows += [
+        (video_id, 0.0, snippet, score * 2)
+        for video_id, snippet, score in conn.execute("""
+            SELECT video_id, snippet(video_fts, -1, '[', ']', '…', 16), bm25(video_fts)
+            FROM video_fts WHERE video_fts MATCH ? ORDER BY bm25(video_fts) LIMIT ?
+        """, (match, limit))
+    ]
+    rows.sort(key=lambda row: row[3])
+    return [_hit(conn, video_id, start, snippet, -score) for video_id, start, snippet, score in rows[:limit]]
+
+
+# In-process cache of the vector matrix, reloaded when the index changes
+_vector_cache = {'key': None, 'video_ids': [], 'matrix': None}
+
+
+def semantic_search(conn, query, limit=10):
+    """Similarity search over the hashed bag-of-words video vectors (requires NumPy).
+
+    Each hit points at the transcript window of that video that best matches the query words.
+
+    Args:
+        conn (sqlite3.Connection): The search database.
+        query (str): The search text.
+        limit (int, optional): The maximum number of hits. Defaults to 10.
+
+    Returns:
+        list: Hit dictionaries like those returned by search, scored by cosine similarity.
+    """
+    if np is None:
+        raise RuntimeError("Semantic search requires numpy (pip install numpy)")
+    key = conn.execute("SELECT COUNT(*), COALESCE(MAX(mtime), 0) FROM indexed_files").fetchone()
+    if _vector_cache['key'] != key:
+        rows = conn.execute("SELECT video_id, vector FROM video_vectors").fetchall()
+        _vector_cache['key'] = key
+        _vector_cache['video_ids'] = [video_id for video_id, _ in rows]
+        _vector_cache['matrix'] = (
+            np.frombuffer(b''.join(vector for _, vector in rows), dtype=np.float32).reshape(len(rows), VECTOR_DIMS)
+            if rows else np.zeros((0, VECTOR_DIMS), dtype=np.float32)
+        )
+    scores = _vector_cache['matrix'] @ embed(query)
+    top = np.argsort(-scores)[:limit]
+    query_tokens = set(tokenize(query))
+    hits = []
+    for i in top:
+        if scores[i] <= 0:
+            break
+        video_id = _vector_cache['video_ids'][i]
+        # Within the video, point at the transcript window sharing the most query words
+        windows = conn.execute("""
+            SELECT start, text FROM segment_fts WHERE rowid BETWEEN
+                (SELECT first_segment_rowid FROM videos WHERE video_id = ?) AND
+                (SELECT last_segment_rowid FROM videos WHERE video_id = ?)
+        """, (video_id, video_id)).fetchall()
+        start, text = max(windows, key=lambda window: len(query_tokens.intersection(tokenize(window[1]))), default=(0.0, ''))
+        hits.append(_hit(conn, video_id, start, text[:160], float(scores[i])))
+    return hits
+
+
+def _hit(conn, video_id, start, snippet, score):
+    title, channel_name, video_url = conn.execute(
+        "SELECT title, channel_name, video_url FROM videos WHERE video_id = ?", (video_id,)
+    ).fetchone()
+    start = float(start or 0)
+    return {
+        'video_id': video_id,
+        'title': title,
+        'channel_name': channel_name,
+        'start': start,
+        'snippet': snippet,
+        'url': timestamp_url(video_url, start),
+        'score': score,
+    }
+
+
+def run_search(query, semantic=False, limit=10):
+    """Updates the index and prints the hits for a query, for the --search command.
+
+    Args:
+        query (str): The search text.
+        semantic (bool, optional): Use vector similarity instead of full-text search. Defaults to False.
+        limit (int, optional): The maximum number of hits. Defaults to 10.
+
+    Returns:
+        list: The hits.
+    """
+    conn = connect()
+    updated = update_index(conn)
+    if updated:
+        print(f"🗂️ Indexed {updated} new or changed videos")
+    start = time.perf_counter()
+    hits = semantic_search(conn, query, limit) if semantic else search(conn, query, limit)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"\n🔎 {len(hits)} hits for \"{query}\" in {elapsed_ms:.1f} ms\n")
+    for hit in hits:
+        print(f"[{format_timestamp(hit['start'])}] {hit['title']} — {hit['channel_name']}")
+        print(f"    {hit['snippet']}")
+        print(f"    {hit['url']}\n")
+    conn.close()
+    return hits
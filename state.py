@@ -0,0 +1,346 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(base_dir, "experiments", "youtube", "state.sqlite"))
+# Failed stages are retried after RETRY_BASE seconds, doubling per consecutive failure up to RETRY_MAX
+RETRY_BASE = float(os.getenv("STATE_RETRY_BASE", 3600))
+RETRY_MAX = float(os.getenv("STATE_RETRY_MAX", 7 * 86400))
+
+# Values of the transcript_status column: unavailable transcripts are retried, skipped ones
+# (e.g. captions disabled) never are
+TRANSCRIPT_FETCHED = "fetched"
+TRANSCRIPT_UNAVAILABLE = "unavailable"
+TRANSCRIPT_SKIPPED = "skipped"
+
+# Columns added to the videos table after it was first released, with their types
+ADDED_VIDEO_COLUMNS = {
+    'failure_class': 'TEXT',
+    'caption_languages': 'TEXT',
+}
+
+
+class StateIndex:
+    """A persistent, thread-safe record of how far each video has gone through the pipeline.
+
+    One row per video_id records when its metadata was fetched (and the resource ETag), whether
+    its transcript was fetched, is unavailable or was skipped for good (with the failure class
+    and the caption tracks the video has), when it was summarized and when its markdown was
+    written. Failures are counted per video and push next_retry_at out exponentially.
+    It also keeps the ETag and items of every playlist page seen, for conditional requests, the
+    YouTube API quota units spent per day and method, and the polling state of watched channels.
+
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    metadata_at REAL,
+                    metadata_etag TEXT,
+                    transcript_status TEXT,
+                    transcript_at REAL,
+                    summarized_at REAL,
+                    markdown_at REAL,
+                    markdown_path TEXT,
+                    failed_stage TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    next_retry_at REAL,
+                    updated_at REAL,
+                    failure_class TEXT,
+                    caption_languages TEXT
+                )
+            """)
+            # Databases created by older versions lack the newer columns
+            existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(videos)")}
+            for column, column_type in ADDED_VIDEO_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE videos ADD COLUMN {column} {column_type}")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlist_pages (
+                    playlist_id TEXT NOT NULL,
+                    page_token TEXT NOT NULL,
+                    etag TEXT,
+                    next_page_token TEXT,
+                    items TEXT NOT NULL,
+                    fetched_at REAL,
+                    PRIMARY KEY (playlist_id, page_token)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS quota_usage (
+                    day TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    units INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, method)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS watched_channels (
+                    channel_id TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    seen_ids TEXT,
+                    pending_ids TEXT,
+                    poll_interval REAL,
+                    next_poll_at REAL,
+                    polled_at REAL,
+                    last_upload_at REAL
+                )
+            """)
+            self.conn.commit()
+        return self.conn
+
+    def _update(self, video_id, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f"{column} = ?" for column in fields)
+        with self.lock:
+            conn = self._connect()
+            conn.execute("INSERT OR IGNORE INTO videos (video_id) VALUES (?)", (video_id,))
+            conn.execute(f"UPDATE videos SET {columns} WHERE video_id = ?", (*fields.values(), video_id))
+            conn.commit()
+
+    def get(self, video_id):
+        """Returns the state of one video.
+
+        Args:
+            video_id (str): The unique identifier of the YouTube video.
+
+        Returns:
+            dict or None: The video's row, or None if it has never been seen.
+        """
+        return self.get_many([video_id]).get(video_id)
+
+    def get_many(self, video_ids):
+        """Returns the state of many videos.
+
+        Args:
+            video_ids (list): The unique identifiers of the YouTube videos.
+
+        Returns:
+            dict: A mapping of video ID to its row, for videos that have been seen before.
+        """
+        rows = {}
+        video_ids = list(video_ids)
+        with self.lock:
+            conn = self._connect()
+            # Stay under SQLite's limit on bound parameters
+            for i in range(0, len(video_ids), 500):
+                chunk = video_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for row in conn.execute(f"SELECT * FROM videos WHERE video_id IN ({placeholders})", chunk):
+                    rows[row['video_id']] = dict(row)
+        return rows
+
+    def record_metadata(self, video_id, etag=None):
+        """Records that a video's metadata was fetched."""
+        self._update(video_id, metadata_at=time.time(), metadata_etag=etag)
+
+    def record_transcript(self, video_id):
+        """Records that a video's transcript was fetched and saved, clearing earlier failures."""
+        self._update(video_id, transcript_status=TRANSCRIPT_FETCHED, transcript_at=time.time(),
+                     failed_stage=None, attempts=0, last_error=None, next_retry_at=None, failure_class=None)
+
+    def record_caption_languages(self, video_id, tracks):
+        """Records the caption tracks a video has, as listed by the transcript API.
+
+        Args:
+            video_id (str): The unique identifier of the YouTube video.
+            tracks (list): Dictionaries with 'code', 'generated' and 'translatable' keys.
+
+        Returns:
+            None
+        """
+        self._update(video_id, caption_languages=json.dumps(tracks))
+
+    def record_summary(self, video_id):
+        """Records that a video was summarized (or roasted)."""
+        self._update(video_id, summarized_at=time.time())
+
+    def record_markdown(self, video_id, markdown_path):
+        """Records that a video's markdown note was written, clearing earlier failures."""
+        self._update(video_id, markdown_at=time.time(), markdown_path=markdown_path,
+                     failed_stage=None, attempts=0, last_error=None, next_retry_at=None)
+
+    def record_failure(self, video_id, stage, error, transcript_status=None, failure_class=None, retry_base=None):
+        """Records a failed stage and schedules the next retry with exponential backoff.
+
+        Args:
+            video_id (str): The unique identifier of the YouTube video.
+            stage (str): The stage that failed, e.g. "transcript" or "summary".
+            error (str): A description of the failure.
+            transcript_status (str, optional): A new transcript_status, e.g. TRANSCRIPT_UNAVAILABLE.
+                With TRANSCRIPT_SKIPPED no retry is scheduled.
+            failure_class (str, optional): The kind of failure, e.g. "disabled" or "rate_limited".
+            retry_base (float, optional): The first retry delay, in seconds. Defaults to RETRY_BASE.
+
+        Returns:
+            float or None: The timestamp of the next retry, or None if there won't be one.
+        """
+        # The attempt count is read and written in one write transaction, so concurrent failures
+        # of the same video (from threads or other processes) can't lose an attempt
+        with self.lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT attempts FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+                attempts = ((row['attempts'] if row else None) or 0) + 1
+                next_retry_at = None
+                if transcript_status != TRANSCRIPT_SKIPPED:
+                    next_retry_at = time.time() + min(RETRY_MAX, (retry_base or RETRY_BASE) * 2 ** (attempts - 1))
+                fields = dict(failed_stage=stage, attempts=attempts, last_error=str(error)[:500],
+                              next_retry_at=next_retry_at, updated_at=time.time())
+                if transcript_status:
+                    fields['transcript_status'] = transcript_status
+                if failure_class:
+                    fields['failure_class'] = failure_class
+                columns = ', '.join(f"{column} = ?" for column in fields)
+                conn.execute("INSERT OR IGNORE INTO videos (video_id) VALUES (?)", (video_id,))
+                conn.execute(f"UPDATE videos SET {columns} WHERE video_id = ?", (*fields.values(), video_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return next_retry_at
+
+    def get_playlist_page(self, playlist_id, page_token):
+        """Returns the last response seen for a playlist page.
+
+        Args:
+            playlist_id (str): The ID of the YouTube playlist.
+            page_token (str): The page token, or '' for the first page.
+
+        Returns:
+            dict or None: The page's 'etag', 'next_page_token' and 'items' (list), or None.
+        """
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT etag, next_page_token, items FROM playlist_pages WHERE playlist_id = ? AND page_token = ?",
+                (playlist_id, page_token)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'etag': row['etag'], 'next_page_token': row['next_page_token'], 'items': json.loads(row['items'])}
+
+    def record_playlist_page(self, playlist_id, page_token, etag, items, next_page_token):
+        """Records a playlist page response, so the next poll can ask whether it changed.
+
+        Args:
+            playlist_id (str): The ID of the YouTube playlist.
+            page_token (str): The page token, or '' for the first page.
+            etag (str): The page's ETag.
+            items (list): The page's playlist items.
+            next_page_token (str or None): The token of the following page, if any.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO playlist_pages VALUES (?, ?, ?, ?, ?, ?)",
+                (playlist_id, page_token, etag, next_page_token, json.dumps(items, separators=(',', ':')), time.time())
+            )
+            conn.commit()
+
+    def add_quota_usage(self, day, usage):
+        """Adds YouTube API calls to a day's quota usage.
+
+        Args:
+            day (str): The quota day, e.g. "2024-05-01".
+            usage (dict): A mapping of method name (e.g. "videos.list") to (calls, units).
+
+        Returns:
+            None
+        """
+        with self.lock:
+            conn = self._connect()
+            for method, (calls, units) in usage.items():
+                conn.execute(
+                    "INSERT INTO quota_usage (day, method, calls, units) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (day, method) DO UPDATE SET calls = calls + excluded.calls, units = units + excluded.units",
+                    (day, method, calls, units)
+                )
+            conn.commit()
+
+    def get_quota_usage(self, day):
+        """Returns a day's YouTube API quota usage.
+
+        Args:
+            day (str): The quota day, e.g. "2024-05-01".
+
+        Returns:
+            dict: A mapping of method name to {'calls': int, 'units': int}.
+        """
+        with self.lock:
+            rows = self._connect().execute("SELECT method, calls, units FROM quota_usage WHERE day = ?", (day,)).fetchall()
+        return {row['method']: {'calls': row['calls'], 'units': row['units']} for row in rows}
+
+    def get_channel_watch(self, channel_id):
+        """Returns the polling state of a watched channel.
+
+        Args:
+            channel_id (str): The unique identifier of the YouTube channel.
+
+        Returns:
+            dict or None: The channel's row, with 'seen_ids' and 'pending_ids' decoded to lists,
+                or None if it has never been polled.
+        """
+        with self.lock:
+            row = self._connect().execute("SELECT * FROM watched_channels WHERE channel_id = ?", (channel_id,)).fetchone()
+        if row is None:
+            return None
+        row = dict(row)
+        for key in ('seen_ids', 'pending_ids'):
+            row[key] = json.loads(row[key]) if row[key] else []
+        return row
+
+    def update_channel_watch(self, channel_id, **fields):
+        """Updates the polling state of a watched channel; list fields are stored as JSON."""
+        fields = {key: json.dumps(value) if isinstance(value, list) else value for key, value in fields.items()}
+        columns = ', '.join(f"{column} = ?" for column in fields)
+        with self.lock:
+            conn = self._connect()
+            conn.execute("INSERT OR IGNORE INTO watched_channels (channel_id) VALUES (?)", (channel_id,))
+            conn.execute(f"UPDATE watched_channels SET {columns} WHERE channel_id = ?", (*fields.values(), channel_id))
+            conn.commit()
+
+
+def retry_due(row, stage=None, now=None):
+    """Checks whether a video's failed stage may be retried yet.
+
+    Args:
+        row (dict or None): The video's state row.
+        stage (str, optional): Only consider failures of this stage. Defaults to any stage.
+        now (float, optional): The current timestamp. Defaults to time.time().
+
+    Returns:
+        bool: False if the stage failed and its backoff hasn't elapsed, or the transcript was
+            skipped for good, True otherwise.
+    """
+    if row and row.get('transcript_status') == TRANSCRIPT_SKIPPED and stage in (None, 'transcript'):
+        return False
+    if not row or not row.get('next_retry_at') or (stage and row.get('failed_stage') != stage):
+        return True
+    return row['next_retry_at'] <= (now or time.time())
+
+
+state = StateIndex(STATE_DB_PATH)
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import re
+import dspy
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The compiled summarizer (few-shot demos bootstrapped by compile_summarizer), loaded on first use
+SUMMARIZER_PATH = os.getenv("SUMMARIZER_PATH", os.path.join(base_dir, "experiments", "youtube", "cache", "summarizer.json"))
+# Generated prompts shorter than this fail the compile metric
+MIN_PROMPT_CHARS = 200
+
+
+class SummarizationPromptGenerator(dspy.Signature):
+    """Given the title and description of a YouTube video, generate a summarization prompt to be used with an AI assistant. The prompt should be specific to the video title and description, and aim to provide an engaging and informative summary of the video's content. Make the prompt in a way that is easy to understand and follow, and avoid using technical jargon or complex language, and remember that the general idea here is to make a prompt so that the AI can create the best possible summary of the video, packed with key takeaways and useful insights. If the video is about crypto, make sure to include actions to extract the tokens to buy or sell and why in the prompt"""
+    title = dspy.InputField()
+    description = dspy.InputField()
+    summarization_prompt = dspy.OutputField()
+
+    
+    
+class YouTubeSummarizer(dspy.Module):
+    def __init__(self):
+        """
+        Initialize a new instance of the class.
+        
+        This method initializes the object by calling the superclass's __init__ method and setting up a summarization prompt generator using dspy.ChainOfThought.
+        
+        Args:
+            None
+        
+        Returns:
+            None
+        """
+        super().__init__()
+        self.summarization_prompt_generator = dspy.ChainOfThought(SummarizationPromptGenerator)
+
+    def forward(self, title, description):
+        """Generates a summarization prompt based on the given title and description.
+        
+        Args:
+            title (str): The title of the content to be summarized.
+            description (str): The description or content to be summarized.
+        
+        Returns:
+            dspy.Prediction: A prediction object containing the generated summarization prompt.
+        """
+        # Create a summarization prompt
+        summarization_prompt = self.summarization_prompt_generator(title=title, description=description)
+        
+        return dspy.Prediction(summarization_prompt=summarization_prompt.summarization_prompt)
+
+
+def prompt_metric(example, prediction, trace=None):
+    """Scores a generated prompt for compile_summarizer: long enough, and about the video.
+
+    Args:
+        example (dspy.Example): The training example, with 'title' and 'description'.
+        prediction (dspy.Prediction): The program's output.
+        trace (optional): The DSPy trace, unused.
+
+    Returns:
+        bool: True if the prompt is at least MIN_PROMPT_CHARS long and mentions a word of the title.
+    """
+    prompt = (prediction.summarization_prompt or "").lower()
+    title_words = set(re.findall(r"\w{4,}", example.title.lower()))
+    return len(prompt) >= MIN_PROMPT_CHARS and (not title_words or any(word in prompt for word in title_words))
+
+
+def load_summarizer(path=SUMMARIZER_PATH):
+    """Creates the summarizer, with the compiled state saved by compile_summarizer if there is one.
+
+    Args:
+        path (str, optional): The compiled state file. Defaults to SUMMARIZER_PATH.
+
+    Returns:
+        YouTubeSummarizer: The program. Its 'version' attribute identifies the compiled state
+            (a hash of the file), or is empty if it isn't compiled.
+    """
+    summarizer = YouTubeSummarizer()
+    summarizer.version = ""
+    if os.path.exists(path):
+        summarizer.load(path)
+        with open(path, 'rb') as f:
+            summarizer.version = hashlib.sha256(f.read()).hexdigest()[:16]
+        print(f"🧠 Loaded compiled summarizer from {path}")
+    return summarizer
+
+
+def compile_summarizer(videos, path=SUMMARIZER_PATH, max_demos=4):
+    """Compiles the summarizer with bootstrapped few-shot demos and saves it.
+
+    Runs the program over the training videos and keeps up to max_demos of the prompts that
+    pass prompt_metric as demonstrations. Must be called with a DSPy language model configured.
+
+    Args:
+        videos (list): Dictionaries with 'title' and 'description' keys.
+        path (str, optional): Where the compiled state is saved. Defaults to SUMMARIZER_PATH.
+        max_demos (int, optional): The maximum number of demonstrations. Defaults to 4.
+
+    Returns:
+        YouTubeSummarizer: The compiled program.
+    """
+    from dspy.teleprompt import BootstrapFewShot
+    trainset = [
+        dspy.Example(title=video['title'], description=video.get('description') or '').with_inputs('title', 'description')
+        for video in videos
+    ]
+    teleprompter = BootstrapFewShot(metric=prompt_metric, max_bootstrapped_demos=max_demos, max_labeled_demos=0)
+    compiled = teleprompter.compile(YouTubeSummarizer(), trainset=trainset)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compiled.save(path)
+    print(f"🧠 Compiled summarizer with {len(trainset)} videos, saved to {path}")
+    return compiled
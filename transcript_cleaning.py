@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+from chunking import estimate_tokens
+
+# Clean transcripts before they are sent to the LLM; set to 0 to send them verbatim
+TRANSCRIPT_CLEANING = os.getenv("TRANSCRIPT_CLEANING", "1") == "1"
+# Also drop sponsor reads (from a cue such as "this video is sponsored by" for up to
+# SPONSOR_SPAN_SECONDS, or until the speaker gets back to the video)
+TRANSCRIPT_DROP_SPONSORS = os.getenv("TRANSCRIPT_DROP_SPONSORS", "0") == "1"
+SPONSOR_SPAN_SECONDS = float(os.getenv("SPONSOR_SPAN_SECONDS", 90))
+# Matched in lowercase only, as whole words. Words that are also abbreviations or units, such
+# as "er" (ER) or "mm", aren't in the defaults.
+TRANSCRIPT_FILLER_WORDS = os.getenv("TRANSCRIPT_FILLER_WORDS", "um,umm,uh,uhh,uhm,erm,hmm,mhm")
+
+# Segment texts are joined with this separator, so each pattern runs once over the whole
+# transcript instead of once per segment, and split apart again afterwards. Patterns must not
+# match it (note that \s does).
+SEPARATOR = "\x1e"
+
+# [Music], [Applause], (laughter), ♪ ... ♪ and similar non-speech markers
+MARKER_PATTERN = re.compile(r"\[[^\]\x1e]{0,40}\]|\((?:music|applause|laughter|laughs|inaudible|silence)\)|♪[^♪\x1e]{0,200}♪|♪", re.IGNORECASE)
+# Hyphens count as part of the word, so "um-hmm" or a unit in "mm-wave" is left alone
+FILLER_PATTERN = re.compile(
+    r"(?<![\w-])(?:" + "|".join(re.escape(word.strip().lower()) for word in TRANSCRIPT_FILLER_WORDS.split(",") if word.strip()) + r")(?![\w-])[,.]?"
+) if TRANSCRIPT_FILLER_WORDS.strip() else None
+# Repeated words left behind by filler removal or stutters, e.g. "the the"
+STUTTER_PATTERN = re.compile(r"\b(\w+)(?:[ \t]+\1\b)+", re.IGNORECASE)
+# Words that are correctly said twice in a row ("what it is is", "he had had", "that that car");
+# they are only collapsed when repeated three times or more
+CORRECT_DOUBLES = {"is", "was", "that", "had", "do"}
+SPACE_PATTERN = re.compile(r"[ \t\n\r\f\v]+")
+
+SPONSOR_START_PATTERN = re.compile(
+    r"sponsored by|brought to you by|today'?s sponsor|our sponsor|thanks to .{0,40} for sponsoring|"
+    r"use (?:promo )?code|link in the description|affiliate link",
+    re.IGNORECASE
+)
+SPONSOR_END_PATTERN = re.compile(r"back to the (?:video|show|episode)|now back to|let'?s get (?:back )?(?:into|to) it|anyway,? ", re.IGNORECASE)
+
+# Rolling auto-captions repeat the tail of the previous line; overlaps shorter than this many
+# words are left alone, they are as likely to be natural repetition
+MIN_OVERLAP_WORDS = 2
+
+
+class CleaningStats:
+    """Thread-safe token counts before and after cleaning, for the end-of-run report."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.transcripts = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def add(self, before, after):
+        with self.lock:
+            self.transcripts += 1
+            self.tokens_before += before
+            self.tokens_after += after
+
+    def report(self):
+        """Returns a one-line summary of the tokens saved so far."""
+        with self.lock:
+            saved = self.tokens_before - self.tokens_after
+            share = saved / self.tokens_before if self.tokens_before else 0
+            return (f"🧹 Transcript cleaning: {self.transcripts} transcripts, "
+                    f"{self.tokens_before} → {self.tokens_after} tokens ({share:.0%} fewer)")
+
+
+cleaning_stats = CleaningStats()
+
+
+def collapse_stutter(match):
+    """Replaces a run of a repeated word with one copy, unless it is a correct double."""
+    word = match.group(1)
+    if word.lower() in CORRECT_DOUBLES and len(match.group(0).split()) == 2:
+        return match.group(0)
+    return word
+
+
+def strip_noise(texts):
+    """Removes markers, filler words and stutters from segment texts, in one pass each.
+
+    Args:
+        texts (list): The segment texts.
+
+    Returns:
+        list: The cleaned texts, one per input text (possibly empty).
+    """
+    blob = SEPARATOR.join(texts)
+    blob = MARKER_PATTERN.sub(" ", blob)
+    if FILLER_PATTERN is not None:
+        blob = FILLER_PATTERN.sub(" ", blob)
+    blob = STUTTER_PATTERN.sub(collapse_stutter, blob)
+    blob = SPACE_PATTERN.sub(" ", blob)
+    return [text.strip() for text in blob.split(SEPARATOR)]
+
+
+def remove_overlap(previous_words, words):
+    """Drops the words at the start of a caption line that repeat the end of the previous one.
+
+    Args:
+        previous_words (list): The words of the previous kept line.
+        words (list): The words of this line.
+
+    Returns:
+        list: The words of this line that are new.
+    """
+    if words == previous_words:
+        return []
+    for size in range(min(len(previous_words), len(words)), MIN_OVERLAP_WORDS - 1, -1):
+        if [word.lower() for word in previous_words[-size:]] == [word.lower() for word in words[:size]]:
+            return words[size:]
+    return words
+
+
+def sponsor_mask(segments, texts):
+    """Flags the segments that belong to sponsor reads.
+
+    Args:
+        segments (list): The segments, for their start times.
+        texts (list): Their texts.
+
+    Returns:
+        list: One bool per segment, True for segments to drop.
+    """
+    mask = [False] * len(texts)
+    span_end = None
+    for index, text in enumerate(texts):
+        start = float(segments[index].get('start') or 0)
+        if span_end is not None and (start > span_end or SPONSOR_END_PATTERN.search(text)):
+            span_end = None
+        if span_end is None and SPONSOR_START_PATTERN.search(text):
+            span_end = start + SPONSOR_SPAN_SECONDS
+        mask[index] = span_end is not None
+    return mask
+
+
+def clean_segments(segments, drop_sponsors=TRANSCRIPT_DROP_SPONSORS):
+    """Cleans transcript segments before they are sent to the LLM.
+
+    Non-speech markers such as [Music], filler words and stutters are removed, the words that
+    rolling auto-captions repeat from the previous line are dropped, and so are empty and
+    repeated lines. With drop_sponsors, sponsor reads are dropped too. Timestamps are kept, so
+    the result can be chunked like the original.
+
+    Args:
+        segments (iterable): Dictionaries with 'text', 'start' and 'duration' keys.
+        drop_sponsors (bool, optional): Drop sponsor reads. Defaults to TRANSCRIPT_DROP_SPONSORS.
+
+    Returns:
+        list: The cleaned segments, as dictionaries with 'text', 'start' and 'duration' keys.
+    """
+    segments = list(segments)
+    texts = strip_noise([segment['text'] for segment in segments])
+    mask = sponsor_mask(segments, texts) if drop_sponsors else [False] * len(texts)
+    cleaned, previous_words = [], []
+    for segment, text, dropped in zip(segments, texts, mask):
+        if dropped:
+            continue
+        words = remove_overlap(previous_words, text.split())
+        if words:
+            cleaned.append({'text': ' '.join(words), 'start': segment.get('start', 0), 'duration': segment.get('duration', 0)})
+            previous_words = text.split()
+    return cleaned
+
+
+def clean_transcript(video_data):
+    """Returns a copy of a video's data with a cleaned transcript, for the LLM prompts.
+
+    Args:
+        video_data (dict): Video data from load_video_data, with 'transcript' and optionally 'segments'.
+
+    Returns:
+        dict: The video data with cleaned 'transcript' and 'segments'; video_data itself if
+            cleaning is disabled.
+    """
+    if not TRANSCRIPT_CLEANING:
+        return video_data
+    segments = video_data.get('segments') or [{'text': video_data['transcript'], 'start': 0, 'duration': 0}]
+    cleaned = clean_segments(segments)
+    transcript = ' '.join(segment['text'] for segment in cleaned)
+    before, after = estimate_tokens(video_data['transcript']), estimate_tokens(transcript)
+    cleaning_stats.add(before, after)
+    print(f"🧹 Cleaned transcript of {video_data.get('title', '')}: {before} → {after} tokens")
+    return dict(video_data, transcript=transcript, segments=cleaned)
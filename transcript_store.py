@@ -0,0 +1,205 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+
+# Segment file layout (all integers and floats little-endian):
+#   magic      4 bytes  b"ZTS1"
+#   count      uint32   number of segments
+#   starts     float32[count]    segment start times, seconds
+#   durations  float32[count]    segment durations, seconds
+#   offsets    uint32[count + 1] byte offset of each segment's text in the text blob, plus
+#                                one past the end of the blob; segment i's text ends one byte
+#                                (the separating space) before offsets[i + 1]
+#   text       UTF-8 blob: the segment texts joined by single spaces
+# The columns are fixed-width, so any segment's text or timestamps can be read from a
+# memory map without parsing the rest of the file, and the blob is the full transcript.
+MAGIC = b"ZTS1"
+HEADER = struct.Struct("<4sI")
+SEGMENTS_EXTENSION = ".seg"
+
+
+def write_segments(path, segments):
+    """Writes transcript segments to a compact columnar segment file, atomically.
+
+    Args:
+        path (str): The destination path.
+        segments (list): Dictionaries with 'text', 'start' and 'duration' keys.
+
+    Returns:
+        None
+    """
+    texts = [segment['text'].replace('\n', ' ').encode('utf-8') for segment in segments]
+    count = len(texts)
+    offsets = [0]
+    for text in texts:
+        offsets.append(offsets[-1] + len(text) + 1)
+    starts = [float(segment.get('start', 0)) for segment in segments]
+    durations = [float(segment.get('duration', 0)) for segment in segments]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, count))
+        f.write(struct.pack(f"<{count}f", *starts))
+        f.write(struct.pack(f"<{count}f", *durations))
+        f.write(struct.pack(f"<{count + 1}I", *offsets))
+        f.write(b' '.join(texts))
+    os.replace(tmp_path, path)
+
+
+class TranscriptSegments:
+    """Lazily reads a segment file written by write_segments through a memory map.
+
+    Behaves like a read-only list of {'text', 'start', 'duration'} dictionaries; only the
+    segments that are accessed are decoded.
+
+    Args:
+        path (str): Path of the segment file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a transcript segment file")
+        self.starts_offset = HEADER.size
+        self.durations_offset = self.starts_offset + 4 * self.count
+        self.offsets_offset = self.durations_offset + 4 * self.count
+        self.text_offset = self.offsets_offset + 4 * (self.count + 1)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return {'text': self.text(index), 'start': self.start(index), 'duration': self.duration(index)}
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self, index):
+        """Returns the start time of a segment, in seconds."""
+        return struct.unpack_from("<f", self.data, self.starts_offset + 4 * index)[0]
+
+    def duration(self, index):
+        """Returns the duration of a segment, in seconds."""
+        return struct.unpack_from("<f", self.data, self.durations_offset + 4 * index)[0]
+
+    def text(self, index):
+        """Returns the text of a segment."""
+        begin, end = struct.unpack_from("<2I", self.data, self.offsets_offset + 4 * index)
+        return self.data[self.text_offset + begin:self.text_offset + end - 1].decode('utf-8')
+
+    def full_text(self):
+        """Returns the whole transcript, the segment texts joined by spaces."""
+        return self.data[self.text_offset:].decode('utf-8')
+
+    def close(self):
+        """Releases the memory map."""
+        self.data.close()
+
+
+def segments_path(json_path):
+    """Returns the segment file that belongs to a video JSON file."""
+    return os.path.splitext(json_path)[0] + SEGMENTS_EXTENSION
+
+
+def save_video_data(json_path, data, segments):
+    """Saves a video's metadata as compact JSON and its transcript as a segment file.
+
+    The segment file is written first, so a JSON file never exists without its transcript.
+
+    Args:
+        json_path (str): The destination of the metadata JSON.
+        data (dict): The video metadata, without the transcript.
+        segments (list): The transcript segments.
+
+    Returns:
+        None
+    """
+    seg_path = segments_path(json_path)
+    write_segments(seg_path, segments)
+    data = dict(data, transcript_file=os.path.basename(seg_path))
+    with open(f"{json_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(f"{json_path}.tmp", json_path)
+
+
+def load_video_data(json_path):
+    """Loads a video JSON file, attaching its transcript from the segment file if it has one.
+
+    Older files that inline 'transcript' (and possibly 'segments') are returned as they are.
+
+    Args:
+        json_path (str): Path of the video JSON file.
+
+    Returns:
+        dict: The video data, with 'transcript' (str) and 'segments' (TranscriptSegments or list) keys.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        video_data = json.load(f)
+    if 'transcript_file' in video_data:
+        segments = TranscriptSegments(os.path.join(os.path.dirname(json_path), video_data['transcript_file']))
+        video_data['segments'] = segments
+        video_data['transcript'] = segments.full_text()
+    return video_data
+
+
+def move_video_files(filename, source_dir, destination_dir):
+    """Moves a video JSON file, and its segment file if any, to another directory.
+
+    Args:
+        filename (str): The JSON filename.
+        source_dir (str): The directory it is in.
+        destination_dir (str): The directory to move it to.
+
+    Returns:
+        None
+    """
+    seg_filename = os.path.splitext(filename)[0] + SEGMENTS_EXTENSION
+    if os.path.exists(os.path.join(source_dir, seg_filename)):
+        shutil.move(os.path.join(source_dir, seg_filename), os.path.join(destination_dir, seg_filename))
+    shutil.move(os.path.join(source_dir, filename), os.path.join(destination_dir, filename))
+
+
+def compact_directory(directory):
+    """Converts older pretty-printed video JSON files in a directory to the compact format.
+
+    Files with inline 'segments' keep their timestamps; files with only a 'transcript' string
+    are stored as a single segment starting at 0.
+
+    Args:
+        directory (str): The directory holding the video JSON files.
+
+    Returns:
+        tuple: The number of files converted and the number of bytes saved.
+    """
+    converted, saved = 0, 0
+    for filename in sorted(os.listdir(directory)):
+        json_path = os.path.join(directory, filename)
+        if not filename.endswith('.json'):
+            continue
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if 'transcript_file' in data or 'transcript' not in data:
+            continue
+        before = os.path.getsize(json_path)
+        segments = data.pop('segments', None) or [{'text': data['transcript'], 'start': 0, 'duration': 0}]
+        data.pop('transcript')
+        save_video_data(json_path, data, segments)
+        saved += before - os.path.getsize(json_path) - os.path.getsize(segments_path(json_path))
+        converted += 1
+    return converted, saved
@@ -0,0 +1,301 @@
+import os
+import time
+import urllib.error
+import urllib.request
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+from generate_transcripts import (
+    TRANSCRIPT_WORKERS,
+    TRANSCRIPT_RATE_LIMIT,
+    get_youtube,
+    get_videos_details,
+    get_channel_names,
+    save_playlist_item,
+)
+from playlist_mutations import http_status
+from rate_limit import TokenBucket
+from metrics import metrics
+from state import state, retry_due, TRANSCRIPT_FETCHED, TRANSCRIPT_SKIPPED
+
+load_dotenv()
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Channels to watch: comma-separated IDs, and/or a file with one channel ID per line
+WATCH_CHANNELS = os.getenv("WATCH_CHANNELS", "")
+WATCH_CHANNELS_FILE = os.getenv("WATCH_CHANNELS_FILE", os.path.join(base_dir, "experiments", "youtube", "channels.txt"))
+# "feed" polls the public RSS feed (no API quota); "playlist" polls the uploads playlist (1 unit per poll)
+WATCH_SOURCE = os.getenv("WATCH_SOURCE", "feed")
+WATCH_FEED_URL = os.getenv("WATCH_FEED_URL", "https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}")
+# Poll intervals adapt to each channel between these bounds, in seconds
+WATCH_MIN_INTERVAL = float(os.getenv("WATCH_MIN_INTERVAL", 300))
+WATCH_MAX_INTERVAL = float(os.getenv("WATCH_MAX_INTERVAL", 6 * 3600))
+# Concurrent feed polls (uploads playlist polls share the API client, so they run one at a time)
+WATCH_CONCURRENCY = int(os.getenv("WATCH_CONCURRENCY", 8))
+
+# A channel is polled every RECENCY_FACTOR times the time since its last upload (within the bounds)
+RECENCY_FACTOR = 0.1
+# Recent upload IDs remembered per channel; the feed lists the latest 15
+SEEN_IDS_LIMIT = 50
+PENDING_IDS_LIMIT = 20
+FEED_NAMESPACES = {'atom': 'http://www.w3.org/2005/Atom', 'yt': 'http://www.youtube.com/xml/schemas/2015'}
+
+
+def load_channel_ids():
+    """Returns the channels to watch, from WATCH_CHANNELS and WATCH_CHANNELS_FILE.
+
+    Returns:
+        list: Channel IDs, without duplicates. Blank lines and '#' comments in the file are ignored.
+    """
+    channel_ids = [channel_id.strip() for channel_id in WATCH_CHANNELS.split(',')]
+    if os.path.exists(WATCH_CHANNELS_FILE):
+        with open(WATCH_CHANNELS_FILE, 'r', encoding='utf-8') as f:
+            channel_ids += [line.split('#')[0].strip() for line in f]
+    return list(dict.fromkeys(channel_id for channel_id in channel_ids if channel_id))
+
+
+def parse_timestamp(value):
+    """Parses an ISO 8601 timestamp from the feed or the API into a Unix timestamp, or None."""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def fetch_channel_feed(channel_id, etag=None, last_modified=None):
+    """Fetches a channel's public uploads feed, conditionally.
+
+    Args:
+        channel_id (str): The unique identifier of the YouTube channel.
+        etag (str, optional): The ETag of the last response, sent as If-None-Match.
+        last_modified (str, optional): The Last-Modified of the last response, sent as If-Modified-Since.
+
+    Returns:
+        tuple: The uploads, newest first, as {'video_id', 'title', 'published'} dictionaries
+            (None if the feed hasn't changed), and the new ETag and Last-Modified values.
+    """
+    request = urllib.request.Request(WATCH_FEED_URL.format(channel_id=channel_id))
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if last_modified:
+        request.add_header('If-Modified-Since', last_modified)
+    with metrics.span("feed.fetch", channel_id=channel_id) as span:
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                body = response.read()
+                etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                span['not_modified'] = True
+                return None, etag, last_modified
+            raise
+    metrics.count("feed.bytes", len(body))
+    uploads = []
+    for entry in ET.fromstring(body).findall('atom:entry', FEED_NAMESPACES):
+        uploads.append({
+            'video_id': entry.findtext('yt:videoId', namespaces=FEED_NAMESPACES),
+            'title': entry.findtext('atom:title', namespaces=FEED_NAMESPACES),
+            'published': parse_timestamp(entry.findtext('atom:published', namespaces=FEED_NAMESPACES)),
+        })
+    return uploads, etag, last_modified
+
+
+def fetch_uploads_playlist(channel_id, etag=None):
+    """Fetches the latest items of a channel's uploads playlist, conditionally (1 quota unit).
+
+    Args:
+        channel_id (str): The unique identifier of the YouTube channel (UC...).
+        etag (str, optional): The ETag of the last response, sent as If-None-Match.
+
+    Returns:
+        tuple: The uploads, newest first, as {'video_id', 'title', 'published'} dictionaries
+            (None if the playlist hasn't changed), the new ETag, and None (no Last-Modified).
+    """
+    # A channel's uploads playlist ID is its channel ID with UC replaced by UU
+    request = get_youtube().playlistItems().list(
+        part="snippet,contentDetails",
+        playlistId=f"UU{channel_id[2:]}",
+        maxResults=15
+    )
+    if etag:
+        request.headers['If-None-Match'] = etag
+    try:
+        response = request.execute()
+    except Exception as e:
+        if http_status(e) == 304:
+            return None, etag, None
+        raise
+    uploads = [{
+        'video_id': item['contentDetails']['videoId'],
+        'title': item['snippet'].get('title', ''),
+        'published': parse_timestamp(item['contentDetails'].get('videoPublishedAt') or item['snippet'].get('publishedAt')),
+    } for item in response.get('items', [])]
+    return uploads, response.get('etag'), None
+
+
+def poll_channel(channel_id):
+    """Polls one channel and updates its watch state.
+
+    The first poll only records the channel's recent uploads as seen. Afterwards, uploads not
+    seen before are returned, and the next poll is scheduled RECENCY_FACTOR times the time since
+    the channel's last upload from now, so active channels are checked within minutes and
+    dormant ones a few times a day.
+
+    Args:
+        channel_id (str): The unique identifier of the YouTube channel.
+
+    Returns:
+        list: The IDs of new uploads, oldest first.
+    """
+    row = state.get_channel_watch(channel_id) or {}
+    now = time.time()
+    try:
+        if WATCH_SOURCE == 'playlist':
+            uploads, etag, last_modified = fetch_uploads_playlist(channel_id, row.get('etag'))
+        else:
+            uploads, etag, last_modified = fetch_channel_feed(channel_id, row.get('etag'), row.get('last_modified'))
+    except Exception as e:
+        print(f"🚨 Error polling channel {channel_id}: {e}")
+        interval = row.get('poll_interval') or WATCH_MIN_INTERVAL
+        state.update_channel_watch(channel_id, polled_at=now, next_poll_at=now + interval)
+        return []
+
+    seen = row.get('seen_ids') or []
+    last_upload_at = row.get('last_upload_at')
+    new_ids = []
+    if uploads is not None:
+        new_ids = [upload['video_id'] for upload in uploads if upload['video_id'] not in seen]
+        published = [upload['published'] for upload in uploads if upload['published']]
+        if published:
+            last_upload_at = max(published + [last_upload_at or 0])
+        seen = (new_ids + seen)[:SEEN_IDS_LIMIT]
+    # The first successful poll only establishes what has been seen
+    first_poll = not row.get('seen_ids') and not row.get('etag')
+    if new_ids and first_poll:
+        print(f"👀 Watching channel {channel_id}: {len(new_ids)} recent uploads marked as seen")
+        new_ids = []
+    elif new_ids:
+        print(f"🆕 {len(new_ids)} new uploads from channel {channel_id}")
+        last_upload_at = max(last_upload_at or 0, now - WATCH_MIN_INTERVAL / RECENCY_FACTOR)
+
+    since_upload = now - last_upload_at if last_upload_at else WATCH_MAX_INTERVAL / RECENCY_FACTOR
+    interval = min(WATCH_MAX_INTERVAL, max(WATCH_MIN_INTERVAL, RECENCY_FACTOR * since_upload))
+    state.update_channel_watch(
+        channel_id, etag=etag, last_modified=last_modified, seen_ids=seen, poll_interval=interval,
+        polled_at=now, next_poll_at=now + interval, last_upload_at=last_upload_at
+    )
+    return list(reversed(new_ids))
+
+
+def is_finished(video_state):
+    """Checks whether an upload's transcript was saved or can never be fetched."""
+    return bool(video_state) and video_state['transcript_status'] in (TRANSCRIPT_FETCHED, TRANSCRIPT_SKIPPED)
+
+
+def handle_uploads(channel_id, video_ids, channel_names, rate_limiter=None, workers=TRANSCRIPT_WORKERS):
+    """Fetches transcripts for a channel's new and pending uploads.
+
+    The details of every upload due for an attempt are fetched in one batch, and their
+    transcripts from a pool of worker threads, like generate_transcripts does for the playlist.
+    Uploads whose transcript isn't available yet (captions often appear some time after
+    publishing) stay pending and are retried once their state index backoff has elapsed;
+    uploads whose transcript can never be fetched (e.g. captions disabled) are dropped.
+
+    Args:
+        channel_id (str): The unique identifier of the YouTube channel.
+        video_ids (list): The IDs of new uploads.
+        channel_names (dict): Channel ID to name mapping from get_channel_names, so no
+            channel is looked up per video.
+        rate_limiter (TokenBucket, optional): Limiter acquired before each transcript request.
+        workers (int, optional): Concurrent transcript fetches. Defaults to TRANSCRIPT_WORKERS.
+
+    Returns:
+        int: The number of transcripts saved.
+    """
+    row = state.get_channel_watch(channel_id) or {}
+    candidates = list(dict.fromkeys((row.get('pending_ids') or []) + video_ids))
+    known = state.get_many(candidates)
+    candidates = [video_id for video_id in candidates if not is_finished(known.get(video_id))]
+    due = [video_id for video_id in candidates if retry_due(known.get(video_id))]
+    if due:
+        try:
+            videos_details = get_videos_details(due)
+        except Exception as e:
+            print(f"🚨 Error fetching details of {len(due)} uploads from channel {channel_id}: {e}")
+            videos_details, due = {}, []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for video_id in due:
+                if video_id not in videos_details:
+                    print(f"\nSkipping video {video_id}: no details returned (private or deleted?)\n")
+                    state.record_failure(video_id, 'metadata', 'no details returned')
+                    continue
+                state.record_metadata(video_id, videos_details[video_id].get('etag'))
+                # Shaped like a playlist item, so it goes through the normal transcript path
+                executor.submit(
+                    save_playlist_item,
+                    {'id': video_id, 'contentDetails': {'videoId': video_id}},
+                    video_details=videos_details[video_id],
+                    channel_names=channel_names,
+                    rate_limiter=rate_limiter
+                )
+    known = state.get_many(candidates)
+    saved = sum(1 for video_id in due if (known.get(video_id) or {}).get('transcript_status') == TRANSCRIPT_FETCHED)
+    pending = [video_id for video_id in candidates if not is_finished(known.get(video_id))]
+    state.update_channel_watch(channel_id, pending_ids=pending[-PENDING_IDS_LIMIT:])
+    return saved
+
+
+def watch_channels(channel_ids, once=False, process=True):
+    """Watches channels for new uploads and turns them into transcripts and notes.
+
+    Each round polls the channels that are due (feeds concurrently, uploads playlists one at a
+    time), fetches transcripts for new uploads, and summarizes them if any were saved. Between
+    rounds it sleeps until the next channel is due.
+
+    Args:
+        channel_ids (list): The unique identifiers of the YouTube channels to watch.
+        once (bool, optional): Poll every channel once and return. Defaults to False.
+        process (bool, optional): Summarize new transcripts after each round. Defaults to True.
+
+    Returns:
+        None
+    """
+    print(f"\n👀 Watching {len(channel_ids)} channels via {WATCH_SOURCE}\n")
+    workers = max(1, WATCH_CONCURRENCY) if WATCH_SOURCE == 'feed' else 1
+    rate_limiter = TokenBucket(TRANSCRIPT_RATE_LIMIT)
+    # Looked up once per channel, the first time it has uploads to handle
+    channel_names = {}
+    try:
+        while True:
+            now = time.time()
+            rows = {channel_id: state.get_channel_watch(channel_id) for channel_id in channel_ids}
+            due = [channel_id for channel_id, row in rows.items() if once or not row or (row['next_poll_at'] or 0) <= now]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                new_uploads = dict(zip(due, executor.map(poll_channel, due)))
+
+            active = [channel_id for channel_id in channel_ids
+                      if new_uploads.get(channel_id) or (rows[channel_id] and rows[channel_id]['pending_ids'])]
+            unnamed = [channel_id for channel_id in active if channel_id not in channel_names]
+            if unnamed:
+                try:
+                    channel_names.update(get_channel_names(unnamed))
+                except Exception as e:
+                    print(f"🚨 Error fetching the names of {len(unnamed)} channels: {e}")
+            saved = 0
+            for channel_id in active:
+                saved += handle_uploads(channel_id, new_uploads.get(channel_id, []), channel_names, rate_limiter)
+            if saved and process:
+                from process_transcript import process_all_transcripts
+                process_all_transcripts()
+
+            if once:
+                break
+            next_poll_at = min((state.get_channel_watch(channel_id) or {}).get('next_poll_at') or now
+                               for channel_id in channel_ids)
+            wait = max(1.0, next_poll_at - time.time())
+            print(f"💤 Polled {len(due)} channels, saved {saved} transcripts; next poll in {wait / 60:.1f} min")
+            time.sleep(wait)
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching\n")
@@ -0,0 +1,180 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+# A claim on a transcript file expires this long after its last heartbeat, so the files of a
+# crashed worker are picked up by the others
+WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", 600))
+WORK_HEARTBEAT_SECONDS = float(os.getenv("WORK_HEARTBEAT_SECONDS", WORK_LEASE_SECONDS / 5))
+# Shown to other workers that find this worker's leases, e.g. when reclaiming them
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# Lease files live in this subdirectory of the directory whose files are claimed
+LEASE_DIR_NAME = ".leases"
+LEASE_SUFFIX = ".lease"
+
+
+class WorkLeases:
+    """Claims on the files of a shared directory, so several workers can drain it together.
+
+    A worker claims a file by creating "<name>.lease" in the directory's .leases folder with
+    O_EXCL, which only one worker can do, and writing its token into it. While the worker
+    runs, a heartbeat thread touches its lease files every heartbeat_seconds. A lease that
+    hasn't been touched for lease_seconds belongs to a crashed or stuck worker: another
+    worker renames it out of the way (an atomic step only one worker can take) and claims
+    the file itself. Both steps work on a local disk and on network shares with atomic
+    create and rename, so the workers may be processes on one machine or on several.
+
+    Use it as a context manager, which starts the heartbeat and releases every lease still
+    held on exit.
+
+    Args:
+        directory (str): The directory whose files are claimed.
+        lease_seconds (float): How long a lease lasts without a heartbeat.
+        heartbeat_seconds (float): How often held leases are renewed.
+        worker_id (str): This worker's name, written into its leases.
+    """
+
+    def __init__(self, directory, lease_seconds=WORK_LEASE_SECONDS, heartbeat_seconds=WORK_HEARTBEAT_SECONDS,
+                 worker_id=WORKER_ID):
+        self.directory = os.path.join(directory, LEASE_DIR_NAME)
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        # Unique per instance, so two runs in one process don't share leases
+        self.token = f"{worker_id} {uuid.uuid4().hex[:12]}"
+        self.held = {}
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = None
+        self.claimed = 0
+        self.contended = 0
+        self.reclaimed = 0
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        for filename in list(self.held):
+            self.release(filename)
+        if self.contended or self.reclaimed:
+            print(f"🔒 Leases: {self.claimed} claimed, {self.contended} held by other workers, {self.reclaimed} reclaimed")
+        return False
+
+    def _path(self, filename):
+        return os.path.join(self.directory, os.path.splitext(filename)[0] + LEASE_SUFFIX)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def claim(self, filename):
+        """Claims a file for this worker, taking over an expired lease if there is one.
+
+        Args:
+            filename (str): The file's name in the directory.
+
+        Returns:
+            bool: True if this worker now holds the file (or already did), False if another
+                worker does.
+        """
+        if self.holds(filename):
+            return True
+        path = self._path(filename)
+        for _ in range(3):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if self._take_over_expired(path, filename):
+                    continue
+                with self.lock:
+                    self.contended += 1
+                return False
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.token)
+            with self.lock:
+                self.held[filename] = path
+                self.claimed += 1
+            return True
+        with self.lock:
+            self.contended += 1
+        return False
+
+    def _take_over_expired(self, path, filename):
+        """Moves an expired lease out of the way. Returns True if the file may be claimed now."""
+        try:
+            age = time.time() - os.stat(path).st_mtime
+        except FileNotFoundError:
+            # Released in the meantime
+            return True
+        if age < self.lease_seconds:
+            return False
+        stale_path = f"{path}.{uuid.uuid4().hex[:12]}.stale"
+        try:
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            # Another worker moved it first; whoever creates the new lease first wins
+            return True
+        try:
+            if time.time() - os.stat(stale_path).st_mtime < self.lease_seconds:
+                # Renewed or claimed afresh since we looked: put it back
+                try:
+                    os.link(stale_path, path)
+                except FileExistsError:
+                    pass
+                return False
+            holder = (self._read(stale_path) or '?').split(' ')[0]
+        finally:
+            os.remove(stale_path)
+        print(f"♻️ Reclaiming {filename} from {holder}, its lease expired {age:.0f}s ago")
+        with self.lock:
+            self.reclaimed += 1
+        return True
+
+    def holds(self, filename):
+        """Checks that this worker still holds a file's lease (it may have expired and been taken over)."""
+        with self.lock:
+            path = self.held.get(filename)
+        return path is not None and self._read(path) == self.token
+
+    def release(self, filename):
+        """Gives up the lease on a file, if this worker holds it.
+
+        Args:
+            filename (str): The file's name in the directory.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            path = self.held.pop(filename, None)
+        if path is not None and self._read(path) == self.token:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _heartbeat(self):
+        while not self.stop.wait(self.heartbeat_seconds):
+            with self.lock:
+                held = list(self.held.items())
+            for filename, path in held:
+                if self._read(path) != self.token:
+                    print(f"⚠️ Lost the lease on {filename} to another worker")
+                    with self.lock:
+                        self.held.pop(filename, None)
+                    continue
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass